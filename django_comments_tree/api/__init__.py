@@ -1,6 +1,9 @@
 from django_comments_tree.api.views import (
-    CommentCreate, CommentList, CommentCount, ToggleFeedbackFlag,
-    CreateReportFlag, RemoveReportFlag)
+    CommentCreate, CommentList, CommentChanges, CommentEvents, CommentCount,
+    CommentCounts, ToggleFeedbackFlag, CreateReportFlag, RemoveReportFlag,
+    BulkModeration, CommentExport, CommentReplies, CommentTree)
 
-__all__ = (CommentCreate, CommentList, CommentCount, ToggleFeedbackFlag,
-           CreateReportFlag, RemoveReportFlag)
+__all__ = (CommentCreate, CommentList, CommentChanges, CommentEvents,
+           CommentCount, CommentCounts, ToggleFeedbackFlag, CreateReportFlag,
+           RemoveReportFlag, BulkModeration, CommentExport, CommentReplies,
+           CommentTree)
@@ -32,6 +32,7 @@ def commentbox_props(obj, user, request=None):
             flag_url: <api-url-to-suggest-comment-removal>,
             list_url: <api-url-to-list-comments>,
             count_url: <api-url-to-count-comments>,
+            changes_url: <api-url-to-list-changes-since-a-watermark>,
             send_url: <api-irl-to-send-a-comment>,
             form: {
                 content_type: <value>,
@@ -51,13 +52,10 @@ def commentbox_props(obj, user, request=None):
 
     form = CommentSecurityForm(obj)
     ctype = ContentType.objects.get_for_model(obj)
-    queryset = TreeComment.objects.filter(content_type=ctype,
-                                          object_id=obj.pk,
-                                          site__pk=settings.SITE_ID,
-                                          is_public=True)
     ctype_slug = "%s-%s" % (ctype.app_label, ctype.model)
     d = {
-        "comment_count": queryset.count(),
+        "comment_count": TreeComment.objects.count_for_object(
+            obj.pk, ctype, site=settings.SITE_ID),
         "allow_comments": True,
         "current_user": "0:Anonymous",
         "request_name": False,
@@ -78,6 +76,9 @@ def commentbox_props(obj, user, request=None):
         "count_url": _reverse('comments-tree-api-count',
                               kwargs={'content_type': ctype_slug,
                                       'object_pk': obj.id}),
+        "changes_url": _reverse('comments-tree-api-changes',
+                                kwargs={'content_type': ctype_slug,
+                                        'object_pk': obj.id}),
         "send_url": _reverse("comments-tree-api-create"),
         "form": {
             "content_type": form['content_type'].value(),
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CommentCursorPagination(BasePagination):
+    """
+    Keyset pagination for comment lists.
+
+    Comments are ordered either by date, on (submit_date, id), or in thread
+    order, on the treebeard path. Every page is read with an indexed range
+    query, so the cost of a page does not depend on how deep the client is.
+
+    The position of the next page is kept in an opaque signed token, passed
+    back in the ``cursor`` query parameter. Pagination is used when the
+    request gives a ``cursor`` or a ``page_size``, or when the app model
+    options of the commented object define a ``page_size``. The largest page
+    a client can ask for is the ``max_page_size`` option.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    orderings = {
+        'date': ('submit_date', 'id'),
+        'thread': ('path',),
+    }
+    default_ordering = 'thread'
+    max_page_size = 100
+    salt = 'django_comments_tree.api.pagination'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        options = {}
+        if view is not None and hasattr(view, 'get_app_model_options'):
+            options = view.get_app_model_options()
+        max_page_size = options.get('max_page_size', self.max_page_size)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            ordering, position, page_size = cursor
+        else:
+            ordering = request.query_params.get(self.ordering_query_param,
+                                                self.default_ordering)
+            if ordering not in self.orderings:
+                ordering = self.default_ordering
+            position = None
+            page_size = self.get_page_size(request, options)
+        if page_size is None:
+            return None
+
+        self.request = request
+        self.ordering = ordering
+        self.page_size = max(1, min(page_size, max_page_size))
+
+        queryset = queryset.order_by(*self.orderings[ordering])
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request, options):
+        try:
+            return int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return options.get('page_size')
+
+    def after(self, ordering, position):
+        """ Filter for the comments that come after the given position """
+        if ordering == 'date':
+            submit_date, pk = position
+            submit_date = parse_datetime(submit_date)
+            later = Q(submit_date__gt=submit_date)
+            return later | Q(submit_date=submit_date, id__gt=pk)
+        return Q(path__gt=position)
+
+    def position(self, comment):
+        if self.ordering == 'date':
+            return (comment.submit_date.isoformat(), comment.pk)
+        return comment.path
+
+    def encode_cursor(self, comment):
+        return signing.dumps(
+            {'o': self.ordering, 'p': self.position(comment), 's': self.page_size},
+            salt=self.salt, compress=True)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            data = signing.loads(token, salt=self.salt)
+            if data['o'] not in self.orderings:
+                raise ValueError(data['o'])
+            return data['o'], data['p'], int(data['s'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
@@ -56,8 +56,9 @@ class APICommentSerializer(SerializerSaveMixin, serializers.ModelSerializer):
                   'comment', 'comment_markup_type',
                   'submit_date', 'updated_on',
                   'ip_address', 'is_public', 'is_removed',
-                  'followup',
+                  'followup', 'likes', 'dislikes', 'reports',
                   ]
+        read_only_fields = ['likes', 'dislikes', 'reports']
 
     def __init__(self, *args, **kwargs):
         if kwargs.get('context'):
@@ -227,8 +228,8 @@ class ReadCommentSerializer(serializers.ModelSerializer):
     user_moderator = serializers.SerializerMethodField()
     user_avatar = serializers.SerializerMethodField()
     submit_date = serializers.SerializerMethodField()
-    parent_id = serializers.IntegerField(default=0, read_only=True)
-    level = serializers.IntegerField(read_only=True)
+    parent_id = serializers.SerializerMethodField()
+    level = serializers.IntegerField(source='thread_level', read_only=True)
     is_removed = serializers.BooleanField(read_only=True)
     comment = serializers.SerializerMethodField()
     allow_reply = serializers.SerializerMethodField()
@@ -250,11 +251,15 @@ class ReadCommentSerializer(serializers.ModelSerializer):
         return formats.date_format(obj.submit_date, 'DATETIME_FORMAT',
                                    use_l10n=True)
 
+    def get_parent_id(self, obj):
+        """ Parent ids are given in the context, 0 for top level comments """
+        return self.context.get('parent_ids', {}).get(obj.pk, 0)
+
     def get_comment(self, obj):
         if obj.is_removed:
             return _("This comment has been removed.")
         else:
-            return obj.comment
+            return obj.comment.rendered
 
     def get_user_moderator(self, obj):
         try:
@@ -265,32 +270,41 @@ class ReadCommentSerializer(serializers.ModelSerializer):
         except Exception:
             return None
 
+    def users_flagging(self, obj, flag):
+        """
+        Users who flagged the comment, read from the 'flags' context entry
+        when the view prefetched them with CommentManager.flags_for_comments.
+        """
+        if 'flags' in self.context:
+            return self.context['flags'].get(obj.pk, {}).get(flag, [])
+        return obj.users_flagging(flag)
+
     def get_flags(self, obj):
         flags = {
-            'like': {'active': False, 'users': None},
-            'dislike': {'active': False, 'users': None},
+            'like': {'active': False, 'users': None, 'count': obj.likes},
+            'dislike': {'active': False, 'users': None, 'count': obj.dislikes},
             'removal': {'active': False, 'count': None},
         }
         users_likedit, users_dislikedit = None, None
 
-        if has_app_model_option(obj)['allow_flagging']:
-            users_flagging = obj.users_flagging(TreeCommentFlag.SUGGEST_REMOVAL)
+        opt = has_app_model_option(obj)
+        if opt['allow_flagging']:
+            users_flagging = self.users_flagging(obj, TreeCommentFlag.SUGGEST_REMOVAL)
             if self.request.user in users_flagging:
                 flags['removal']['active'] = True
             if self.request.user.has_perm("django_comments.can_moderate"):
-                flags['removal']['count'] = len(users_flagging)
+                flags['removal']['count'] = obj.reports
 
-        opt = has_app_model_option(obj)
         if opt['allow_feedback'] or opt['show_feedback']:
-            users_likedit = obj.users_flagging(LIKEDIT_FLAG)
-            users_dislikedit = obj.users_flagging(DISLIKEDIT_FLAG)
+            users_likedit = self.users_flagging(obj, LIKEDIT_FLAG)
+            users_dislikedit = self.users_flagging(obj, DISLIKEDIT_FLAG)
 
-        if has_app_model_option(obj)['allow_feedback']:
+        if opt['allow_feedback']:
             if self.request.user in users_likedit:
                 flags['like']['active'] = True
             elif self.request.user in users_dislikedit:
                 flags['dislike']['active'] = True
-        if has_app_model_option(obj)['show_feedback']:
+        if opt['show_feedback']:
             flags['like']['users'] = [
                 "%d:%s" % (user.id, settings.COMMENTS_TREE_API_USER_REPR(user))
                 for user in users_likedit]
@@ -342,3 +356,11 @@ class FlagSerializer(serializers.ModelSerializer):
             )
         data['flag'] = self.flag_choices[data['flag']]
         return data
+
+
+class BulkModerationSerializer(serializers.Serializer):
+    ACTIONS = ('flag', 'approve', 'remove')
+
+    action = serializers.ChoiceField(choices=ACTIONS)
+    comments = serializers.ListField(child=serializers.IntegerField(),
+                                     allow_empty=False)
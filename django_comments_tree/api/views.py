@@ -1,22 +1,35 @@
+from collections import OrderedDict
+from datetime import timedelta
+
 import six
 
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from django_comments_tree.views.moderation import perform_flag
+from django_comments_tree.views.moderation import (
+    perform_flag, perform_bulk_flag, perform_bulk_approve, perform_bulk_delete)
 from rest_framework import generics, mixins, permissions, status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 
+from django_comments_tree import events, export, instrumentation
 from django_comments_tree.views import comments as views
 from django_comments_tree.api import serializers
+from django_comments_tree.api.pagination import CommentCursorPagination
 from django_comments_tree.conf import settings
 from django_comments_tree.models import TreeComment, TreeCommentFlag
 from django_comments_tree.permissions import IsOwner, IsModerator
+from django_comments_tree.utils import get_app_model_options
 
 
 class CommentCreate(generics.CreateAPIView):
     """Create a comment."""
     serializer_class = serializers.WriteCommentSerializer
 
+    @instrumentation.instrumented('api_create')
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
@@ -34,42 +47,337 @@ class CommentCreate(generics.CreateAPIView):
 
 
 class CommentList(generics.ListAPIView):
-    """List all comments for a given ContentType and object ID."""
+    """
+    List all comments for a given ContentType and object ID.
+
+    See CommentCursorPagination for how to page through the comments.
+    """
     serializer_class = serializers.ReadCommentSerializer
+    pagination_class = CommentCursorPagination
 
-    def get_queryset(self):
+    def get_content_type(self):
         content_type_arg = self.kwargs.get('content_type', None)
-        object_id_arg = self.kwargs.get('object_id', None)
         app_label, model = content_type_arg.split("-")
+        try:
+            return ContentType.objects.get_by_natural_key(app_label, model)
+        except ContentType.DoesNotExist:
+            return None
+
+    def get_app_model_options(self):
+        content_type = self.get_content_type()
+        if content_type is None:
+            return {}
+        return get_app_model_options(content_type)
+
+    def get_object_comments(self):
+        """ All the comments posted to the object, public or not """
+        content_type = self.get_content_type()
+        object_pk_arg = self.kwargs.get('object_pk', None)
+        if content_type is None or not object_pk_arg.isdigit():
+            return TreeComment.objects.none()
+        qs = TreeComment.objects.for_object(object_pk_arg, content_type,
+                                            settings.SITE_ID)
+        return qs.select_related('user', 'assoc__content_type')
+
+    def get_queryset(self):
+        return self.get_object_comments().filter(is_public=True)
+
+    @instrumentation.instrumented('api_list')
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        comments = list(queryset) if page is None else page
+        instrumentation.record_size(len(comments))
+        serializer = self.get_comments_serializer(comments)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    def get_comments_serializer(self, comments):
+        # Parents and flags of the listed comments take one query each.
+        self.parent_ids = TreeComment.parent_ids(comments)
+        self.flags = None
+        options = self.get_app_model_options()
+        if any(options.get(name) for name in ('allow_flagging',
+                                              'allow_feedback',
+                                              'show_feedback')):
+            self.flags = TreeComment.objects.flags_for_comments(comments)
+        return self.get_serializer(comments, many=True)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['parent_ids'] = getattr(self, 'parent_ids', {})
+        if getattr(self, 'flags', None) is not None:
+            context['flags'] = self.flags
+        return context
+
+
+class CommentReplies(generics.GenericAPIView):
+    """
+    List a slice of the replies to a comment, as a tree: ``limit`` replies
+    after the one with id ``after``, each with its first ``replies``
+    replies, and so on. Every comment carries the number of its replies
+    left out, to load them with another call.
+    """
+    serializer_class = serializers.ReadCommentSerializer
+    default_limit = 20
+    max_limit = 100
+
+    def get_parent(self):
+        parent = TreeComment.objects.filter(pk=self.kwargs['pk']).first()
+        if parent is None:
+            raise NotFound()
+        # The replies to a hidden comment, or to the reply of one, are
+        # hidden as well.
+        steplen = TreeComment.steplen
+        paths = [parent.path[:steplen * depth]
+                 for depth in range(2, parent.depth + 1)]
+        if paths and TreeComment.objects.filter(
+                Q(is_public=False) | Q(is_removed=True),
+                path__in=paths).exists():
+            raise NotFound()
+        return parent
+
+    def get_limit(self, name, default):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: "A number is required."})
+        return max(0, min(value, self.max_limit))
+
+    def get_after(self, parent):
+        after = self.request.query_params.get('after')
+        if not after:
+            return None
+        path = None
+        if after.isdigit():
+            path = TreeComment.objects.filter(
+                pk=after, path__startswith=parent.path,
+                depth=parent.depth + 1).values_list('path', flat=True).first()
+        if path is None:
+            raise ValidationError({'after': "Not a reply to the comment."})
+        return path
+
+    def get(self, request, *args, **kwargs):
+        parent = self.get_parent()
+        tree, remaining = TreeComment.tree_slice(
+            parent, self.get_limit('limit', self.default_limit),
+            self.get_limit('replies', 0), after=self.get_after(parent))
+
+        parent_ids = {}
+        comments = []
+        pending = [(entry, parent) for entry in tree]
+        while pending:
+            entry, entry_parent = pending.pop()
+            comment = entry['comment']
+            parent_ids[comment.pk] = (entry_parent.pk
+                                      if entry_parent.depth > 1 else 0)
+            comments.append(comment)
+            pending.extend((child, comment) for child in entry['children'])
+        self.parent_ids = parent_ids
+        self.flags = None
+        if parent.assoc_id is not None:
+            options = get_app_model_options(parent.assoc.content_type)
+            if any(options.get(name) for name in ('allow_flagging',
+                                                  'allow_feedback',
+                                                  'show_feedback')):
+                self.flags = TreeComment.objects.flags_for_comments(comments)
+        serializer = self.get_serializer(comments, many=True)
+        data = {item['id']: item for item in serializer.data}
+
+        def nest(entries):
+            return [dict(data[entry['comment'].pk],
+                         children=nest(entry['children']),
+                         remaining=entry['remaining'])
+                    for entry in entries]
+
+        return Response(OrderedDict([
+            ('comments', nest(tree)),
+            ('remaining', remaining),
+        ]))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['parent_ids'] = getattr(self, 'parent_ids', {})
+        if getattr(self, 'flags', None) is not None:
+            context['flags'] = self.flags
+        return context
+
+
+class CommentTree(CommentReplies):
+    """
+    List the first top level comments posted to a given ContentType and
+    object ID, as a tree, the way CommentReplies lists the replies to a
+    comment.
+    """
+
+    def get_parent(self):
+        app_label, model = self.kwargs['content_type'].split("-")
+        object_pk = self.kwargs['object_pk']
         try:
             content_type = ContentType.objects.get_by_natural_key(app_label,
                                                                   model)
         except ContentType.DoesNotExist:
-            qs = TreeComment.objects.none()
-        else:
-            qs = TreeComment.objects.filter(content_type=content_type,
-                                            object_id=object_id_arg,
-                                            site__pk=settings.SITE_ID,
-                                            is_public=True)
-        return qs
+            raise NotFound()
+        if not object_pk.isdigit():
+            raise NotFound()
+        root = TreeComment.objects.filter(
+            depth=1, assoc__content_type=content_type,
+            assoc__object_id=object_pk, assoc__site_id=settings.SITE_ID).first()
+        if root is None:
+            raise NotFound()
+        return root
+
+
+class CommentChanges(CommentList):
+    """
+    List the changes to the comments of a given ContentType and object ID
+    since the ``since`` watermark (an ISO 8601 date/time).
+
+    The response contains the public comments created or updated after the
+    watermark, with their parent_id, the ids of the comments removed or
+    unpublished after the watermark, and the watermark for the next call,
+    the (updated_on, id) of the last change.
+
+    Comments changed at the watermark with a greater id than ``since_id``,
+    and those changed in the COMMENTS_TREE_CHANGES_OVERLAP seconds before
+    it, are returned as well, as they may have been committed after the
+    previous call. Clients replace the comments they already have by id.
+    """
+    pagination_class = None
+
+    def get_since(self):
+        since = self.request.query_params.get('since', '')
+        try:
+            value = parse_datetime(since)
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValidationError(
+                {'since': "An ISO 8601 date/time is required."})
+        if settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    def get_since_id(self):
+        since_id = self.request.query_params.get('since_id', '')
+        if not since_id:
+            return 0
+        if not since_id.isdigit():
+            raise ValidationError({'since_id': "A number is required."})
+        return int(since_id)
+
+    def list(self, request, *args, **kwargs):
+        since, since_id = self.get_since(), self.get_since_id()
+        overlap = timedelta(seconds=settings.COMMENTS_TREE_CHANGES_OVERLAP)
+        recent = Q(updated_on__gt=since - overlap)
+        changed = self.get_object_comments().filter(
+            recent | Q(updated_on=since, id__gt=since_id))
+        changed = list(changed.order_by('updated_on', 'id'))
+
+        public = [c for c in changed if c.is_public and not c.is_removed]
+        removed = [c.pk for c in changed if not c.is_public or c.is_removed]
+        watermark, watermark_id = since, since_id
+        if changed and (changed[-1].updated_on, changed[-1].pk) > (
+                since, since_id):
+            watermark, watermark_id = changed[-1].updated_on, changed[-1].pk
+        serializer = self.get_comments_serializer(public)
+        return Response(OrderedDict([
+            ('watermark', watermark.isoformat()),
+            ('watermark_id', watermark_id),
+            ('comments', serializer.data),
+            ('removed', removed),
+        ]))
+
+
+class CommentEvents(generics.GenericAPIView):
+    """
+    Long-poll the events published in the thread of a given ContentType and
+    object ID, for clients that cannot use server-sent events.
+
+    Returns the events published after the ``after`` event id, waiting up to
+    ``timeout`` seconds for one, and the id to pass in the next call. The
+    request holds a worker while it waits, so keep ``max_timeout`` short.
+    """
+    max_timeout = 25
+
+    def get_timeout(self):
+        try:
+            timeout = float(self.request.query_params.get('timeout', ''))
+        except ValueError:
+            timeout = self.max_timeout
+        return max(0, min(timeout, self.max_timeout))
+
+    def get(self, request, *args, **kwargs):
+        broker = events.get_broker()
+        channel = None
+        if broker is not None:
+            channel = events.channel_for_object(self.kwargs['content_type'],
+                                                self.kwargs['object_pk'])
+        if channel is None:
+            raise NotFound()
+        try:
+            after = int(request.query_params['after'])
+        except (KeyError, ValueError):
+            after = broker.last_id(channel)
+        published = broker.wait(channel, after, self.get_timeout())
+        return Response(OrderedDict([
+            ('events', published),
+            ('last_id', published[-1]['id'] if published else after),
+        ]))
 
 
 class CommentCount(generics.GenericAPIView):
     """Get number of comments posted to a given ContentType and object ID."""
     serializer_class = serializers.ReadCommentSerializer
 
-    def get_queryset(self):
+    def get_count(self):
         content_type_arg = self.kwargs.get('content_type', None)
-        object_id_arg = self.kwargs.get('object_id', None)
+        object_pk_arg = self.kwargs.get('object_pk', None)
         app_label, model = content_type_arg.split("-")
-        content_type = ContentType.objects.get_by_natural_key(app_label, model)
-        qs = TreeComment.objects.filter(content_type=content_type,
-                                        object_id=object_id_arg,
-                                        is_public=True)
-        return qs
+        try:
+            content_type = ContentType.objects.get_by_natural_key(app_label,
+                                                                  model)
+            return TreeComment.objects.count_for_object(object_pk_arg,
+                                                        content_type,
+                                                        site=settings.SITE_ID)
+        except (ContentType.DoesNotExist, ValueError):
+            return 0
 
     def get(self, request, *args, **kwargs):
-        return Response({'count': self.get_queryset().count()})
+        return Response({'count': self.get_count()})
+
+
+class CommentCounts(generics.GenericAPIView):
+    """
+    Get the number of comments posted to many objects of a given
+    ContentType, whose IDs are given as a comma separated ``ids`` list.
+    """
+    serializer_class = serializers.ReadCommentSerializer
+    max_ids = 100
+
+    def get_content_type(self):
+        app_label, model = self.kwargs['content_type'].split("-")
+        try:
+            return ContentType.objects.get_by_natural_key(app_label, model)
+        except ContentType.DoesNotExist:
+            raise NotFound()
+
+    def get_ids(self):
+        ids = [value for value in
+               self.request.query_params.get('ids', '').split(',') if value]
+        if not ids or not all(value.isdigit() for value in ids):
+            raise ValidationError({'ids': "A list of object IDs is required."})
+        if len(ids) > self.max_ids:
+            raise ValidationError(
+                {'ids': "At most %d object IDs are allowed." % self.max_ids})
+        return ids
+
+    def get(self, request, *args, **kwargs):
+        counts = TreeComment.objects.count_for_objects(
+            self.get_ids(), self.get_content_type(), site=settings.SITE_ID)
+        return Response({'counts': {str(object_id): count for object_id, count
+                                    in sorted(counts.items())}})
 
 
 class ToggleFeedbackFlag(generics.CreateAPIView, mixins.DestroyModelMixin):
@@ -106,3 +414,48 @@ class CreateReportFlag(generics.CreateAPIView):
 class RemoveReportFlag(generics.DestroyAPIView):
     queryset = TreeCommentFlag.objects.all()
     permission_classes = (permissions.IsAuthenticated, IsOwner, IsModerator,)
+
+
+class BulkModeration(generics.GenericAPIView):
+    """
+    Flag, approve or remove a list of comments at once. Only available to
+    moderators.
+    """
+    serializer_class = serializers.BulkModerationSerializer
+    permission_classes = (permissions.IsAuthenticated, IsModerator,)
+    actions = {'flag': perform_bulk_flag,
+               'approve': perform_bulk_approve,
+               'remove': perform_bulk_delete}
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action = serializer.validated_data['action']
+        queryset = TreeComment.objects.filter(
+            pk__in=serializer.validated_data['comments'])
+        count = self.actions[action](request, queryset)
+        return Response({'action': action, 'count': count})
+
+
+class CommentExport(generics.GenericAPIView):
+    """
+    Stream the comments, in tree order, as newline-delimited JSON. Only
+    available to staff users.
+
+    Accepts the ``site``, ``content_type`` (app_label-model), ``object_pk``,
+    ``since`` and ``until`` query parameters.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            filters = export.parse_filters(
+                params.get('site'), params.get('content_type'),
+                params.get('object_pk'), params.get('since'),
+                params.get('until'))
+        except ValueError as exc:
+            raise ValidationError(str(exc))
+        records = export.export_records(export.export_queryset(**filters))
+        return StreamingHttpResponse(export.ndjson_lines(records),
+                                     content_type='application/x-ndjson')
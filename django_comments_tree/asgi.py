@@ -0,0 +1,115 @@
+"""
+ASGI application streaming comment events as server-sent events.
+
+Mount it under any prefix in the ASGI router of the project. The last two
+segments of the path are the same as in the web API URLs::
+
+    <prefix>/<app_label>-<model>/<object_pk>/
+
+Requires asgiref. Clients that cannot use server-sent events can long-poll
+the comments-tree-api-events view instead.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
+from django.core.exceptions import ImproperlyConfigured
+
+from django_comments_tree import events
+
+
+class CommentEventStream:
+    """
+    Send the events of the thread of an object as they are published.
+
+    Clients resume a stream with the Last-Event-ID header, or the `after`
+    query parameter, and receive the events they missed that the broker
+    still keeps.
+    """
+    heartbeat = 15  # Seconds between keep-alive comments.
+
+    def __init__(self, broker=None):
+        if sync_to_async is None:
+            raise ImproperlyConfigured(
+                "CommentEventStream requires the asgiref package.")
+        self.broker = broker
+
+    def get_broker(self):
+        return self.broker or events.get_broker()
+
+    def get_channel(self, scope):
+        segments = [s for s in scope['path'].split('/') if s]
+        if len(segments) < 2:
+            return None
+        return events.channel_for_object(*segments[-2:])
+
+    def get_after(self, scope):
+        headers = dict(scope.get('headers', []))
+        value = headers.get(b'last-event-id', b'').decode('latin-1')
+        if not value:
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            value = query.get('after', [''])[0]
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError("CommentEventStream only handles HTTP requests.")
+        broker = self.get_broker()
+        channel = None
+        if broker is not None:
+            channel = await sync_to_async(self.get_channel)(scope)
+        if channel is None:
+            await send({'type': 'http.response.start', 'status': 404,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Not Found'})
+            return
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'),
+                        (b'cache-control', b'no-cache')],
+        })
+        await self.stream(broker.listen(channel, self.get_after(scope)),
+                          receive, send)
+
+    async def stream(self, listener, receive, send):
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+        next_event = asyncio.ensure_future(listener.__anext__())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {disconnect, next_event}, timeout=self.heartbeat,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    break
+                if next_event in done:
+                    await send({'type': 'http.response.body',
+                                'body': self.format(next_event.result()),
+                                'more_body': True})
+                    next_event = asyncio.ensure_future(listener.__anext__())
+                else:
+                    await send({'type': 'http.response.body',
+                                'body': b': keep-alive\n\n',
+                                'more_body': True})
+        finally:
+            for task in (disconnect, next_event):
+                task.cancel()
+            await asyncio.gather(disconnect, next_event, return_exceptions=True)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    def format(self, event):
+        return ("id: %d\nevent: %s\ndata: %s\n\n" % (
+            event['id'], event['type'], json.dumps(event))).encode('utf-8')
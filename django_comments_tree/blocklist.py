@@ -0,0 +1,81 @@
+"""
+In-memory matcher of the domains in the BlackListedDomain table.
+
+Every process loads the table once, and loads it again when it changes.
+Changes made in other processes are noticed through a version stored in the
+thread cache (COMMENTS_TREE_CACHE_BACKEND). Without it, or if the version is
+evicted, the table is loaded again every COMMENTS_TREE_BLOCKLIST_MAX_AGE
+seconds at most.
+"""
+import threading
+import time
+import uuid
+
+from django_comments_tree import cache
+from django_comments_tree.conf import settings
+
+VERSION_KEY = '%s:blocklist:version' % cache.KEY_PREFIX
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def normalize(domain):
+    """ Return the domain lowercased, without surrounding dots or spaces """
+    return domain.strip().strip('.').lower()
+
+
+class DomainBlocklist:
+    """
+    Set of blocked domains. A domain is blocked when it, or any domain it is
+    a subdomain of, is in the set.
+    """
+
+    def __init__(self, domains):
+        self.domains = frozenset(d for d in map(normalize, domains) if d)
+
+    def __len__(self):
+        return len(self.domains)
+
+    def matches(self, domain):
+        domain = normalize(domain)
+        while domain:
+            if domain in self.domains:
+                return True
+            domain = domain.partition('.')[2]
+        return False
+
+
+def _shared_version():
+    shared = cache.get_cache()
+    return shared.get(VERSION_KEY) if shared is not None else None
+
+
+def get_blocklist():
+    """ Return the DomainBlocklist, loading the table when it is stale """
+    global _state
+    version = _shared_version()
+    now = time.monotonic()
+    with _state_lock:
+        state = _state
+    max_age = settings.COMMENTS_TREE_BLOCKLIST_MAX_AGE
+    if state is not None and state[0] == version and now - state[1] < max_age:
+        return state[2]
+
+    from django_comments_tree.models import BlackListedDomain
+
+    domains = BlackListedDomain.objects.values_list('domain', flat=True)
+    blocklist = DomainBlocklist(domains.iterator())
+    with _state_lock:
+        _state = (version, now, blocklist)
+    return blocklist
+
+
+def invalidate():
+    """ Make every process load the blocklist again on next use """
+    global _state
+    with _state_lock:
+        _state = None
+    shared = cache.get_cache()
+    if shared is not None:
+        shared.set(VERSION_KEY, uuid.uuid4().hex, None)
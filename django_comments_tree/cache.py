@@ -0,0 +1,158 @@
+"""
+Opt-in cache for comment threads.
+
+Entries are stored under keys that contain the id of the thread root and
+the current version of the thread. Invalidating a thread only replaces its
+version, so the stale entries are never read again and simply expire.
+
+The cache is enabled by pointing COMMENTS_TREE_CACHE_BACKEND to one of the
+aliases in Django's CACHES setting.
+
+The ids of the root and the association of commented objects are kept in a
+small per-process LRU as well, in front of the shared cache.
+"""
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from django_comments_tree import instrumentation
+from django_comments_tree.conf import settings
+
+KEY_PREFIX = 'comments_tree'
+
+_local_roots = OrderedDict()
+_local_roots_lock = threading.Lock()
+
+
+def get_cache():
+    """ Return the cache to use, or None when caching is disabled """
+    alias = settings.COMMENTS_TREE_CACHE_BACKEND
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def _root_key(content_type_id, object_id, site_id):
+    return f"{KEY_PREFIX}:root:{content_type_id}:{object_id}:{site_id}"
+
+
+def _version_key(root_id):
+    return f"{KEY_PREFIX}:thread:{root_id}:version"
+
+
+def _value_key(root_id, version, name, variant):
+    digest = hashlib.md5(repr(variant).encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:thread:{root_id}:{version}:{name}:{digest}"
+
+
+def get_thread_version(cache, root_id):
+    """ Return the current version of the thread, creating it if needed """
+    key = _version_key(root_id)
+    version = cache.get(key)
+    if version is None:
+        # add() keeps the version set by a concurrent request, if any.
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_root_ids(content_type_id, object_id, site_id, lookup):
+    """
+    Return the (root_id, assoc_id) pair of the comments posted to an object.
+
+    :param lookup: Function called on a miss, it must return the pair from
+    the database, or None when the object has no comments root yet.
+    """
+    key = _root_key(content_type_id, object_id, site_id)
+    with _local_roots_lock:
+        ids = _local_roots.get(key)
+        if ids is not None:
+            _local_roots.move_to_end(key)
+            instrumentation.cache_hit()
+            return ids
+
+    cache = get_cache()
+    ids = cache.get(key) if cache is not None else None
+    if ids is not None:
+        instrumentation.cache_hit()
+    else:
+        instrumentation.cache_miss()
+        ids = lookup()
+        if ids is None:
+            return None
+        ids = tuple(ids)
+        if cache is not None:
+            cache.set(key, ids, None)
+    _remember_root(key, ids)
+    return ids
+
+
+def set_root_ids(content_type_id, object_id, site_id, ids):
+    """ Store the (root_id, assoc_id) pair of a newly created root """
+    key = _root_key(content_type_id, object_id, site_id)
+    cache = get_cache()
+    if cache is not None:
+        cache.set(key, tuple(ids), None)
+    _remember_root(key, tuple(ids))
+
+
+def _remember_root(key, ids):
+    size = settings.COMMENTS_TREE_ROOT_CACHE_SIZE
+    if not size:
+        return
+    with _local_roots_lock:
+        _local_roots[key] = ids
+        _local_roots.move_to_end(key)
+        while len(_local_roots) > size:
+            _local_roots.popitem(last=False)
+
+
+def clear_local_roots():
+    """ Empty the per-process cache of root ids """
+    with _local_roots_lock:
+        _local_roots.clear()
+
+
+def get_or_set_thread_value(root_id, name, variant, build):
+    """
+    Return the cached value for the given thread, name and variant.
+
+    :param variant: Hashable description of everything the value depends
+    on besides the thread itself (options, language, permissions...).
+    :param build: Function that computes the value on a cache miss.
+    """
+    cache = get_cache()
+    if cache is None:
+        return build()
+
+    version = get_thread_version(cache, root_id)
+    key = _value_key(root_id, version, name, variant)
+    value = cache.get(key)
+    if value is not None:
+        instrumentation.cache_hit()
+    else:
+        instrumentation.cache_miss()
+        value = build()
+        cache.set(key, value, settings.COMMENTS_TREE_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate_thread(root_id):
+    """ Make every cached value of the thread stale """
+    cache = get_cache()
+    if cache is None or root_id is None:
+        return
+    cache.set(_version_key(root_id), uuid.uuid4().hex, None)
+
+
+def forget_root(content_type_id, object_id, site_id):
+    """ Drop the cached root ids of a deleted or stale association """
+    key = _root_key(content_type_id, object_id, site_id)
+    with _local_roots_lock:
+        _local_roots.pop(key, None)
+    cache = get_cache()
+    if cache is not None:
+        cache.delete(key)
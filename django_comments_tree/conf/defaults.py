@@ -1,7 +1,7 @@
 from __future__ import unicode_literals
 from django.conf import settings
-import markdown
-from django_comments_tree.render import render_draftjs, render_plain
+from django_comments_tree.render import (render_draftjs, render_markdown,
+                                         render_plain)
 
 # Default application namespace
 COMMENT_URL_NAMESPACE = 'treecomments'
@@ -20,6 +20,10 @@ COMMENTS_TREE_FROM_EMAIL = settings.DEFAULT_FROM_EMAIL
 # Contact email address.
 COMMENTS_TREE_CONTACT_EMAIL = settings.DEFAULT_FROM_EMAIL
 
+# Seconds during which posting the same comment to the same object again,
+# or confirming it twice, is detected as a duplicate.
+COMMENTS_TREE_DUPLICATE_WINDOW = 24 * 60 * 60
+
 # Maximum Thread Level.
 COMMENTS_TREE_MAX_THREAD_LEVEL = 0
 
@@ -46,6 +50,51 @@ COMMENTS_TREE_SEND_HTML_EMAIL = True
 # your own celery app.
 COMMENTS_TREE_THREADED_EMAILS = True
 
+# Threads sending emails when COMMENTS_TREE_THREADED_EMAILS is True, the
+# number of emails waiting for them, and what to do with new emails when
+# the queue is full: 'block', 'drop' or 'sync' (send in the caller thread).
+COMMENTS_TREE_MAIL_WORKERS = 2
+COMMENTS_TREE_MAIL_QUEUE_SIZE = 1000
+COMMENTS_TREE_MAIL_QUEUE_FULL = 'block'
+
+# Seconds waited at exit for the queued emails to be sent.
+COMMENTS_TREE_MAIL_SHUTDOWN_TIMEOUT = 10
+
+# Queue follow-up notifications in the FollowupNotification outbox, sent by
+# the send_followup_notifications management command, instead of emailing
+# the followers of the thread while posting the comment.
+COMMENTS_TREE_FOLLOWUP_OUTBOX = False
+
+# Alias of the cache, in Django's CACHES setting, used to store comment
+# threads and their rendered HTML. Set it to None to disable caching.
+COMMENTS_TREE_CACHE_BACKEND = None
+
+# Seconds a cached comment thread is kept (None means forever).
+COMMENTS_TREE_CACHE_TIMEOUT = 300
+
+# Number of (root, association) id pairs of commented objects each process
+# keeps in memory. Set it to 0 to disable the per-process cache.
+COMMENTS_TREE_ROOT_CACHE_SIZE = 1024
+
+# Seconds each process keeps the blacklisted domains in memory, when their
+# changes can't be noticed through COMMENTS_TREE_CACHE_BACKEND.
+COMMENTS_TREE_BLOCKLIST_MAX_AGE = 300
+
+# Seconds before the watermark that the changes API reads again, to return
+# the comments committed late with an earlier updated_on.
+COMMENTS_TREE_CHANGES_OVERLAP = 5
+
+# Class path of the broker that publishes comment events to live clients,
+# like "django_comments_tree.events.InMemoryBroker". None disables events.
+COMMENTS_TREE_EVENTS_BROKER = None
+
+# Measure queries, time, tree size and cache hits of the comment entry points.
+COMMENTS_TREE_INSTRUMENTATION = False
+
+# Class path of the sink that records the measurements, None for none.
+COMMENTS_TREE_INSTRUMENTATION_SINK = \
+    "django_comments_tree.instrumentation.LoggingSink"
+
 # Define what commenting features a pair app_label.model can have.
 # TODO: Put django-comments-tree settings under a dictionary, and merge
 #       COMMENTS_TREE_MAX_THREAD_LEVEL_BY_APP_MODEL with this one.
@@ -74,6 +123,6 @@ COMMENTS_TREE_FIREBASE_KEY = None
 # Default types we can use for comments
 MARKUP_FIELD_TYPES = (
     ('plain', render_plain),
-    ('markdown', markdown.markdown),
+    ('markdown', render_markdown),
     ('draftjs', render_draftjs),
 )
@@ -0,0 +1,152 @@
+"""
+Comment events published per comment thread.
+
+Events are small dicts like {"id": 12, "type": "posted", "comment": 34}.
+They tell clients that a thread changed, clients then read the changes with
+the comments-tree-api-changes view. Events are published to the broker
+named in COMMENTS_TREE_EVENTS_BROKER, in a channel per CommentAssociation.
+"""
+import asyncio
+import threading
+from collections import defaultdict, deque
+
+from django.utils.module_loading import import_string
+
+from django_comments_tree.conf import settings
+
+POSTED = 'posted'
+FLAGGED = 'flagged'
+REMOVED = 'removed'
+APPROVED = 'approved'
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+class Broker:
+    """
+    Base class of event brokers.
+
+    A channel is identified by the id of a CommentAssociation. Events get
+    an id, increasing within the broker, so subscribers can ask for the
+    events they missed.
+    """
+
+    def publish(self, channel, event):
+        """ Publish the event, and return it with its id """
+        raise NotImplementedError
+
+    def last_id(self, channel):
+        """ Return the id of the last event published to the channel """
+        raise NotImplementedError
+
+    def wait(self, channel, after, timeout):
+        """
+        Return the events published after the given id, waiting up to
+        timeout seconds for one when there are none yet.
+        """
+        raise NotImplementedError
+
+    def listen(self, channel, after=None):
+        """
+        Return an asynchronous iterator over the events published to the
+        channel after the given id, or from now on when after is None.
+        """
+        raise NotImplementedError
+
+
+class InMemoryBroker(Broker):
+    """
+    Broker for a single process. It keeps the last `history` events of
+    every channel, so clients reconnecting soon enough miss nothing.
+    """
+
+    def __init__(self, history=100):
+        self._condition = threading.Condition()
+        self._history = defaultdict(lambda: deque(maxlen=history))
+        self._listeners = defaultdict(set)
+        self._last_id = 0
+
+    def publish(self, channel, event):
+        with self._condition:
+            self._last_id += 1
+            event = dict(event, id=self._last_id)
+            self._history[channel].append(event)
+            listeners = list(self._listeners[channel])
+            self._condition.notify_all()
+        for loop, queue in listeners:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+        return event
+
+    def last_id(self, channel):
+        with self._condition:
+            history = self._history.get(channel)
+            return history[-1]['id'] if history else 0
+
+    def _events_after(self, channel, after):
+        history = self._history.get(channel, ())
+        return [event for event in history if event['id'] > after]
+
+    def wait(self, channel, after, timeout):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._events_after(channel, after), timeout)
+            return self._events_after(channel, after)
+
+    async def listen(self, channel, after=None):
+        listener = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._condition:
+            if after is None:
+                after = self._last_id
+            backlog = self._events_after(channel, after)
+            self._listeners[channel].add(listener)
+        try:
+            for event in backlog:
+                after = event['id']
+                yield event
+            while True:
+                event = await listener[1].get()
+                if event['id'] > after:
+                    after = event['id']
+                    yield event
+        finally:
+            with self._condition:
+                self._listeners[channel].discard(listener)
+
+
+def get_broker():
+    """ Return the configured broker, or None when events are disabled """
+    path = settings.COMMENTS_TREE_EVENTS_BROKER
+    if not path:
+        return None
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
+
+
+def publish_comment_event(kind, comment):
+    """ Publish an event of the given kind in the thread of the comment """
+    broker = get_broker()
+    if broker is None or comment.assoc_id is None:
+        return None
+    return broker.publish(comment.assoc_id, {'type': kind, 'comment': comment.pk})
+
+
+def channel_for_object(content_type_slug, object_pk):
+    """
+    Return the channel of the object given as in the web API URLs, an
+    "app_label-model" slug and a primary key, or None if it has no comments.
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from django_comments_tree.models import CommentAssociation
+
+    try:
+        app_label, model = content_type_slug.split("-")
+        content_type = ContentType.objects.get_by_natural_key(app_label, model)
+        qs = CommentAssociation.objects.filter(content_type=content_type,
+                                               object_id=int(object_pk),
+                                               site_id=settings.SITE_ID)
+    except (ContentType.DoesNotExist, ValueError):
+        return None
+    return qs.values_list('pk', flat=True).first()
@@ -0,0 +1,143 @@
+"""
+Export of comments as newline-delimited JSON (NDJSON), one record per line.
+
+Comments are read in tree order with a server-side iterator, and their
+flags are counted one chunk of comments at a time, so memory stays flat
+whatever the size of the table.
+"""
+import json
+import re
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from django_comments_tree.conf import settings
+
+EXPORT_CHUNK_SIZE = 2000
+
+FIELDS = ('id', 'path', 'depth', 'user_id', 'user_name', 'user_email',
+          'user_url', 'comment', 'comment_markup_type', 'submit_date',
+          'updated_on', 'ip_address', 'is_public', 'is_removed', 'followup',
+          'likes', 'dislikes', 'reports')
+
+# Natural keys of the association: content type, object id and site.
+ASSOC_FIELDS = {
+    'assoc__content_type__app_label': 'app_label',
+    'assoc__content_type__model': 'model',
+    'assoc__object_id': 'object_id',
+    'assoc__site__domain': 'site',
+}
+
+
+def parse_filters(site=None, content_type=None, object_id=None, since=None,
+                  until=None):
+    """
+    Return the keyword arguments of export_queryset from their string
+    values, content_type as "app_label.model" or "app_label-model" and the
+    dates in ISO 8601. Raise ValueError when one is not valid.
+    """
+    filters = {}
+    if site:
+        if not site.isdigit():
+            raise ValueError("site must be a site id.")
+        filters['site'] = int(site)
+    if content_type:
+        try:
+            app_label, model = re.split(r'[.-]', content_type)
+            filters['content_type'] = ContentType.objects.get_by_natural_key(
+                app_label, model)
+        except (ValueError, ContentType.DoesNotExist):
+            raise ValueError("Unknown content type %r." % content_type)
+    if object_id:
+        if 'content_type' not in filters:
+            raise ValueError("object_id requires a content type.")
+        if not object_id.isdigit():
+            raise ValueError("object_id must be an integer.")
+        filters['object_id'] = int(object_id)
+    for name, value in [('since', since), ('until', until)]:
+        if not value:
+            continue
+        try:
+            date = parse_datetime(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise ValueError("%s must be an ISO 8601 date/time." % name)
+        if settings.USE_TZ and timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        filters[name] = date
+    return filters
+
+
+def export_queryset(site=None, content_type=None, object_id=None,
+                    since=None, until=None):
+    """
+    Return the comments to export, all but the thread roots.
+
+    :param site: Site id.
+    :param content_type: ContentType of the commented objects.
+    :param object_id: Id of the commented object, with content_type.
+    :param since: Only comments updated after this date/time.
+    :param until: Only comments updated before this date/time.
+    """
+    from django_comments_tree.models import TreeComment
+
+    qs = TreeComment.objects.filter(depth__gt=1, assoc__isnull=False)
+    if site is not None:
+        qs = qs.filter(assoc__site_id=site)
+    if content_type is not None:
+        qs = qs.filter(assoc__content_type=content_type)
+    if object_id is not None:
+        qs = qs.filter(assoc__object_id=object_id)
+    if since is not None:
+        qs = qs.filter(updated_on__gt=since)
+    if until is not None:
+        qs = qs.filter(updated_on__lte=until)
+    return qs
+
+
+def _flag_counts(comment_ids):
+    from django_comments_tree.models import TreeCommentFlag
+
+    counts = defaultdict(dict)
+    rows = (TreeCommentFlag.objects.filter(comment_id__in=comment_ids)
+            .values_list('comment_id', 'flag').annotate(count=Count('pk'))
+            .order_by())
+    for comment_id, flag, count in rows:
+        counts[comment_id][flag] = count
+    return counts
+
+
+def export_records(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield a dict per comment of the queryset, in tree order, with the
+    natural keys of its association and the number of flags of each kind.
+    """
+    rows = queryset.order_by('path').values(*FIELDS, *ASSOC_FIELDS)
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _records(chunk)
+            chunk = []
+    yield from _records(chunk)
+
+
+def _records(rows):
+    flags = _flag_counts([row['id'] for row in rows]) if rows else {}
+    for row in rows:
+        record = {name: row[name] for name in FIELDS}
+        for lookup, name in ASSOC_FIELDS.items():
+            record[name] = row[lookup]
+        record['flags'] = flags.get(row['id'], {})
+        yield record
+
+
+def ndjson_lines(records):
+    """ Yield every record as a line of JSON """
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
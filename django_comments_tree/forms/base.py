@@ -155,20 +155,8 @@ class CommentDetailsForm(CommentSecurityForm):
         Check that a submitted comment isn't a duplicate. This might be caused
         by someone posting a comment twice. If it is a dup, silently return the *previous* comment.
         """
-        possible_duplicates = self.get_comment_model()._default_manager.using(
-            self.target_object._state.db
-        ).filter(
-            content_type=new.content_type,
-            object_id=new.object_id,
-            user_name=new.user_name,
-            user_email=new.user_email,
-            user_url=new.user_url,
-        )
-        for old in possible_duplicates:
-            if old.submit_date.date() == new.submit_date.date() and old.comment == new.comment:
-                return old
-
-        return new
+        manager = self.get_comment_model()._default_manager
+        return manager.find_duplicate(new) or new
 
     def clean_comment(self):
         """
@@ -0,0 +1,345 @@
+"""
+Import of the comments stored by django-contrib-comments, and optionally
+django-comments-xtd, into the TreeComment table.
+
+Source rows are read in chunks through a server-side cursor, ordered by
+commented object. The materialized paths and numchild of every thread are
+computed in memory, and each chunk of complete threads is written with a
+few bulk_create calls inside its own transaction, followed by a checkpoint
+from which an interrupted import resumes.
+"""
+import json
+import os
+import time
+from collections import defaultdict
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from django_comments_tree.conf import settings
+from django_comments_tree.utils import content_fingerprint
+
+COMMENTS_TABLE = 'django_comments'
+XTD_TABLE = 'django_comments_xtd_xtdcomment'
+
+COLUMNS = ('id', 'content_type_id', 'object_pk', 'site_id', 'user_id',
+           'user_name', 'user_email', 'user_url', 'comment', 'submit_date',
+           'ip_address', 'is_public', 'is_removed')
+XTD_COLUMNS = ('parent_id', 'followup')
+
+# Columns identifying the commented object, the order rows are read in.
+OBJECT_KEY = ('content_type_id', 'object_pk', 'site_id')
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.comments = 0
+        self.threads = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+
+def has_xtd_table(source):
+    """ Whether the source database has the django-comments-xtd table """
+    return XTD_TABLE in connections[source].introspection.table_names()
+
+
+def read_checkpoint(path):
+    """ Return the key of the last imported object, or None """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as fp:
+        return tuple(json.load(fp)['last_object'])
+
+
+def write_checkpoint(path, key, stats):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump({'last_object': list(key), 'rows': stats.rows,
+                   'comments': stats.comments}, fp)
+    os.replace(tmp_path, path)
+
+
+def _source_query(connection, xtd, after):
+    qn = connection.ops.quote_name
+    columns = ['c.%s' % qn(name) for name in COLUMNS]
+    sql = "SELECT %s%s FROM %s c" % (
+        ', '.join(columns),
+        ''.join(', x.%s' % qn(name) for name in XTD_COLUMNS) if xtd else '',
+        qn(COMMENTS_TABLE))
+    if xtd:
+        # Comments posted before django-comments-xtd was installed have no
+        # row in its table, their NULL parent puts them at the top level.
+        sql += " LEFT JOIN %s x ON x.%s = c.%s" % (
+            qn(XTD_TABLE), qn('comment_ptr_id'), qn('id'))
+    params = []
+    if after is not None:
+        # (content_type_id, object_pk, site_id) > after, spelled out for
+        # the backends without row value comparisons.
+        ct, pk, site = ['c.%s' % qn(name) for name in OBJECT_KEY]
+        sql += (" WHERE %s > %%s OR (%s = %%s AND (%s > %%s OR "
+                "(%s = %%s AND %s > %%s)))" % (ct, ct, pk, pk, site))
+        params = [after[0], after[0], after[1], after[1], after[2]]
+    sql += " ORDER BY %s, c.%s" % (
+        ', '.join('c.%s' % qn(name) for name in OBJECT_KEY), qn('id'))
+    return sql, params
+
+
+def read_threads(source, xtd, chunk_size, after=None):
+    """
+    Yield the (object key, rows) of every commented object, rows as dicts,
+    fetching chunk_size rows at a time with a server-side cursor.
+    """
+    names = COLUMNS + XTD_COLUMNS if xtd else COLUMNS
+    connection = connections[source]
+    sql, params = _source_query(connection, xtd, after)
+    cursor = connection.chunked_cursor()
+    try:
+        cursor.execute(sql, params)
+        key, rows = None, []
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for values in chunk:
+                row = dict(zip(names, values))
+                row_key = tuple(row[name] for name in OBJECT_KEY)
+                if row_key != key:
+                    if rows:
+                        yield key, rows
+                    key, rows = row_key, []
+                rows.append(row)
+        if rows:
+            yield key, rows
+    finally:
+        cursor.close()
+
+
+def _aware(value):
+    if settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def _parents(rows):
+    """
+    Return the parent id of every row, None for the top level: when the
+    parent is not in the thread, and for the earliest comment of every
+    cycle of parents, which would never be reached from the top level.
+    """
+    by_id = {row['id']: row for row in rows}
+    parents = {}
+    for row in rows:
+        parent_id = row.get('parent_id')
+        parents[row['id']] = parent_id if parent_id in by_id else None
+
+    reached = set()
+    for row in rows:
+        trail = []
+        node = row['id']
+        while node is not None and node not in reached:
+            if node in trail:
+                cycle = trail[trail.index(node):]
+                first = min(cycle, key=lambda pk: (by_id[pk]['submit_date'],
+                                                   pk))
+                parents[first] = None
+                break
+            trail.append(node)
+            node = parents[node]
+        reached.update(trail)
+    return parents
+
+
+def thread_nodes(rows):
+    """
+    Yield (row, parent row or None, step) for the comments of a thread, every
+    parent before its replies. Siblings are stepped by submit_date, as
+    TreeComment.node_order_by does.
+    """
+    parents = _parents(rows)
+    children = defaultdict(list)
+    for row in rows:
+        children[parents[row['id']]].append(row)
+
+    pending = [None]
+    while pending:
+        parent = pending.pop()
+        siblings = children.get(parent['id'] if parent else None, [])
+        siblings.sort(key=lambda row: (row['submit_date'], row['id']))
+        for step, row in enumerate(siblings, 1):
+            yield row, parent, step
+        pending.extend(reversed(siblings))
+
+
+class ThreadImporter:
+    """ Write threads of legacy comments to the TreeComment table """
+
+    def __init__(self, target='default'):
+        self.target = target
+
+    def existing_keys(self, keys):
+        """ Keys of the objects that already have a CommentAssociation """
+        from django_comments_tree.models import CommentAssociation
+
+        qs = CommentAssociation.objects.using(self.target).filter(
+            content_type_id__in={key[0] for key in keys},
+            object_id__in={int(key[1]) for key in keys},
+            site_id__in={key[2] for key in keys})
+        return {(ct, str(pk), site) for ct, pk, site in
+                qs.values_list('content_type_id', 'object_id', 'site_id')}
+
+    def write(self, threads):
+        """
+        Create an association, a root and the comments of every (key, rows)
+        thread, in one transaction. Return the number of comments created.
+        """
+        from django_comments_tree.models import (CommentAssociation,
+                                                 ThreadSubscription,
+                                                 TreeComment)
+
+        db = self.target
+        with transaction.atomic(using=db):
+            CommentAssociation.objects.using(db).bulk_create([
+                CommentAssociation(content_type_id=key[0],
+                                   object_id=int(key[1]), site_id=key[2])
+                for key, rows in threads])
+            assocs = self._associations(threads)
+
+            last_path = TreeComment.objects.using(db).filter(
+                depth=1).order_by('-path').values_list('path', flat=True)
+            last_path = last_path.first()
+            step = TreeComment._str2int(last_path) if last_path else 0
+            roots, comments = [], []
+            for key, rows in threads:
+                step += 1
+                root = TreeComment(
+                    path=TreeComment._get_path(None, 1, step), depth=1,
+                    assoc_id=assocs[key].pk, comment='')
+                roots.append(root)
+                comments.extend(self._comments(root, key, rows))
+            TreeComment.objects.using(db).bulk_create(roots)
+            TreeComment.objects.using(db).bulk_create(comments)
+
+            root_ids = dict(TreeComment.objects.using(db).filter(
+                path__in=[root.path for root in roots]
+            ).values_list('assoc_id', 'pk'))
+            associations = list(assocs.values())
+            for assoc in associations:
+                assoc.root_id = root_ids[assoc.pk]
+            CommentAssociation.objects.using(db).bulk_update(associations,
+                                                             ['root'])
+            ThreadSubscription.subscribe(
+                TreeComment.objects.using(db).filter(
+                    assoc__in=associations, followup=True))
+            CommentAssociation.rebuild_counters(
+                CommentAssociation.objects.using(db).filter(
+                    pk__in=[assoc.pk for assoc in associations]))
+        return len(comments)
+
+    def _associations(self, threads):
+        """ The associations just created for the threads, by key """
+        from django_comments_tree.models import CommentAssociation
+
+        keys = {key for key, rows in threads}
+        qs = CommentAssociation.objects.using(self.target).filter(
+            content_type_id__in={key[0] for key in keys},
+            object_id__in={int(key[1]) for key in keys},
+            site_id__in={key[2] for key in keys},
+            root__isnull=True)
+        assocs = {}
+        for assoc in qs:
+            key = (assoc.content_type_id, str(assoc.object_id), assoc.site_id)
+            if key in keys:
+                assocs[key] = assoc
+        return assocs
+
+    def _comments(self, root, key, rows):
+        from django_comments_tree.models import TreeComment
+
+        nodes = list(thread_nodes(rows))
+        numchild = defaultdict(int)
+        for row, parent, step in nodes:
+            numchild[parent['id'] if parent else None] += 1
+        root.numchild = numchild[None]
+
+        paths = {None: root.path}
+        for row, parent, step in nodes:
+            parent_id = parent['id'] if parent else None
+            depth = len(paths[parent_id]) // TreeComment.steplen + 1
+            path = TreeComment._get_path(paths[parent_id], depth, step)
+            paths[row['id']] = path
+            yield TreeComment(
+                path=path, depth=depth, numchild=numchild[row['id']],
+                assoc_id=root.assoc_id, user_id=row['user_id'],
+                user_name=row['user_name'] or '',
+                user_email=row['user_email'] or '',
+                user_url=row['user_url'] or '', comment=row['comment'],
+                submit_date=_aware(row['submit_date']),
+                updated_on=_aware(row['submit_date']),
+                ip_address=row['ip_address'] or None,
+                is_public=bool(row['is_public']),
+                is_removed=bool(row['is_removed']),
+                followup=bool(row.get('followup', False)),
+                content_hash=content_fingerprint(
+                    key[0], int(key[1]), key[2], row['user_name'] or '',
+                    row['user_email'] or '', row['comment']))
+
+
+def import_comments(source='default', target='default', xtd=None,
+                    chunk_size=10000, checkpoint=None, report=None):
+    """
+    Import the legacy comments of the source database into the TreeComment
+    table of the target database, and return the ImportStats.
+
+    :param xtd: Whether to read the django-comments-xtd table, to rebuild the
+    nested threads and followups. Detected from the source tables by default.
+    :param chunk_size: Source rows fetched, and written, at once. Every
+    thread is written as a whole, so a chunk can be larger.
+    :param checkpoint: Path of the file with the last object imported. The
+    import resumes after it, and updates it after every chunk.
+    :param report: Function called with the ImportStats after every chunk.
+
+    Objects with a primary key that is not an integer, or that already have
+    a CommentAssociation in the target database, are skipped.
+    """
+    if xtd is None:
+        xtd = has_xtd_table(source)
+    importer = ThreadImporter(target)
+    stats = ImportStats()
+    pending, pending_rows = [], 0
+
+    def flush():
+        nonlocal pending, pending_rows
+        existing = importer.existing_keys([key for key, rows in pending])
+        threads = [(key, rows) for key, rows in pending
+                   if key not in existing]
+        stats.skipped += len(pending) - len(threads)
+        if threads:
+            stats.comments += importer.write(threads)
+            stats.threads += len(threads)
+        stats.rows += pending_rows
+        if checkpoint:
+            write_checkpoint(checkpoint, pending[-1][0], stats)
+        if report:
+            report(stats)
+        pending, pending_rows = [], 0
+
+    for key, rows in read_threads(source, xtd, chunk_size,
+                                  read_checkpoint(checkpoint)):
+        if not str(key[1]).isdigit():
+            stats.skipped += 1
+            stats.rows += len(rows)
+            continue
+        pending.append((key, rows))
+        pending_rows += len(rows)
+        if pending_rows >= chunk_size:
+            flush()
+    if pending:
+        flush()
+    return stats
@@ -0,0 +1,196 @@
+"""
+Opt-in instrumentation of the main comment entry points.
+
+When COMMENTS_TREE_INSTRUMENTATION is True, rendering and building comment
+trees, listing and creating comments through the web API, notifying the
+followers of a thread and moderating comments record a Measurement: the SQL
+queries run, the wall time, the number of comments involved and the hits and
+misses of the comment caches.
+
+Every measurement is sent with the comments_measured signal and recorded by
+the sink named in COMMENTS_TREE_INSTRUMENTATION_SINK. With
+CommentsInstrumentationMiddleware installed and DEBUG on, the measurements of
+a request are summarized in its X-Comments-Tree response header.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from typing import Optional
+
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from django_comments_tree.conf import settings
+from django_comments_tree.signals import comments_measured
+
+HEADER = 'X-Comments-Tree'
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+@dataclass
+class Measurement:
+    name: str
+    queries: int = 0
+    time: float = 0.0
+    size: Optional[int] = None
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    def summary(self):
+        size = '' if self.size is None else ";size=%d" % self.size
+        return ("%s;queries=%d;time=%.1fms%s;cache=%d/%d"
+                % (self.name, self.queries, self.time * 1000, size,
+                   self.cache_hits, self.cache_hits + self.cache_misses))
+
+
+class LoggingSink:
+    """ Log every measurement at DEBUG level """
+
+    def record(self, measurement):
+        logger.debug("%s", measurement.summary())
+
+
+class MemorySink:
+    """ Keep the measurements in a list, as tests need """
+
+    def __init__(self):
+        self.measurements = []
+
+    def record(self, measurement):
+        self.measurements.append(measurement)
+
+    def clear(self):
+        self.measurements = []
+
+
+def get_sink():
+    """ Return the configured sink, or None when there is none """
+    path = settings.COMMENTS_TREE_INSTRUMENTATION_SINK
+    if not path:
+        return None
+    with _sinks_lock:
+        if path not in _sinks:
+            _sinks[path] = import_string(path)()
+        return _sinks[path]
+
+
+def _active():
+    """ Measurements in progress in this thread, innermost last """
+    if not hasattr(_local, 'active'):
+        _local.active = []
+    return _local.active
+
+
+def _record(measurement):
+    collected = getattr(_local, 'collected', None)
+    if collected is not None:
+        collected.append(measurement)
+    comments_measured.send(sender=Measurement, measurement=measurement)
+    sink = get_sink()
+    if sink is not None:
+        try:
+            sink.record(measurement)
+        except Exception:
+            logger.exception("Could not record %s", measurement.name)
+
+
+@contextmanager
+def measure(name):
+    """
+    Measure the block, when instrumentation is enabled. Yield the
+    Measurement, or None. Measurements can be nested: the queries and cache
+    lookups of the inner block count in the outer one too.
+    """
+    if not settings.COMMENTS_TREE_INSTRUMENTATION:
+        yield None
+        return
+
+    measurement = Measurement(name)
+
+    def count_queries(execute, sql, params, many, context):
+        measurement.queries += 1
+        return execute(sql, params, many, context)
+
+    active = _active()
+    active.append(measurement)
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_queries))
+            yield measurement
+    finally:
+        measurement.time = time.perf_counter() - start
+        active.remove(measurement)
+        _record(measurement)
+
+
+def instrumented(name, size=None):
+    """
+    Decorator that measures each call of the function.
+
+    :param size: Function that returns the number of comments involved,
+    given the result of the call.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(name) as measurement:
+                result = func(*args, **kwargs)
+                if measurement is not None and size is not None:
+                    measurement.size = size(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def record_size(size):
+    """ Set the number of comments of the innermost measurement """
+    active = getattr(_local, 'active', None)
+    if active:
+        active[-1].size = size
+
+
+def cache_hit():
+    for measurement in getattr(_local, 'active', ()):
+        measurement.cache_hits += 1
+
+
+def cache_miss():
+    for measurement in getattr(_local, 'active', ()):
+        measurement.cache_misses += 1
+
+
+def tree_size(tree):
+    """ Number of comments in a list of {"comment", "children"} dicts """
+    return sum(1 + tree_size(node['children']) for node in tree)
+
+
+class CommentsInstrumentationMiddleware:
+    """
+    Collect the measurements of each request and, when DEBUG is on,
+    summarize them in the X-Comments-Tree response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.COMMENTS_TREE_INSTRUMENTATION:
+            return self.get_response(request)
+        _local.collected = collected = []
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.collected = None
+        if settings.DEBUG and collected:
+            response[HEADER] = ', '.join(m.summary() for m in collected)
+        return response
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_comments_tree.export import (EXPORT_CHUNK_SIZE, export_queryset,
+                                         export_records, ndjson_lines,
+                                         parse_filters)
+
+
+__all__ = ['Command']
+
+
+class Command(BaseCommand):
+    help = ("Export the comments, in tree order, as newline-delimited JSON "
+            "with the keys of their association and their flag counts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help="File to write, the standard output by "
+                                 "default.")
+        parser.add_argument('--site', help="Only comments of this site id.")
+        parser.add_argument('--content-type',
+                            help="Only comments to objects of this "
+                                 "app_label.model.")
+        parser.add_argument('--object-id',
+                            help="Only comments to the object with this id, "
+                                 "with --content-type.")
+        parser.add_argument('--since',
+                            help="Only comments updated after this ISO 8601 "
+                                 "date/time.")
+        parser.add_argument('--until',
+                            help="Only comments updated up to this ISO 8601 "
+                                 "date/time.")
+        parser.add_argument('--chunk-size', type=int,
+                            default=EXPORT_CHUNK_SIZE,
+                            help="Number of comments read at once.")
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(options['site'], options['content_type'],
+                                    options['object_id'], options['since'],
+                                    options['until'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        records = export_records(export_queryset(**filters),
+                                 options['chunk_size'])
+        output = open(options['output'], 'w') if options['output'] else None
+        count = 0
+        try:
+            for line in ndjson_lines(records):
+                (output or self.stdout).write(line)
+                count += 1
+        finally:
+            if output:
+                output.close()
+        self.stderr.write("Exported %d comment(s)." % count)
@@ -0,0 +1,67 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from django_comments_tree import blocklist
+from django_comments_tree.models import BlackListedDomain
+
+
+__all__ = ['Command']
+
+
+class Command(BaseCommand):
+    help = ("Add the domains listed in a file, one per line, to the "
+            "blacklisted domains. Empty lines and lines starting with '#' "
+            "are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, '-' for stdin.")
+        parser.add_argument('--replace', action='store_true',
+                            help="Remove the domains not in the file.")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of domains inserted at once.")
+
+    def read_domains(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            domain = blocklist.normalize(line.split()[0])
+            if domain:
+                yield domain
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['path'] == '-':
+            lines = sys.stdin
+        else:
+            lines = open(options['path'], encoding='utf-8')
+
+        with lines, transaction.atomic():
+            if options['replace']:
+                # Plain SQL, deleting through the ORM would fetch every row
+                # and send one post_delete signal each.
+                with connection.cursor() as cursor:
+                    cursor.execute('DELETE FROM %s' % connection.ops.quote_name(
+                        BlackListedDomain._meta.db_table))
+            existing = set(map(blocklist.normalize,
+                               BlackListedDomain.objects.values_list(
+                                   'domain', flat=True).iterator()))
+            added = 0
+            batch = []
+            for domain in self.read_domains(lines):
+                if domain in existing:
+                    continue
+                existing.add(domain)
+                batch.append(BlackListedDomain(domain=domain))
+                if len(batch) >= batch_size:
+                    BlackListedDomain.objects.bulk_create(batch)
+                    added += len(batch)
+                    batch = []
+            BlackListedDomain.objects.bulk_create(batch)
+            added += len(batch)
+        blocklist.invalidate()
+
+        self.stdout.write("Added %d domain(s), %d blacklisted." % (
+            added, len(existing)))
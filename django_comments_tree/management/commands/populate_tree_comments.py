@@ -1,51 +1,51 @@
-import sys
-
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connections
-from django.db.utils import ConnectionDoesNotExist, IntegrityError
-from django.core.management.base import BaseCommand
 
-from django_comments_tree.models import TreeComment
+from django_comments_tree.importer import (COMMENTS_TABLE, has_xtd_table,
+                                           import_comments)
 
 
 __all__ = ['Command']
 
 
 class Command(BaseCommand):
-    help = "Load the treecomment table with valid data from django_comments_tree."
+    help = ("Load the treecomment table with the comments of "
+            "django-contrib-comments and django-comments-xtd.")
 
     def add_arguments(self, parser):
-        parser.add_argument('using', nargs='*', type=str)
-
-    def populate_db(self, cursor):
-        """
-        ToDo: More work will be needed to make this transition work
-        :param cursor:
-        :return:
-        """
-        # for comment in Comment.objects.all():
-        #     sql = ("INSERT INTO %(table)s "
-        #            "       ('comment_ptr_id', 'thread_id', 'parent_id',"
-        #            "        'level', 'order', 'followup') "
-        #            "VALUES (%(id)d, %(id)d, %(id)d, 0, 1, 0)")
-        #     cursor.execute(sql % {'table': TreeComment._meta.db_table,
-        #                           'id': comment.id})
+        parser.add_argument('--database', default='default',
+                            help="Database the comments are imported to.")
+        parser.add_argument('--source', default=None,
+                            help="Database the comments are read from, the "
+                                 "target database by default.")
+        parser.add_argument('--no-xtd', action='store_true',
+                            help="Ignore the django-comments-xtd table, "
+                                 "import every comment at the top level.")
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Number of rows read and written at once.")
+        parser.add_argument('--checkpoint', default=None,
+                            help="File that records the progress, to resume "
+                                 "an interrupted import.")
 
     def handle(self, *args, **options):
-        total = 0
-        using = options['using'] or ['default']
-        for db_conn in using:
-            try:
-                self.populate_db(connections[db_conn].cursor())
-                total += TreeComment.objects.using(db_conn).count()
-            except ConnectionDoesNotExist:
-                print("DB connection '%s' does not exist." % db_conn)
-                continue
-            except IntegrityError:
-                if db_conn != 'default':
-                    print("Table '%s' (in '%s' DB connection) must be empty."
-                          % (TreeComment._meta.db_table, db_conn))
-                else:
-                    print("Table '%s' must be empty."
-                          % TreeComment._meta.db_table)
-                sys.exit(1)
-        print("Added %d TreeComment object(s)." % total)
+        target = options['database']
+        source = options['source'] or target
+        for alias in (source, target):
+            if alias not in connections.databases:
+                raise CommandError("DB connection '%s' does not exist."
+                                   % alias)
+        if COMMENTS_TABLE not in connections[source].introspection.table_names():
+            raise CommandError("Table '%s' does not exist in the '%s' DB "
+                               "connection." % (COMMENTS_TABLE, source))
+        xtd = not options['no_xtd'] and has_xtd_table(source)
+
+        def report(stats):
+            self.stdout.write("%d row(s) read, %d TreeComment object(s) "
+                              "added, %.0f rows/s." % (
+                                  stats.rows, stats.comments, stats.rate))
+
+        stats = import_comments(source, target, xtd, options['chunk_size'],
+                                options['checkpoint'], report)
+        self.stdout.write("Added %d TreeComment object(s) in %d thread(s), "
+                          "skipped %d object(s)." % (
+                              stats.comments, stats.threads, stats.skipped))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from django_comments_tree.models import CommentAssociation
+
+
+__all__ = ['Command']
+
+
+class Command(BaseCommand):
+    help = ("Recompute the comment counters of every CommentAssociation "
+            "from the treecomment table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of associations rebuilt at once.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pks = list(CommentAssociation.objects.order_by('pk')
+                   .values_list('pk', flat=True))
+        total = 0
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            total += CommentAssociation.rebuild_counters(
+                CommentAssociation.objects.filter(pk__in=batch))
+        self.stdout.write("Rebuilt the counters of %d association(s)." % total)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.utils.html import escape
+
+from django_comments_tree import cache
+from django_comments_tree.models import CommentAssociation, TreeComment
+
+
+__all__ = ['Command']
+
+
+class Command(BaseCommand):
+    help = ("Render again the comments, after changing the markup "
+            "renderers, and store the HTML that changed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of comments rendered at once.")
+        parser.add_argument('--markup-type', default=None,
+                            help="Only render comments of this markup type.")
+
+    def handle(self, *args, **options):
+        field = TreeComment._meta.get_field('comment')
+        rendered_name = '_comment_rendered'
+        qs = TreeComment.objects.only(
+            'id', 'assoc', 'comment', 'comment_markup_type', rendered_name)
+        if options['markup_type']:
+            qs = qs.filter(comment_markup_type=options['markup_type'])
+
+        last_pk = 0
+        checked = updated = 0
+        while True:
+            batch = list(qs.filter(pk__gt=last_pk)
+                         .order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            checked += len(batch)
+
+            changed = []
+            for comment in batch:
+                raw = comment.comment.raw
+                if raw is None:
+                    continue
+                if field.escape_html:
+                    raw = escape(raw)
+                render = field.markup_choices_dict[comment.comment.markup_type]
+                rendered = render(raw)
+                if rendered != getattr(comment, rendered_name):
+                    setattr(comment, rendered_name, rendered)
+                    changed.append(comment)
+            if not changed:
+                continue
+
+            TreeComment.objects.bulk_update(changed, [rendered_name])
+            updated += len(changed)
+            roots = CommentAssociation.objects.filter(
+                pk__in={c.assoc_id for c in changed})
+            for root_id in roots.values_list('root_id', flat=True):
+                cache.invalidate_thread(root_id)
+
+        self.stdout.write("Rendered %d comment(s), %d changed." % (
+            checked, updated))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from django_comments_tree.notifications import send_followup_notifications
+
+
+__all__ = ['Command']
+
+
+class Command(BaseCommand):
+    help = ("Send the follow-up notifications queued in the outbox, "
+            "see COMMENTS_TREE_FOLLOWUP_OUTBOX.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Number of queued comments sent at once.")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Keep running, checking the outbox every "
+                                 "INTERVAL seconds once it is empty.")
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        comments = emails = 0
+        while True:
+            with connection:
+                while True:
+                    batch = send_followup_notifications(options['batch_size'],
+                                                        connection)
+                    if not batch[0]:
+                        break
+                    comments += batch[0]
+                    emails += batch[1]
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write("Sent %d email(s) for %d comment(s)." % (
+            emails, comments))
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:51
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_comments(apps, schema_editor):
+    """ Set the comment counters of every association """
+    CommentAssociation = apps.get_model('django_comments_tree', 'CommentAssociation')
+    TreeComment = apps.get_model('django_comments_tree', 'TreeComment')
+    rows = TreeComment.objects.filter(depth__gt=1, assoc__isnull=False)
+    rows = rows.order_by().values('assoc').annotate(
+        total=Count('pk'),
+        public=Count('pk', filter=Q(is_public=True, is_removed=False)),
+        removed=Count('pk', filter=Q(is_removed=True)),
+        moderation=Count('pk', filter=Q(is_public=False, is_removed=False)))
+    for row in rows:
+        CommentAssociation.objects.filter(pk=row['assoc']).update(
+            total_count=row['total'],
+            public_count=row['public'],
+            removed_count=row['removed'],
+            moderation_count=row['moderation'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments_tree', '0008_auto_20191027_2147'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentassociation',
+            name='moderation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='commentassociation',
+            name='public_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='commentassociation',
+            name='removed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='commentassociation',
+            name='total_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='commentassociation',
+            index=models.Index(fields=['content_type', 'object_id', 'site'], name='django_comm_content_cbce32_idx'),
+        ),
+        migrations.RunPython(
+            count_comments,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+COUNTERS = {
+    'I liked it': 'likes',
+    'I disliked it': 'dislikes',
+    'removal suggestion': 'reports',
+}
+
+
+def count_feedback(apps, schema_editor):
+    """ Set the feedback counters of every comment """
+    TreeComment = apps.get_model('django_comments_tree', 'TreeComment')
+    TreeCommentFlag = apps.get_model('django_comments_tree', 'TreeCommentFlag')
+    rows = TreeCommentFlag.objects.filter(flag__in=COUNTERS.keys())
+    rows = rows.order_by().values('comment', 'flag').annotate(count=Count('pk'))
+    for row in rows:
+        TreeComment.objects.filter(pk=row['comment']).update(
+            **{COUNTERS[row['flag']]: row['count']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments_tree', '0009_comment_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treecomment',
+            name='dislikes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='treecomment',
+            name='likes',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='treecomment',
+            name='reports',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(
+            count_feedback,
+            migrations.RunPython.noop
+        ),
+    ]
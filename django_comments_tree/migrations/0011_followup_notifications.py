@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments_tree', '0010_feedback_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowupNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('sent_on', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='sent on')),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='followup_notifications', to='django_comments_tree.TreeComment', verbose_name='comment')),
+            ],
+            options={
+                'verbose_name': 'follow-up notification',
+                'verbose_name_plural': 'follow-up notifications',
+                'ordering': ('pk',),
+            },
+        ),
+    ]
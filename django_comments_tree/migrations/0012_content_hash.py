@@ -0,0 +1,57 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:11
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def content_fingerprint(content_type_id, object_id, site_id, user_name,
+                        user_email, body):
+    """
+    Copy of django_comments_tree.utils.content_fingerprint as of this
+    migration, so that later changes to it do not change the migration.
+    """
+    parts = [str(content_type_id), str(object_id), str(site_id),
+             user_name or '', (user_email or '').lower(),
+             ' '.join((body or '').split())]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def fingerprint_comments(apps, schema_editor):
+    """ Set the content_hash of every comment """
+    TreeComment = apps.get_model('django_comments_tree', 'TreeComment')
+    rows = TreeComment.objects.filter(depth__gt=1, assoc__isnull=False)
+    rows = rows.values_list('id', 'assoc__content_type_id', 'assoc__object_id',
+                            'assoc__site_id', 'user_name', 'user_email',
+                            'comment')
+    batch = []
+    for pk, *fields in rows.iterator():
+        batch.append(TreeComment(id=pk,
+                                 content_hash=content_fingerprint(*fields)))
+        if len(batch) == 1000:
+            TreeComment.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    TreeComment.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments_tree', '0011_followup_notifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treecomment',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='treecomment',
+            index=models.Index(fields=['content_hash', 'submit_date'], name='django_comm_content_c5e35f_idx'),
+        ),
+        migrations.RunPython(
+            fingerprint_comments,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def subscribe_followers(apps, schema_editor):
+    """
+    Subscribe the authors of public comments with follow-up enabled, through
+    their first such comment in each thread, as new comments do.
+    """
+    TreeComment = apps.get_model('django_comments_tree', 'TreeComment')
+    ThreadSubscription = apps.get_model('django_comments_tree',
+                                        'ThreadSubscription')
+    rows = TreeComment.objects.filter(depth__gt=1, assoc__isnull=False,
+                                      is_public=True, followup=True)
+    rows = rows.exclude(user_email='').order_by('id')
+    followers = {}
+    for pk, assoc_id, user_id, email in rows.values_list(
+            'id', 'assoc_id', 'user_id', 'user_email').iterator():
+        followers.setdefault((assoc_id, email), ThreadSubscription(
+            assoc_id=assoc_id, user_email=email, user_id=user_id,
+            comment_id=pk))
+    # The batch size is left to the database backend: on Django 2.2 a
+    # larger one given here exceeds the SQLite limits.
+    ThreadSubscription.objects.bulk_create(followers.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_comments_tree', '0012_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadSubscription',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_email', models.EmailField(max_length=254, verbose_name="user's email address")),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('assoc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to='django_comments_tree.CommentAssociation', verbose_name='association')),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='thread_subscriptions', to='django_comments_tree.TreeComment', verbose_name='comment')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='thread_subscriptions', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'thread subscription',
+                'verbose_name_plural': 'thread subscriptions',
+                'unique_together': {('assoc', 'user_email')},
+            },
+        ),
+        migrations.RunPython(subscribe_followers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:18
+
+from django.db import migrations, models
+
+PATH_LIKE_INDEX = 'treecomment_path_like_idx'
+
+
+def create_path_like_index(apps, schema_editor):
+    """
+    On PostgreSQL, index path with varchar_pattern_ops, so that the
+    LIKE 'prefix%' lookups of descendants use an index whatever the
+    collation of the database. Other databases use the unique index.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    TreeComment = apps.get_model('django_comments_tree', 'TreeComment')
+    schema_editor.execute('CREATE INDEX %s ON %s (%s varchar_pattern_ops)' % (
+        schema_editor.quote_name(PATH_LIKE_INDEX),
+        schema_editor.quote_name(TreeComment._meta.db_table),
+        schema_editor.quote_name('path')))
+
+
+def drop_path_like_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS %s' % (
+        schema_editor.quote_name(PATH_LIKE_INDEX)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments_tree', '0013_thread_subscriptions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='treecomment',
+            index=models.Index(fields=['assoc', 'is_public', 'submit_date'], name='treecomment_assoc_public_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treecomment',
+            index=models.Index(fields=['assoc', 'path'], name='treecomment_assoc_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treecomment',
+            index=models.Index(condition=models.Q(('is_public', False), ('is_removed', False)), fields=['submit_date'], name='treecomment_moderation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treecommentflag',
+            index=models.Index(fields=['comment', 'flag'], name='treecommentflag_comment_idx'),
+        ),
+        migrations.RunPython(create_path_like_index, drop_path_like_index),
+    ]
@@ -1,3 +1,5 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
 from typing import Optional, List
 from dataclasses import dataclass, field
 
@@ -13,18 +15,26 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.core import signing
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Concat, Substr
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
-from django_comments_tree.signals import comment_was_flagged
-from django_comments_tree import get_structured_data_class
+from django_comments_tree.signals import (comment_was_flagged,
+                                          comments_were_flagged,
+                                          comment_was_posted,
+                                          comment_feedback_toggled,
+                                          confirmation_received)
+from django_comments_tree import (blocklist, cache, events,
+                                  get_structured_data_class, instrumentation)
 
 from django.conf import settings as djsettings
 from django_comments_tree.conf import settings
+from django_comments_tree.utils import content_fingerprint
 from treebeard.mp_tree import MP_Node, MP_NodeManager
 
 from .abstract import CommentAbstractModel
@@ -52,28 +62,79 @@ class MaxThreadLevelExceededException(Exception):
 
 class CommentManager(MP_NodeManager):
 
-    def _validate_assoc(self, root, association):
-        if root.assoc is None:
-            root.assoc = association
+    def _validate_assoc(self, root, assoc_id):
+        if root.assoc_id is None:
+            root.assoc_id = assoc_id
             root.save()
 
-    def get_root(self, obj, site=None):
-        """ Return the root for the given object """
+    def _site_id(self, site):
         if site is None:
-            site = Site.objects.get(pk=1)
+            return settings.SITE_ID
+        return getattr(site, 'pk', site)
 
-        try:
-            ct = ContentType.objects.get_for_model(obj)
-            qs = CommentAssociation.objects.select_related("root")
-            assoc = qs.get(
-                content_type=ct,
-                object_id=obj.id,
-                site=site)
-
-            self._validate_assoc(assoc.root, assoc)
-            return assoc.root
-        except ObjectDoesNotExist:
-            return None
+    def get_root_ids(self, obj, site=None, create=False):
+        """
+        Return the (root_id, assoc_id) pair for the given object, or None
+        when it has no comments root and create is False.
+
+        The pair is memoized per process and in the thread cache, if enabled,
+        so this usually runs no query at all.
+        """
+        ct = ContentType.objects.get_for_model(obj)
+        site_id = self._site_id(site)
+
+        def lookup():
+            qs = CommentAssociation.objects.filter(content_type=ct,
+                                                   object_id=obj.pk,
+                                                   site_id=site_id)
+            return qs.values_list('root_id', 'pk').first()
+
+        ids = cache.get_root_ids(ct.pk, obj.pk, site_id, lookup)
+        if ids is None and create:
+            root = self._create_root(obj, ct, site_id)
+            ids = (root.pk, root.assoc_id)
+        return ids
+
+    def _load_root(self, obj, site_id, ids):
+        """ Fetch the root with the given ids, checking they are not stale """
+        root_id, assoc_id = ids
+        ct = ContentType.objects.get_for_model(obj)
+        root = self.get_queryset().filter(
+            pk=root_id,
+            commentassociation__pk=assoc_id,
+            commentassociation__content_type=ct,
+            commentassociation__object_id=obj.pk,
+            commentassociation__site_id=site_id).first()
+        if root is None:
+            cache.forget_root(ct.pk, obj.pk, site_id)
+        else:
+            self._validate_assoc(root, assoc_id)
+        return root
+
+    def _create_root(self, obj, ct, site_id):
+        root = TreeComment.add_root()
+        assoc = CommentAssociation.objects.create(content_type=ct,
+                                                  object_id=obj.pk,
+                                                  content_object=obj,
+                                                  site_id=site_id,
+                                                  root=root)
+        root.assoc = assoc
+        root.save()
+        cache.set_root_ids(ct.pk, obj.pk, site_id, (root.pk, assoc.pk))
+        return root
+
+    def get_root(self, obj, site=None):
+        """ Return the root for the given object """
+        site_id = self._site_id(site)
+        # A second lookup, from the database, when the memoized ids are stale.
+        for attempt in range(2):
+            ids = self.get_root_ids(obj, site_id)
+            if ids is None:
+                return None
+            root = self._load_root(obj, site_id, ids)
+            if root is not None:
+                return root
+        return None
 
     def get_or_create_root(self, obj, site=None):
         """
@@ -90,31 +151,31 @@ class CommentManager(MP_NodeManager):
 
 
         :param obj:
-        :param site:
+        :param site: Site or site id, defaults to settings.SITE_ID.
         :return:
         """
-        ct = ContentType.objects.get_for_model(obj)
-
-        if site is None:
-            site = Site.objects.get(pk=1)
+        root = self.get_root(obj, site)
+        if root is None:
+            ct = ContentType.objects.get_for_model(obj)
+            root = self._create_root(obj, ct, self._site_id(site))
+        return root
 
-        try:
-            assoc = CommentAssociation.objects.select_related("root").get(
-                content_type=ct,
-                object_id=obj.id,
-                site=site)
-            self._validate_assoc(assoc.root, assoc)
-        except ObjectDoesNotExist:
-            root = TreeComment.add_root()
-            assoc = CommentAssociation.objects.create(content_type=ct,
-                                                      object_id=obj.id,
-                                                      content_object=obj,
-                                                      site=site,
-                                                      root=root)
-            root.assoc = assoc
-            root.save()
+    def find_duplicate(self, comment, window=None):
+        """
+        Return a stored comment to the same object, by the same author and
+        with the same body as the given TreeComment or TmpTreeComment,
+        submitted at most `window` seconds before it, or None.
 
-        return assoc.root
+        The window defaults to COMMENTS_TREE_DUPLICATE_WINDOW. The lookup is
+        a single probe of the (content_hash, submit_date) index.
+        """
+        if window is None:
+            window = settings.COMMENTS_TREE_DUPLICATE_WINDOW
+        qs = self.get_queryset().filter(content_hash=comment.fingerprint())
+        if comment.submit_date is not None:
+            qs = qs.filter(
+                submit_date__gte=comment.submit_date - timedelta(seconds=window))
+        return qs.order_by('submit_date').first()
 
     def create_for_object(self, obj, **kwargs):
         root = self.get_or_create_root(obj)
@@ -184,14 +245,66 @@ class CommentManager(MP_NodeManager):
 
     def count_for_content_types(self, content_types: List[str], site: int = None) -> int:
         """ Retrieve a count of comments for the given list of content types """
-        qs = self.for_content_types(content_types=content_types, site=site)
-        return qs.count()
+        qs = CommentAssociation.objects.filter(content_type__in=content_types)
+        if site is not None:
+            qs = qs.filter(site=site)
+        return qs.aggregate(count=Sum('total_count'))['count'] or 0
 
     def count_for_model(self, model, site: int = None) -> int:
-        """ Retrieve a count of comments for the given list of content types """
+        """ Retrieve a count of comments for the given model class or instance """
+        content_type = ContentType.objects.get_for_model(model)
+        qs = CommentAssociation.objects.filter(content_type=content_type)
+        if site is not None:
+            qs = qs.filter(site=site)
+        if isinstance(model, models.Model):
+            qs = qs.filter(object_id=model._get_pk_val())
+        return qs.aggregate(count=Sum('total_count'))['count'] or 0
 
-        qs = self.for_model(model=model, site=site)
-        return qs.count()
+    def count_for_object(self, object_id, content_type, site=None) -> int:
+        """
+        Retrieve the number of public, not removed, comments for the given object.
+        """
+        qs = CommentAssociation.objects.filter(content_type=content_type,
+                                               object_id=object_id)
+        if site is not None:
+            qs = qs.filter(site=site)
+        return qs.aggregate(count=Sum('public_count'))['count'] or 0
+
+    def count_for_objects(self, object_ids, content_type, site=None) -> dict:
+        """
+        Retrieve the number of public, not removed, comments for each of
+        the given objects with a single query.
+
+        Returns a dict {object_id: count}, with 0 for objects without
+        comments.
+        """
+        object_ids = {int(object_id) for object_id in object_ids}
+        counts = dict.fromkeys(object_ids, 0)
+        if not object_ids:
+            return counts
+        qs = CommentAssociation.objects.filter(content_type=content_type,
+                                               object_id__in=object_ids)
+        if site is not None:
+            qs = qs.filter(site=site)
+        qs = qs.order_by().values_list('object_id').annotate(
+            count=Sum('public_count'))
+        counts.update(qs)
+        return counts
+
+    def annotate_counts(self, queryset, site=None, name='comment_count'):
+        """
+        Annotate every object of a model queryset with the number of its
+        public, not removed, comments, with a subquery on the association.
+        """
+        content_type = ContentType.objects.get_for_model(queryset.model)
+        qs = CommentAssociation.objects.filter(content_type=content_type,
+                                               object_id=OuterRef('pk'))
+        if site is not None:
+            qs = qs.filter(site=site)
+        qs = qs.order_by().values('object_id').annotate(
+            count=Sum('public_count')).values('count')
+        return queryset.annotate(**{name: Coalesce(
+            Subquery(qs, output_field=models.IntegerField()), 0)})
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -199,6 +312,21 @@ class CommentManager(MP_NodeManager):
             'commentassociation', 'commentassociation__content_type')
         return qs
 
+    def flags_for_comments(self, comments):
+        """
+        Retrieve the flags of the given comments with a single query.
+
+        Returns a dict {comment_id: {flag: [user, ...]}}, users are listed
+        in the order they flagged the comment.
+        """
+        result = {}
+        qs = TreeCommentFlag.objects.filter(comment__in=comments)
+        qs = qs.select_related('user').order_by('flag_date', 'pk')
+        for flag in qs:
+            users = result.setdefault(flag.comment_id, {}).setdefault(flag.flag, [])
+            users.append(flag.user)
+        return result
+
     def user_flags_for_model(self, user, model, content_type=None):
         """
         Retrieve a summary of flags for the given user and model
@@ -268,10 +396,32 @@ class CommentManager(MP_NodeManager):
         return result
 
 
+COUNTER_FIELDS = ('total_count', 'public_count', 'removed_count', 'moderation_count')
+
+COUNTER_AGGREGATES = {
+    'total_count': Count('pk'),
+    'public_count': Count('pk', filter=Q(is_public=True, is_removed=False)),
+    'removed_count': Count('pk', filter=Q(is_removed=True)),
+    'moderation_count': Count('pk', filter=Q(is_public=False, is_removed=False)),
+}
+
+
+def counter_for(is_public, is_removed):
+    """ Return the name of the counter a comment with the given flags adds to """
+    if is_removed:
+        return 'removed_count'
+    if is_public:
+        return 'public_count'
+    return 'moderation_count'
+
+
 class CommentAssociation(models.Model):
     """
     Associate a tree node with a particular model by GenericForeignKey
 
+    The association also keeps the number of comments in the thread. Every
+    comment adds to total_count and to exactly one of public_count,
+    removed_count or moderation_count.
     """
 
     @classmethod
@@ -299,10 +449,49 @@ class CommentAssociation(models.Model):
     # Metadata about the comment
     site = models.ForeignKey(Site, on_delete=models.CASCADE)
 
+    # Comment counters, kept up to date by TreeComment.save and on deletion.
+    total_count = models.PositiveIntegerField(default=0)
+    public_count = models.PositiveIntegerField(default=0)
+    removed_count = models.PositiveIntegerField(default=0)
+    moderation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'site']),
+        ]
+
     @property
     def object_pk(self):
         return str(self.object_id)
 
+    @classmethod
+    def rebuild_counters(cls, queryset=None):
+        """
+        Recompute the comment counters from the comments table.
+
+        :param queryset: Associations to rebuild, all of them by default.
+        :return: Number of associations rebuilt.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        rows = TreeComment.objects.filter(assoc__in=queryset, depth__gt=1)
+        rows = rows.order_by().values('assoc').annotate(**COUNTER_AGGREGATES)
+        counts = {row['assoc']: row for row in rows}
+
+        associations = list(queryset.only('pk'))
+        for assoc in associations:
+            row = counts.get(assoc.pk, {})
+            for name in COUNTER_FIELDS:
+                setattr(assoc, name, row.get(name, 0))
+        cls.objects.bulk_update(associations, COUNTER_FIELDS, batch_size=500)
+        return len(associations)
+
+    def recount(self):
+        """ Recompute the comment counters of this association """
+        self.rebuild_counters(CommentAssociation.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=COUNTER_FIELDS)
+
     def __str__(self):
         return (f"CommentAssociation pk={self.pk} "
                 f"oid={self.object_id} ct_id={self.content_type_id} root_id={self.root_id}")
@@ -314,6 +503,7 @@ class CommentData:
     comment: str = ''
     comment_rendered: str = ''
     likes: int = 0
+    dislikes: int = 0
     parent_id: int = -1
     timestamp: str = ''
     depth: int = 1
@@ -344,12 +534,55 @@ class TreeComment(MP_Node, CommentAbstractModel):
 
     def __init__(self, *args, **kwargs):
         self._association = None
+        # (assoc_id, counter) this comment is accounted for in the database.
+        self._counted = None
+        # (followup, is_public) as stored, to subscribe followers on change.
+        self._followup_state = None
+        # The fields of the content_hash as stored, to hash again on change.
+        self._hashed = None
         super().__init__(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if instance.get_deferred_fields() & {'assoc_id', 'depth', 'is_public', 'is_removed'}:
+            instance._counted = NOT_LOADED
+        else:
+            instance._counted = instance.counter_key()
+        if not instance.get_deferred_fields() & {'followup', 'is_public'}:
+            instance._followup_state = (instance.followup, instance.is_public)
+        if not instance.get_deferred_fields() & set(HASHED_FIELDS):
+            instance._hashed = instance.hashed_values()
+        return instance
+
     followup = models.BooleanField(blank=True, default=False,
                                    help_text=_("Notify follow-up comments"))
+
+    # Feedback counters, kept up to date when flags are added or removed.
+    likes = models.PositiveIntegerField(default=0, db_index=True)
+    dislikes = models.PositiveIntegerField(default=0)
+    reports = models.PositiveIntegerField(default=0)
+
+    # Fingerprint of the object, author and body, to find duplicate posts.
+    content_hash = models.CharField(max_length=64, blank=True, default='',
+                                    editable=False)
+
     objects = CommentManager()
 
+    class Meta(MP_Node.Meta):
+        indexes = [
+            models.Index(fields=['content_hash', 'submit_date']),
+            # Comments to an object, by date or in thread order.
+            models.Index(fields=['assoc', 'is_public', 'submit_date'],
+                         name='treecomment_assoc_public_idx'),
+            models.Index(fields=['assoc', 'path'],
+                         name='treecomment_assoc_path_idx'),
+            # Only the comments in the moderation queue.
+            models.Index(fields=['submit_date'],
+                         condition=Q(is_public=False, is_removed=False),
+                         name='treecomment_moderation_idx'),
+        ]
+
     def add_child(self, *args, comment=None, **kwargs):
         """
         Add a new comment.
@@ -381,9 +614,66 @@ class TreeComment(MP_Node, CommentAbstractModel):
 
     def save(self, *args, **kwargs):
         """
-        Save a TreeComment
+        Save a TreeComment, and update the counters of its association when
+        the comment is created or changes between public, removed and in
+        moderation. Saving an existing comment sets its updated_on.
         """
+        if not self._state.adding:
+            self.updated_on = timezone.now()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'updated_on' not in update_fields:
+                kwargs['update_fields'] = list(update_fields) + ['updated_on']
+
+        if self._state.adding and not self.content_hash and self.depth > 1:
+            self.content_hash = self.fingerprint()
+        elif self.was_edited():
+            # The comment was edited, find_duplicate matches the new text.
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                self.content_hash = self.fingerprint()
+            elif set(update_fields) & set(HASHED_FIELDS):
+                self.content_hash = self.fingerprint()
+                kwargs['update_fields'] = list(update_fields) + ['content_hash']
+
+        counted = self._counted
+        if counted is NOT_LOADED:
+            stored = TreeComment.objects.filter(pk=self.pk).values(
+                'assoc_id', 'depth', 'is_public', 'is_removed').first()
+            counted = TreeComment(**stored).counter_key() if stored else None
         super().save(*args, **kwargs)
+        self._hashed = self.hashed_values()
+        current = self.counter_key()
+        if current != counted:
+            update_counters(removed=counted, added=current)
+        self._counted = current
+
+    def hashed_values(self):
+        """ Return the values of the comment the content_hash depends on """
+        return (self.user_name, self.user_email, self.comment.raw)
+
+    def was_edited(self):
+        """ Whether the values of the content_hash changed since loaded """
+        if self._state.adding or self.depth <= 1 or self._hashed is None:
+            return False
+        return self.hashed_values() != self._hashed
+
+    def fingerprint(self):
+        """ Return the content_hash of the comment, '' if it has no assoc """
+        if self.assoc_id is None:
+            return ''
+        assoc = self.assoc
+        return content_fingerprint(assoc.content_type_id, assoc.object_id,
+                                   assoc.site_id, self.user_name,
+                                   self.user_email, self.comment.raw)
+
+    def counter_key(self):
+        """
+        Return the (assoc_id, counter) pair this comment is accounted for,
+        or None for root nodes and comments without association.
+        """
+        if self.depth is None or self.depth <= 1 or self.assoc_id is None:
+            return None
+        return self.assoc_id, counter_for(self.is_public, self.is_removed)
 
     def update_assoc(self):
         """ Set or update the assoc value """
@@ -467,6 +757,18 @@ class TreeComment(MP_Node, CommentAbstractModel):
 
         return None
 
+    @classmethod
+    def parent_ids(cls, comments):
+        """
+        Return a dict with the parent id of each one of the given comments,
+        0 for top level comments. Parents are found with a single query.
+        """
+        parent_paths = {c.pk: cls._get_parent_path_from_path(c.path)
+                        for c in comments if c.depth > 2}
+        qs = cls.objects.filter(path__in=set(parent_paths.values()))
+        ids = dict(qs.values_list('path', 'pk')) if parent_paths else {}
+        return {c.pk: ids.get(parent_paths.get(c.pk), 0) for c in comments}
+
     @classmethod
     def structured_tree_data_for_queryset(cls, queryset, annotate_cb=None):
         """
@@ -478,60 +780,44 @@ class TreeComment(MP_Node, CommentAbstractModel):
         :return:
         """
 
-        # Build a path lookup table
-        # Faster than using node.get_parent(), which can cause another query
-        path_to_node = {c.path: c for c in queryset}
-
-        def parent_id_for(cnode):
-            basepath = cnode._get_basepath(cnode.path, cnode.depth - 1)
-            if basepath in path_to_node:
-                return path_to_node.get(basepath).id
-            return None
+        # Evaluate the queryset exactly once. Every node is reached through
+        # the path lookup table, so a single pass is enough to link each
+        # node to its parent, faster than node.get_parent() or a scan
+        # of the table per node.
+        nodes = list(queryset)
+        path_to_node = {c.path: c for c in nodes}
 
-        # Now I can build the data structure directly
         flat_data = []
-        by_id = {}
-        details_by_id = {}  # Store data that I don't want to send to client
-        for c in queryset:
+        by_path = {}
+        for c in nodes:
+            parent_path = cls._get_parent_path_from_path(c.path)
+            parent = path_to_node.get(parent_path)
             data = get_structured_data_class()(
                 id=c.id,
                 comment=c.comment.raw,
                 comment_rendered=c.comment.rendered,
-                parent_id=parent_id_for(c),
+                likes=c.likes,
+                dislikes=c.dislikes,
+                parent_id=parent.id if parent else None,
                 depth=c.depth - 1,
             )
 
             if annotate_cb:
                 data = annotate_cb(c, data)
             flat_data.append(data)
-            by_id[c.id] = data
-            details_by_id[c.id] = {
-                'path': c.path,
-                'depth': c.depth,
-            }
+            by_path[c.path] = data
 
-        if queryset.count() == 0:
-            return {'comments': []}
-
-        # Now, build the tree structure... a bit trickier
-        steplen = queryset[0].steplen
-
-        def get_child_ids(node):
-            details = details_by_id.get(node.id)
-            path = details.get("path")
-            depth = details.get("depth")
-            keys = [k for k in path_to_node.keys()
-                    if (not path or k.startswith(path))
-                    and len(k) / steplen == depth + 1]
-
-            return [path_to_node[k].id for k in keys]
-
-        for node in flat_data:
-            node.children = get_child_ids(node)
+        # Children are listed in queryset order, as they were before.
+        for c in nodes:
+            parent_data = by_path.get(cls._get_parent_path_from_path(c.path))
+            if parent_data is not None:
+                parent_data.children.append(c.id)
 
         return {'comments': flat_data}
 
     @classmethod
+    @instrumentation.instrumented('structured_tree_data',
+                                  size=lambda data: len(data['comments']))
     def structured_tree_data(cls, root,
                              filter_public=True,
                              start=None,
@@ -540,21 +826,30 @@ class TreeComment(MP_Node, CommentAbstractModel):
         """
         Return a recursive structure with comments and their children,
         starting at the given root.
+
+        When COMMENTS_TREE_CACHE_BACKEND is set, the result for the whole
+        thread (no start or end) is cached until the thread changes.
         """
-        nodes = root.get_descendants().order_by('submit_date')
+        def build():
+            nodes = root.get_descendants().order_by('submit_date')
 
-        if filter_public:
-            nodes = nodes.filter(is_public=True)
+            if filter_public:
+                nodes = nodes.filter(is_public=True)
 
-        flt = Q()
-        if start:
-            flt = flt & Q(updated_on__gt=start)
-        if end:
-            flt = flt & Q(updated_on__lt=end)
+            flt = Q()
+            if start:
+                flt = flt & Q(updated_on__gt=start)
+            if end:
+                flt = flt & Q(updated_on__lt=end)
 
-        nodes = nodes.filter(flt)
+            nodes = nodes.filter(flt)
 
-        return TreeComment.structured_tree_data_for_queryset(nodes)
+            return TreeComment.structured_tree_data_for_queryset(nodes)
+
+        if start or end:
+            return build()
+        return cache.get_or_set_thread_value(root.pk, 'structured_tree_data',
+                                             (filter_public,), build)
 
     @classmethod
     def tree_from_comment(cls, root,
@@ -565,38 +860,138 @@ class TreeComment(MP_Node, CommentAbstractModel):
         """
         Return a recursive structure with comments and their children,
         starting at the given root.
+
+        All the descendants are fetched with a single query, and the nested
+        structure is built in memory. A comment whose parent is filtered
+        out is left out of the tree, together with its own replies.
+
+        :param filter_public: Only include public comments.
+        :param start: Only include comments updated after this time.
+        :param end: Only include comments updated before this time.
+        :param max_depth: Number of levels to include below the root.
+        :return: list of {"comment": <TreeComment>, "children": [...]}
         """
-        print(f"Current Depth: {root.depth}")
-        retval = []
-        children = root.get_children().order_by('submit_date')
+        nodes = cls.objects.filter(
+            path__startswith=root.path, depth__gt=root.depth).select_related(
+                'assoc__content_type', 'user')
         if filter_public:
-            children = children.filter(is_public=True)
-
+            nodes = nodes.filter(is_public=True)
         if start:
-            time_range = Q(updated_on__gt=start)
-            if end:
-                time_range = time_range & Q(updated_on__lt=end)
-            children = children.filter(time_range)
-        for child in children:
-            if (child.numchild > 0
-                    and (max_depth is None or root.depth > max_depth)):
-                my_children = cls.tree_from_comment(
-                    child,
-                    filter_public=filter_public,
-                    start=start,
-                    end=end,
-                    max_depth=max_depth
-                )
-            else:
-                my_children = []
-            data = {
-                "comment": child,
-                "children": my_children
-            }
+            nodes = nodes.filter(updated_on__gt=start)
+        if end:
+            nodes = nodes.filter(updated_on__lt=end)
+        if max_depth is not None:
+            nodes = nodes.filter(depth__lte=root.depth + max_depth)
+        nodes = nodes.order_by('submit_date', 'path')
+
+        entries = {}
+        ordered = []
+        for node in nodes:
+            entry = {"comment": node, "children": []}
+            entries[node.path] = entry
+            ordered.append(entry)
 
-            retval.append(data)
+        retval = []
+        for entry in ordered:
+            node = entry["comment"]
+            if node.depth == root.depth + 1:
+                retval.append(entry)
+            else:
+                parent = entries.get(cls._get_parent_path_from_path(node.path))
+                if parent is not None:
+                    parent["children"].append(entry)
         return retval
 
+    @classmethod
+    def tree_slice(cls, parent, limit, reply_limit=0, after=None,
+                   filter_public=True):
+        """
+        Return a slice of the replies to the given comment or root: `limit`
+        of them, after the reply with path `after` if given, each with its
+        first `reply_limit` replies, and so on down the thread.
+
+        The replies to the parent are read with a range query on the path,
+        and every level below with a single query for the replies under
+        each node that have fewer than `reply_limit` earlier siblings, so
+        only the comments returned are read. Siblings are ranked by path,
+        as steps left by deleted replies are never reused.
+
+        :return: (tree, remaining) where tree is a list of {"comment",
+        "children", "remaining"} dicts, with "remaining" the number of
+        replies to the comment left out of its children, and remaining the
+        number of replies to the parent left out of the tree. Only the
+        replies that can be returned, the public ones, are counted.
+        """
+        def public(qs):
+            return qs.filter(is_public=True) if filter_public else qs
+
+        def with_replies(qs, depth):
+            # Number of public replies to each comment: the comments one
+            # level deeper between its path and its last possible child.
+            replies = public(cls.objects.filter(
+                depth=depth + 1, path__gt=OuterRef('path'),
+                path__lte=Concat(OuterRef('path'),
+                                 Value(cls.alphabet[-1] * cls.steplen))))
+            replies = replies.order_by().values('depth').annotate(
+                count=Count('pk')).values('count')
+            return qs.annotate(replies=Coalesce(Subquery(
+                replies, output_field=models.IntegerField()), 0))
+
+        children = public(cls.objects.filter(path__startswith=parent.path,
+                                             depth=parent.depth + 1))
+        top = with_replies(children, parent.depth + 1).order_by('path')
+        if after is not None:
+            top = top.filter(path__gt=after)
+        top = list(top[:limit])
+        if len(top) < limit:
+            remaining = 0
+        else:
+            last = top[-1].path if top else after
+            later = children.filter(path__gt=last) if last else children
+            remaining = later.count()
+
+        tree = [{"comment": c, "children": [], "remaining": c.replies}
+                for c in top]
+        level = tree
+        while level and reply_limit:
+            entries = {entry["comment"].path: entry for entry in level}
+            parents = [path for path, entry in entries.items()
+                       if entry["remaining"]]
+            if not parents:
+                break
+            depth = level[0]["comment"].depth + 1
+            parent_len = (depth - 1) * cls.steplen
+            # Number of earlier siblings of a reply: the replies at the same
+            # depth between the path of its parent and its own path.
+            earlier = public(cls.objects.filter(
+                depth=depth, path__lt=OuterRef('path'),
+                path__gt=Substr(OuterRef('path'), 1, parent_len)))
+            earlier = earlier.order_by().values('depth').annotate(
+                count=Count('pk')).values('count')
+            replies = []
+            # Bounded, as backends limit the size of a query.
+            for start in range(0, len(parents), 500):
+                under = Q()
+                for path in parents[start:start + 500]:
+                    under |= Q(path__startswith=path)
+                replies.extend(with_replies(public(cls.objects.filter(
+                    under, depth=depth)), depth).annotate(
+                    rank=Coalesce(Subquery(
+                        earlier, output_field=models.IntegerField()), 0)
+                ).filter(rank__lt=reply_limit))
+            replies.sort(key=lambda c: c.path)
+
+            level = []
+            for reply in replies:
+                entry = {"comment": reply, "children": [],
+                         "remaining": reply.replies}
+                parent_entry = entries[cls._get_parent_path_from_path(
+                    reply.path)]
+                parent_entry["children"].append(entry)
+                parent_entry["remaining"] -= 1
+                level.append(entry)
+        return tree, remaining
+
     @classmethod
     def tree_for_associated_object(cls, obj,
                                    with_flagging=False,
@@ -611,10 +1006,47 @@ class TreeComment(MP_Node, CommentAbstractModel):
         return [obj.user for obj in self.flags.filter(flag=flag)]
 
 
+NOT_LOADED = object()
+
+# Fields of the comment the content_hash depends on, with its association.
+HASHED_FIELDS = ('user_name', 'user_email', 'comment')
+
+
+def update_counters(removed=None, added=None):
+    """
+    Move a comment between association counters with F() expressions.
+
+    :param removed: (assoc_id, counter) the comment no longer adds to.
+    :param added: (assoc_id, counter) the comment adds to now.
+    """
+    deltas = defaultdict(Counter)
+    if removed:
+        deltas[removed[0]]['total_count'] -= 1
+        deltas[removed[0]][removed[1]] -= 1
+    if added:
+        deltas[added[0]]['total_count'] += 1
+        deltas[added[0]][added[1]] += 1
+    for assoc_id, fields in deltas.items():
+        changes = {name: F(name) + delta
+                   for name, delta in fields.items() if delta}
+        if changes:
+            CommentAssociation.objects.filter(pk=assoc_id).update(**changes)
+
+
+@receiver(post_delete, sender=TreeComment)
+def update_counters_on_delete(sender, instance, **kwargs):
+    # Deleted comments are always fetched in full, so _counted is known.
+    if instance._counted is not NOT_LOADED:
+        update_counters(removed=instance._counted)
+
+
 @receiver(comment_was_flagged)
 def unpublish_nested_comments_on_removal_flag(sender, comment, flag, **kwargs):
     if flag.flag == TreeCommentFlag.MODERATOR_DELETION:
-        comment.get_descendants().update(is_public=False)
+        comment.get_descendants().update(is_public=False,
+                                         updated_on=timezone.now())
+        if comment.assoc_id:
+            comment.assoc.recount()
 
 
 class DummyDefaultManager:
@@ -654,6 +1086,12 @@ class TmpTreeComment(dict):
     def save(self, *args, **kwargs):
         pass
 
+    def fingerprint(self):
+        """ Return the content_hash the comment will be stored with """
+        return content_fingerprint(self.content_type.pk, self.object_id,
+                                   self.site_id, self.user_name,
+                                   self.user_email, self['comment'])
+
     def _get_pk_val(self):
         if self.tree_comment:
             return self.tree_comment._get_pk_val()
@@ -737,6 +1175,8 @@ class TreeCommentFlag(models.Model):
 
     class Meta:
         unique_together = [('user', 'comment', 'flag')]
+        indexes = [models.Index(fields=['comment', 'flag'],
+                                name='treecommentflag_comment_idx')]
         verbose_name = _('comment flag')
         verbose_name_plural = _('comment flags')
 
@@ -749,3 +1189,256 @@ class TreeCommentFlag(models.Model):
         if self.flag_date is None:
             self.flag_date = timezone.now()
         super().save(*args, **kwargs)
+
+
+class FollowupNotification(models.Model):
+    """
+    Outbox of the follow-up notifications of new comments.
+
+    Posting a comment only adds a row here when
+    COMMENTS_TREE_FOLLOWUP_OUTBOX is enabled. The send_followup_notifications
+    management command sends the emails to the followers of the thread and
+    records when it did so.
+    """
+    comment = models.ForeignKey(TreeComment,
+                                verbose_name=_('comment'),
+                                related_name="followup_notifications",
+                                on_delete=models.CASCADE)
+    created_on = models.DateTimeField(_('created on'), auto_now_add=True)
+    sent_on = models.DateTimeField(_('sent on'), null=True, blank=True,
+                                   db_index=True)
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = _('follow-up notification')
+        verbose_name_plural = _('follow-up notifications')
+
+    def __str__(self):
+        return "Follow-up notification of comment ID %s" % self.comment_id
+
+
+class ThreadSubscription(models.Model):
+    """
+    Email address following the comments posted to a thread.
+
+    Rows are added when a public comment with follow-up enabled is saved,
+    and removed when the follower mutes the thread.
+    """
+    assoc = models.ForeignKey(CommentAssociation,
+                              verbose_name=_('association'),
+                              related_name="subscriptions",
+                              on_delete=models.CASCADE)
+    user_email = models.EmailField(_("user's email address"), max_length=254)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             verbose_name=_('user'),
+                             related_name="thread_subscriptions",
+                             null=True, blank=True,
+                             on_delete=models.SET_NULL)
+    # The first comment of the follower, signed in the mute link. When it
+    # is deleted the subscription moves to their next comment.
+    comment = models.ForeignKey(TreeComment,
+                                verbose_name=_('comment'),
+                                related_name="thread_subscriptions",
+                                null=True, blank=True,
+                                on_delete=models.SET_NULL)
+    created_on = models.DateTimeField(_('created on'), auto_now_add=True)
+
+    class Meta:
+        unique_together = [('assoc', 'user_email')]
+        verbose_name = _('thread subscription')
+        verbose_name_plural = _('thread subscriptions')
+
+    def __str__(self):
+        return "%s follows thread of association ID %s" % (
+            self.user_email, self.assoc_id)
+
+    @classmethod
+    def subscribe(cls, comments):
+        """
+        Subscribe the authors of the public comments with follow-up enabled
+        among the given ones to their threads. Existing subscriptions are
+        kept as they are, so they point to the first comment of the follower.
+        """
+        subscriptions = [
+            cls(assoc_id=c.assoc_id, user_email=c.user_email,
+                user_id=c.user_id, comment_id=c.pk)
+            for c in comments
+            if all([c.followup, c.is_public, c.user_email,
+                    c.assoc_id is not None, (c.depth or 0) > 1])]
+        if subscriptions:
+            cls.objects.bulk_create(subscriptions, ignore_conflicts=True)
+
+    @classmethod
+    def move_to_next_comment(cls, assoc_id, user_email):
+        """
+        Point the subscription that lost its comment to the next public
+        comment with follow-up enabled of the follower in the thread, the
+        one the mute link needs, or remove it if there is none left.
+        """
+        qs = cls.objects.filter(assoc_id=assoc_id, user_email=user_email,
+                                comment__isnull=True)
+        next_comment = TreeComment.objects.filter(
+            assoc_id=assoc_id, user_email=user_email, depth__gt=1,
+            followup=True, is_public=True, is_removed=False).order_by(
+            'pk').values_list('pk', flat=True).first()
+        if next_comment is None:
+            qs.delete()
+        else:
+            qs.update(comment_id=next_comment)
+
+    @classmethod
+    def unsubscribe(cls, assoc_id, user_email):
+        """ Remove the subscription, and the follow-up of the comments """
+        cls.objects.filter(assoc_id=assoc_id, user_email=user_email).delete()
+        TreeComment.objects.filter(assoc_id=assoc_id, user_email=user_email,
+                                   followup=True).update(followup=False)
+
+
+# ----------------------------------------------------------------------
+def thread_root_id(comment):
+    """ Return the id of the root of the thread the comment belongs to """
+    if isinstance(comment, TmpTreeComment):
+        if comment.tree_comment is None:
+            qs = CommentAssociation.objects.filter(
+                content_type=comment.content_type,
+                object_id=comment.object_id,
+                site_id=comment.site_id)
+            return qs.values_list('root_id', flat=True).first()
+        comment = comment.tree_comment
+    if comment.is_root():
+        return comment.pk
+    qs = TreeComment.objects.filter(path=comment.path[:comment.steplen])
+    return qs.values_list('pk', flat=True).first()
+
+
+def thread_root_ids(comment_ids):
+    """ Return the ids of the roots of the threads of the given comments """
+    steplen = TreeComment.steplen
+    paths = TreeComment.objects.filter(pk__in=comment_ids).values_list(
+        'path', flat=True)
+    root_paths = {path[:steplen] for path in paths}
+    return list(TreeComment.objects.filter(path__in=root_paths)
+                .values_list('pk', flat=True))
+
+
+@receiver(comment_was_posted)
+@receiver(confirmation_received)
+@receiver(comment_was_flagged)
+@receiver(comment_feedback_toggled)
+def invalidate_thread_cache(sender, comment, **kwargs):
+    if cache.get_cache() is not None:
+        cache.invalidate_thread(thread_root_id(comment))
+
+
+@receiver(comments_were_flagged)
+def invalidate_thread_caches(sender, comment_ids, **kwargs):
+    if cache.get_cache() is not None:
+        for root_id in thread_root_ids(comment_ids):
+            cache.invalidate_thread(root_id)
+
+
+@receiver(post_save, sender=TreeComment)
+@receiver(post_delete, sender=TreeComment)
+def invalidate_thread_cache_on_change(sender, instance, **kwargs):
+    if cache.get_cache() is not None:
+        cache.invalidate_thread(thread_root_id(instance))
+
+
+@receiver(post_save, sender=TreeComment)
+def subscribe_follower(sender, instance, created, **kwargs):
+    # Only new comments, and comments whose follow-up or publication
+    # changed, can add a subscription.
+    state = (instance.followup, instance.is_public)
+    if instance.followup and (created or instance._followup_state != state):
+        ThreadSubscription.subscribe([instance])
+    instance._followup_state = state
+
+
+@receiver(post_delete, sender=TreeComment)
+def move_subscriptions(sender, instance, **kwargs):
+    if instance.assoc_id is not None and instance.user_email:
+        ThreadSubscription.move_to_next_comment(instance.assoc_id,
+                                                instance.user_email)
+
+
+@receiver(comments_were_flagged)
+def subscribe_approved_followers(sender, comment_ids, flag, **kwargs):
+    if flag == TreeCommentFlag.MODERATOR_APPROVAL:
+        ThreadSubscription.subscribe(
+            TreeComment.objects.filter(pk__in=comment_ids, followup=True)
+            .only('assoc', 'user', 'user_email', 'followup', 'is_public',
+                  'depth'))
+
+
+@receiver(post_delete, sender=CommentAssociation)
+def forget_cached_root(sender, instance, **kwargs):
+    cache.forget_root(instance.content_type_id, instance.object_id,
+                      instance.site_id)
+
+
+# ----------------------------------------------------------------------
+def feedback_counter_for(flag):
+    """ Return the TreeComment counter of the given flag, if any """
+    return {
+        LIKEDIT_FLAG: 'likes',
+        DISLIKEDIT_FLAG: 'dislikes',
+        TreeCommentFlag.SUGGEST_REMOVAL: 'reports',
+    }.get(flag)
+
+
+@receiver(post_save, sender=TreeCommentFlag)
+def increment_feedback_counter(sender, instance, created, **kwargs):
+    counter = feedback_counter_for(instance.flag)
+    if created and counter:
+        TreeComment.objects.filter(pk=instance.comment_id).update(
+            **{counter: F(counter) + 1})
+
+
+@receiver(post_delete, sender=TreeCommentFlag)
+def decrement_feedback_counter(sender, instance, **kwargs):
+    counter = feedback_counter_for(instance.flag)
+    if counter:
+        TreeComment.objects.filter(pk=instance.comment_id,
+                                   **{counter + '__gt': 0}).update(
+            **{counter: F(counter) - 1})
+
+
+# ----------------------------------------------------------------------
+@receiver(confirmation_received)
+def publish_posted_event(sender, comment, **kwargs):
+    # Sent before the comment exists by the confirm view, which publishes
+    # the event itself once the comment is created.
+    comment = getattr(comment, 'tree_comment', comment)
+    if isinstance(comment, TreeComment) and comment.is_public:
+        events.publish_comment_event(events.POSTED, comment)
+
+
+FLAG_EVENTS = {
+    TreeCommentFlag.SUGGEST_REMOVAL: events.FLAGGED,
+    TreeCommentFlag.MODERATOR_DELETION: events.REMOVED,
+    TreeCommentFlag.MODERATOR_APPROVAL: events.APPROVED,
+}
+
+
+@receiver(comment_was_flagged)
+def publish_flag_event(sender, comment, flag, created, **kwargs):
+    kind = FLAG_EVENTS.get(flag.flag)
+    if created and kind:
+        events.publish_comment_event(kind, comment)
+
+
+@receiver(comments_were_flagged)
+def publish_flag_events(sender, flag, created_ids, **kwargs):
+    kind = FLAG_EVENTS.get(flag)
+    if created_ids and kind and events.get_broker() is not None:
+        qs = TreeComment.objects.filter(pk__in=created_ids).only('assoc')
+        for comment in qs.order_by('pk'):
+            events.publish_comment_event(kind, comment)
+
+
+@receiver(post_save, sender=BlackListedDomain)
+@receiver(post_delete, sender=BlackListedDomain)
+def invalidate_blocklist(sender, **kwargs):
+    # After the commit, or other processes could load the old rows again
+    # and keep them under the new version.
+    transaction.on_commit(blocklist.invalidate)
@@ -75,7 +75,8 @@ from django_comments_tree.signals import (comment_will_be_posted,
 from django_comments_tree.models import TreeCommentFlag
 
 from django_comments_tree.conf import settings
-from django_comments_tree.models import BlackListedDomain, TmpTreeComment
+from django_comments_tree import blocklist
+from django_comments_tree.models import TmpTreeComment
 from django_comments_tree.signals import confirmation_received
 from django_comments_tree.utils import send_mail
 
@@ -340,6 +341,9 @@ class SpamModerator(TreeCommentModerator):
     ``SpamModerator`` uses the additional ``django_comments_tree`` model:
      * ``BlackListedDomain``
 
+    Subdomains of a blacklisted domain are discarded too. The domains are
+    kept in memory, see ``django_comments_tree.blocklist``.
+
     Remember to update the content regularly through an external Spam
     filtering service.
     """
@@ -350,7 +354,7 @@ class SpamModerator(TreeCommentModerator):
         except IndexError:
             return False
         else:
-            if (BlackListedDomain.objects.filter(domain=domain).count()):
+            if blocklist.get_blocklist().matches(domain):
                 return False
             return super().allow(comment, content_object,
                                  request)
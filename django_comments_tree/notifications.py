@@ -0,0 +1,105 @@
+"""
+Follow-up notifications, sent to the users following a comment thread when
+a new comment is posted to it.
+"""
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template import loader
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from django_comments_tree import signed
+from django_comments_tree.conf import settings
+from django_comments_tree.models import (FollowupNotification,
+                                         ThreadSubscription)
+
+
+def get_followers(comment):
+    """
+    Return the subscriptions of the users following the thread of the given
+    comment, with the comment that subscribed them, excluding the address
+    of its author.
+    """
+    if comment.assoc_id is None:
+        return ThreadSubscription.objects.none()
+    qs = ThreadSubscription.objects.filter(assoc_id=comment.assoc_id,
+                                           comment__isnull=False)
+    qs = qs.select_related('comment')
+    return qs.exclude(user_email=comment.user_email).order_by('pk')
+
+
+def get_templates():
+    """ Return the text and HTML (or None) follow-up email templates """
+    text = loader.get_template(
+        "django_comments_tree/email_followup_comment.txt")
+    html = None
+    if settings.COMMENTS_TREE_SEND_HTML_EMAIL:
+        html = loader.get_template(
+            "django_comments_tree/email_followup_comment.html")
+    return text, html
+
+
+def followup_messages(comment, templates=None):
+    """
+    Yield a (recipient, subject, text, html) tuple for every follower of
+    the thread of the comment.
+    """
+    text_template, html_template = templates or get_templates()
+    subject = _("new comment posted")
+    site = comment.site
+    for subscription in get_followers(comment):
+        follower = subscription.comment
+        key = signed.dumps(follower, compress=True,
+                           extra_key=settings.COMMENTS_TREE_SALT)
+        mute_url = reverse('comments-tree-mute', args=[key.decode('utf-8')])
+        context = {'user_name': follower.user_name,
+                   'comment': comment,
+                   'mute_url': mute_url,
+                   'site': site}
+        html = html_template.render(context) if html_template else None
+        yield (subscription.user_email, subject,
+               text_template.render(context), html)
+
+
+def queue_followup_notification(comment):
+    """ Add the comment to the outbox of follow-up notifications """
+    return FollowupNotification.objects.create(comment=comment)
+
+
+def send_followup_notifications(batch_size=100, connection=None):
+    """
+    Send the notifications of up to batch_size queued comments, over a
+    single mail connection. Return the number of comments processed and
+    of emails sent.
+
+    The queued rows are locked while they are sent, so several workers
+    can drain the outbox at once. If sending fails, the batch stays queued.
+    """
+    with transaction.atomic():
+        qs = FollowupNotification.objects.select_for_update(skip_locked=True)
+        batch = list(qs.filter(sent_on__isnull=True)
+                     .select_related('comment').order_by('pk')[:batch_size])
+        if not batch:
+            return 0, 0
+
+        templates = get_templates()
+        messages = []
+        for notification in batch:
+            comment = notification.comment
+            if not comment.is_public or comment.is_removed:
+                continue
+            for email, subject, text, html in followup_messages(comment,
+                                                                templates):
+                message = EmailMultiAlternatives(
+                    subject, text, settings.COMMENTS_TREE_FROM_EMAIL, [email])
+                if html:
+                    message.attach_alternative(html, "text/html")
+                messages.append(message)
+
+        if messages:
+            connection = connection or get_connection()
+            connection.send_messages(messages)
+        FollowupNotification.objects.filter(
+            pk__in=[n.pk for n in batch]).update(sent_on=timezone.now())
+    return len(batch), len(messages)
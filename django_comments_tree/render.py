@@ -1,5 +1,8 @@
 import json
+import threading
+from functools import lru_cache
 
+import markdown
 from draftjs_exporter import html as htmlexporter
 from draftjs_exporter.constants import BLOCK_TYPES, ENTITY_TYPES
 from draftjs_exporter.defaults import BLOCK_MAP
@@ -54,6 +57,27 @@ _config = {
 }
 
 
+# Number of rendered comment bodies kept by each cached renderer.
+RENDER_CACHE_SIZE = 1024
+
+# Renderers are expensive to build and not thread safe, so every thread
+# builds its own once and reuses it.
+_local = threading.local()
+
+
+def get_draftjs_renderer():
+    if not hasattr(_local, 'draftjs'):
+        _local.draftjs = htmlexporter.HTML(_config)
+    return _local.draftjs
+
+
+def get_markdown_renderer():
+    if not hasattr(_local, 'markdown'):
+        _local.markdown = markdown.Markdown()
+    return _local.markdown
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
 def render_draftjs(content_data):
     try:
         cstate = json.loads(content_data)
@@ -61,9 +85,16 @@ def render_draftjs(content_data):
         # invalid json data
         # Should log something...
         return ''
-    renderer = htmlexporter.HTML(_config)
-    html = renderer.render(cstate)
-    return html
+    return get_draftjs_renderer().render(cstate)
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_markdown(content_data):
+    renderer = get_markdown_renderer()
+    try:
+        return renderer.convert(content_data)
+    finally:
+        renderer.reset()
 
 
 def render_plain(content_data):
@@ -26,6 +26,17 @@ comment_was_posted = Signal(providing_args=["comment", "request"])
 # comment, or some other custom user flag.
 comment_was_flagged = Signal(providing_args=["comment", "flag", "created", "request"])
 
+# Sent once per batch of comments flagged, approved or removed at once, as
+# by the admin actions and the moderation method of the web API. `flag` is the
+# flag type, `comment_ids` the ids of the comments in the batch and
+# `created_ids` the ids of those the flag was added to.
+comments_were_flagged = Signal(
+    providing_args=["comment_ids", "flag", "created_ids", "request"])
+
+# Sent with each Measurement of an entry point, when
+# COMMENTS_TREE_INSTRUMENTATION is enabled.
+comments_measured = Signal(providing_args=["measurement"])
+
 # Sent after a comment is `Liked` or `Disliked`
 comment_feedback_toggled = Signal(
     providing_args=["flag", "comment", "created", "request"]
@@ -2,62 +2,198 @@
 Borrowed from Simon Willison's Django-OpenID project:
   * https://github.com/simonw/django-openid
 
-Functions for creating and restoring url-safe signed pickled objects.
+Functions for creating and restoring url-safe signed objects, used in the
+comment confirmation and mute URLs.
 
-The format used looks like this:
+Tokens are versioned. Version 2 tokens look like this:
 
 >>> signed.dumps("hello")
-'UydoZWxsbycKcDAKLg.AfZVu7tE6T1K1AecbLiLOGSqZ-A'
+b'v2.eyJrIjoiaiIsInRzIjoxNTcyMTc0NzY5LCJ2IjoiaGVsbG8ifQ.fbLJ8...'
 
-There are two components here, separatad by a '.'. The first component is a
-URLsafe base64 encoded pickle of the object passed to dumps(). The second
-component is a base64 encoded hmac/SHA1 hash of "$first_component.$secret"
+The 'v2.' prefix is followed by the URL-safe base64 encoded JSON payload and
+by the base64 encoded HMAC/SHA256 of both. The payload of comments only
+holds the fields needed to rebuild them (ids, natural keys, the comment
+fields and the time the token was issued). Related objects are loaded
+lazily, on first use, so decoding a token runs no queries.
 
-Calling signed.loads(s) checks the signature BEFORE unpickling the object -
-this protects against malformed pickle attacks. If the signature fails, a
-ValueError subclass is raised (actually a BadSignature):
+With compress=True the payload is compressed with zlib when that makes it
+shorter, which is signalled by a '.' at the start of the payload.
 
->>> signed.loads('UydoZWxsbycKcDAKLg.AfZVu7tE6T1K1AecbLiLOGSqZ-A')
-'hello'
->>> signed.loads('UydoZWxsbycKcDAKLg.AfZVu7tE6T1K1AecbLiLOGSqZ-A-modified')
-...
-BadSignature: Signature failed: AfZVu7tE6T1K1AecbLiLOGSqZ-A-modified
-
-You can optionally compress the pickle prior to base64 encoding it to save
-space, using the compress=True argument. This checks if compression actually
-helps and only applies compression if the result is a shorter string:
-
->>> signed.dumps(range(1, 10), compress=True)
-'.eJzTyCkw4PI05Er0NAJiYyA2AWJTIDYDYnMgtgBiS65EPQDQyQme.EQpzZCCMd3mIa4RXDGnAuMCCAx0'
-
-The fact that the string is compressed is signalled by the prefixed '.' at the
-start of the base64 pickle.
-
-There are 65 url-safe characters: the 64 used by url-safe base64 and the '.'.
-These functions make use of all of them.
+Version 1 tokens, made of a base64 encoded pickle and its HMAC/SHA1, were
+used before. They are still decoded, after checking their signature, so
+links already sent by email keep working.
 """
 from __future__ import unicode_literals
 
 import base64
+import hashlib
 import hmac
+import json
 import pickle
-import hashlib
+import time
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
 
 from django_comments_tree.conf import settings
 import six
 
 
+VERSION_PREFIX = b'v2.'
+
+# Short payload keys of the TmpTreeComment fields.
+TMP_COMMENT_FIELDS = {
+    'user_name': 'n',
+    'user_email': 'e',
+    'user_url': 'w',
+    'comment': 'c',
+    'submit_date': 'd',
+    'is_public': 'p',
+    'is_removed': 'r',
+    'followup': 'f',
+    'ip_address': 'i',
+}
+# Keys handled apart from the fields above, or never encoded.
+TMP_COMMENT_SPECIAL = ('content_type', 'content_object', 'object_id',
+                       'site_id', 'user', 'tree_comment')
+
+
+def _key(key, extra_key):
+    return (key or settings.SECRET_KEY.encode('ascii')) + extra_key
+
+
 def dumps(obj, key=None, compress=False, extra_key=b''):
     """
-    Returns URL-safe, sha1 signed base64 compressed pickle. If key is
+    Returns a URL-safe, HMAC/SHA256 signed version 2 token for obj: a
+    TreeComment, a TmpTreeComment or a JSON serializable value. If key is
     None, settings.SECRET_KEY is used instead.
 
     If compress is True (not the default) checks if compressing using zlib can
     save some space. Prepends a '.' to signify compression. This is included
     in the signature, to protect against zip bombs.
 
-    extra_key can be used to further salt the hash, in case you're worried
-    that the NSA might try to brute-force your SHA-1 protected secret.
+    extra_key can be used to further salt the hash.
+    """
+    payload = json.dumps(_to_payload(obj), separators=(',', ':'),
+                         cls=DjangoJSONEncoder).encode('utf-8')
+    is_compressed = False
+    if compress:
+        import zlib  # Avoid zlib dependency unless compress is being used
+        compressed = zlib.compress(payload)
+        if len(compressed) < (len(payload) - 1):
+            payload = compressed
+            is_compressed = True
+    value = VERSION_PREFIX + (b'.' if is_compressed else b'') + encode(payload)
+    return value + b'.' + base64_hmac(value, _key(key, extra_key),
+                                      hashlib.sha256)
+
+
+def loads(s, key=None, extra_key=b'', max_age=None):
+    """
+    Reverse of dumps(), raises BadSignature (a ValueError) if the signature
+    fails, and SignatureExpired if the version 2 token is older than max_age
+    seconds.
+    """
+    if isinstance(s, six.text_type):
+        s = s.encode('utf8')  # base64 works on bytestrings
+    if not s.startswith(VERSION_PREFIX):
+        return _loads_v1(s, key, extra_key)
+
+    value, sig = _split(s)
+    expected = base64_hmac(value, _key(key, extra_key), hashlib.sha256)
+    if not hmac.compare_digest(expected, sig):
+        raise BadSignature('Signature failed: %s' % sig)
+    payload = value[len(VERSION_PREFIX):]
+    if payload.startswith(b'.'):
+        import zlib
+        payload = zlib.decompress(decode(payload[1:]))
+    else:
+        payload = decode(payload)
+    try:
+        data = json.loads(payload.decode('utf-8'))
+    except ValueError:
+        raise BadSignature('Malformed payload')
+    if max_age is not None and time.time() - data.get('ts', 0) > max_age:
+        raise SignatureExpired('Signature age exceeds %s seconds' % max_age)
+    return _from_payload(data)
+
+
+def _to_payload(obj):
+    from django_comments_tree.models import TmpTreeComment, TreeComment
+
+    issued = int(time.time())
+    if isinstance(obj, TreeComment):
+        return {'k': 'c', 'ts': issued, 'id': obj.pk}
+    if not isinstance(obj, TmpTreeComment):
+        return {'k': 'j', 'ts': issued, 'v': obj}
+
+    data = {'k': 't', 'ts': issued,
+            'ct': list(obj['content_type'].natural_key()),
+            'o': obj['object_id'],
+            's': obj.get('site_id')}
+    if obj.get('user') is not None:
+        data['u'] = obj['user'].pk
+    extra = {}
+    for name, value in obj.items():
+        if name == 'submit_date' and value is not None:
+            # Keep the microseconds, DjangoJSONEncoder drops them.
+            data[TMP_COMMENT_FIELDS[name]] = value.isoformat()
+        elif name in TMP_COMMENT_FIELDS:
+            data[TMP_COMMENT_FIELDS[name]] = value
+        elif name not in TMP_COMMENT_SPECIAL:
+            extra[name] = value
+    if extra:
+        data['x'] = extra
+    return data
+
+
+def _from_payload(data):
+    from django.contrib.auth import get_user_model
+    from django.contrib.contenttypes.models import ContentType
+    from django_comments_tree import get_model
+    from django_comments_tree.models import TmpTreeComment
+
+    kind = data.get('k')
+    if kind == 'j':
+        return data['v']
+    if kind == 'c':
+        pk = data['id']
+        return SimpleLazyObject(lambda: get_model().objects.get(pk=pk))
+    if kind != 't':
+        raise BadSignature('Unknown payload kind %r' % kind)
+
+    # Content types are cached by their manager after the first lookup.
+    try:
+        ctype = ContentType.objects.get_by_natural_key(*data['ct'])
+    except ObjectDoesNotExist:
+        # The model was removed or renamed after the token was issued.
+        raise BadSignature('Unknown content type %r' % (data['ct'],))
+    object_id = data['o']
+    comment = TmpTreeComment(
+        content_type=ctype,
+        object_id=object_id,
+        site_id=data['s'],
+        content_object=SimpleLazyObject(
+            lambda: ctype.get_object_for_this_type(pk=object_id)))
+    if data.get('u') is not None:
+        user_pk = data['u']
+        comment['user'] = SimpleLazyObject(
+            lambda: get_user_model()._default_manager.get(pk=user_pk))
+    for name, short in TMP_COMMENT_FIELDS.items():
+        if short in data:
+            comment[name] = data[short]
+    if comment.get('submit_date'):
+        comment['submit_date'] = parse_datetime(comment['submit_date'])
+    comment.update(data.get('x', {}))
+    return comment
+
+
+def dumps_v1(obj, key=None, compress=False, extra_key=b''):
+    """
+    Returns URL-safe, sha1 signed base64 compressed pickle, the format of
+    version 1 tokens. Kept to test that old links still decode.
     """
     pickled = pickle.dumps(obj)
     is_compressed = False  # Flag for if it's been compressed or not
@@ -70,18 +206,11 @@ def dumps(obj, key=None, compress=False, extra_key=b''):
     base64d = encode(pickled).strip(b'=')
     if is_compressed:
         base64d = b'.' + base64d
-    return sign(base64d,
-                (key or settings.SECRET_KEY.encode('ascii')) + extra_key)
+    return sign(base64d, _key(key, extra_key))
 
 
-def loads(s, key=None, extra_key=b''):
-    "Reverse of dumps(), raises ValueError if signature fails"
-    if isinstance(s, six.text_type):
-        s = s.encode('utf8')  # base64 works on bytestrings
-    try:
-        base64d = unsign(s, (key or settings.SECRET_KEY.encode('ascii')) + extra_key)
-    except ValueError:
-        raise
+def _loads_v1(s, key=None, extra_key=b''):
+    base64d = unsign(s, _key(key, extra_key))
     decompress = False
     if base64d.startswith(b'.'):
         # It's compressed; uncompress it first
@@ -94,6 +223,12 @@ def loads(s, key=None, extra_key=b''):
     return pickle.loads(pickled)
 
 
+def _split(signed_value):
+    if signed_value.find(b'.') == -1:
+        raise BadSignature('Missing sig (no . found in value)')
+    return signed_value.rsplit(b'.', 1)
+
+
 def encode(s):
     return base64.urlsafe_b64encode(s).strip(b'=')
 
@@ -108,6 +243,10 @@ class BadSignature(ValueError):
     pass
 
 
+class SignatureExpired(BadSignature):
+    pass
+
+
 def sign(value, key=None):
     if isinstance(value, six.text_type):
         raise TypeError('sign() needs bytestring: %s' % repr(value))
@@ -121,14 +260,12 @@ def unsign(signed_value, key=None):
         raise TypeError('unsign() needs bytestring')
     if key is None:
         key = settings.SECRET_KEY.encode('ascii')
-    if signed_value.find(b'.') == -1:
-        raise BadSignature('Missing sig (no . found in value)')
-    value, sig = signed_value.rsplit(b'.', 1)
-    if base64_hmac(value, key) == sig:
+    value, sig = _split(signed_value)
+    if hmac.compare_digest(base64_hmac(value, key), sig):
         return value
     else:
         raise BadSignature('Signature failed: %s' % sig)
 
 
-def base64_hmac(value, key):
-    return encode(hmac.new(key, value, hashlib.sha1).digest())
+def base64_hmac(value, key, digestmod=hashlib.sha1):
+    return encode(hmac.new(key, value, digestmod).digest())
@@ -18,10 +18,13 @@ from django.contrib.sites.shortcuts import get_current_site
 from django.template import (Library, Node, TemplateSyntaxError,
                              Variable, loader)
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.utils.encoding import smart_text
+from django.utils.translation import get_language
 
-from django_comments_tree import get_model as get_comment_model
+from django_comments_tree import (cache, get_model as get_comment_model,
+                                  instrumentation)
 from django_comments_tree.conf import settings
 from django_comments_tree.api import frontend
 
@@ -41,12 +44,45 @@ class TreeCommentCountNode(Node):
     def __init__(self, as_varname, content_types):
         """Class method to parse get_treecomment_list and return a Node."""
         self.as_varname = as_varname
-        # ToDo: This returns None or a qs
-        self.qs = TreeComment.objects.for_content_types(content_types,
-                                                        site=settings.SITE_ID)
+        self.content_types = content_types
+
+    def render(self, context):
+        context[self.as_varname] = TreeComment.objects.count_for_content_types(
+            self.content_types, site=settings.SITE_ID)
+        return ''
+
+
+def _get_site_id(context):
+    # Explicit SITE_ID takes precedence over request. This is also how
+    # get_current_site operates.
+    site_id = getattr(settings, "SITE_ID", None)
+    if not site_id and ('request' in context):
+        site_id = get_current_site(context['request']).pk
+    return site_id
+
+
+class CommentCountsNode(Node):
+    """Store the number of comments of every object of a list"""
+
+    def __init__(self, object_list_expr, as_varname):
+        self.object_list_expr = object_list_expr
+        self.as_varname = as_varname
 
     def render(self, context):
-        context[self.as_varname] = self.qs.count()
+        objects = self.object_list_expr.resolve(context, ignore_failures=True)
+        site_id = _get_site_id(context)
+        by_model = {}
+        for obj in objects or []:
+            by_model.setdefault(type(obj), []).append(obj)
+        counts = {}
+        # One query per model, whatever the number of objects.
+        for model, instances in by_model.items():
+            content_type = ContentType.objects.get_for_model(model)
+            model_counts = TreeComment.objects.count_for_objects(
+                [obj.pk for obj in instances], content_type, site=site_id)
+            for obj in instances:
+                counts[obj] = model_counts[obj.pk]
+        context[self.as_varname] = counts
         return ''
 
 
@@ -56,16 +92,29 @@ class CommentCountNode(CountNode):
                  as_varname=None, comment=None):
         super().__init__(ctype, object_pk_expr, object_expr, as_varname, comment)
 
+    def render(self, context):
+        if not getattr(settings, 'COMMENTS_HIDE_REMOVED', True):
+            return super().render(context)
+
+        # Public comments that are not removed are counted in the
+        # association of the object, no need to count the comments.
+        ctype, object_pk = self.get_target_ctype_pk(context)
+        if not object_pk:
+            context[self.as_varname] = 0
+        else:
+            context[self.as_varname] = self.comment_model.objects.count_for_object(
+                smart_text(object_pk), ctype, site=self.get_site_id(context))
+        return ''
+
+    def get_site_id(self, context):
+        return _get_site_id(context)
+
     def get_queryset(self, context):
         ctype, object_pk = self.get_target_ctype_pk(context)
         if not object_pk:
             return self.comment_model.objects.none()
 
-        # Explicit SITE_ID takes precedence over request. This is also how
-        # get_current_site operates.
-        site_id = getattr(settings, "SITE_ID", None)
-        if not site_id and ('request' in context):
-            site_id = get_current_site(context['request']).pk
+        site_id = self.get_site_id(context)
 
         # get comments for the given `object_pk`
         qs = self.comment_model.objects.for_object(smart_text(object_pk), ctype, site=site_id)
@@ -116,6 +165,42 @@ def get_treecomment_count(parser, token):
     return TreeCommentCountNode(as_varname, content_types)
 
 
+@register.tag
+def get_comment_counts(parser, token):
+    """
+    Gets the comment count of every object of a list with one query per
+    model, and populates the template context with a dict of the counts by
+    object, whose name is defined by the 'as' clause. Read the count of an
+    object with the ``comment_count_for`` filter.
+
+    Syntax::
+
+        {% get_comment_counts for [object_list] as [varname] %}
+
+    Example usage::
+
+        {% get_comment_counts for article_list as comment_counts %}
+        {% for article in article_list %}
+          {{ comment_counts|comment_count_for:article }}
+        {% endfor %}
+
+    """
+    tokens = token.split_contents()
+    if len(tokens) != 5 or tokens[1] != 'for' or tokens[3] != 'as':
+        raise TemplateSyntaxError("%r tag syntax is: %r for [object_list] "
+                                  "as [varname]" % (tokens[0], tokens[0]))
+    return CommentCountsNode(parser.compile_filter(tokens[2]), tokens[4])
+
+
+@register.filter
+def comment_count_for(counts, obj):
+    """ Return the count of obj in the dict of get_comment_counts """
+    try:
+        return counts.get(obj, 0)
+    except AttributeError:
+        return 0
+
+
 # ----------------------------------------------------------------------
 class BaseLastTreeCommentsNode(Node):
     """Base class to deal with the last N TreeComments for a list of app.model"""
@@ -279,13 +364,16 @@ def get_last_treecomments(parser, token):
 # ----------------------------------------------------------------------
 class RenderTreeCommentTreeNode(Node):
     def __init__(self, obj, cvars, allow_feedback=False, show_feedback=False,
-                 allow_flagging=False, template_path=None):
+                 allow_flagging=False, template_path=None, limit=None,
+                 reply_limit=None):
         self.obj = Variable(obj) if obj else None
         self.cvars = self.parse_cvars(cvars)
         self.allow_feedback = allow_feedback
         self.show_feedback = show_feedback
         self.allow_flagging = allow_flagging
         self.template_path = template_path
+        self.limit = limit
+        self.reply_limit = reply_limit
 
     def parse_cvars(self, pairs):
         cvars = []
@@ -294,6 +382,32 @@ class RenderTreeCommentTreeNode(Node):
         return cvars
 
     def render(self, context):
+        with instrumentation.measure('render_tree'):
+            if self.obj and not self.cvars and cache.get_cache() is not None:
+                obj = self.obj.resolve(context)
+                root_id, _ = TreeComment.objects.get_root_ids(obj, create=True)
+                return cache.get_or_set_thread_value(
+                    root_id, 'rendered_tree', self.get_variant(context),
+                    lambda: self.render_tree(context))
+            return self.render_tree(context)
+
+    def get_variant(self, context):
+        """
+        Everything, besides the thread, the rendered HTML depends on.
+        """
+        perms = context.get('perms')
+        is_moderator = perms is not None and 'comments.can_moderate' in perms
+        return (
+            self.template_path,
+            tuple(bool(getattr(self, attr, False) or context.get(attr, False))
+                  for attr in ['allow_flagging', 'allow_feedback', 'show_feedback']),
+            is_moderator,
+            (self.limit, self.reply_limit),
+            get_language(),
+            timezone.get_current_timezone_name(),
+        )
+
+    def render_tree(self, context):
         context_dict = context.flatten()
         for attr in ['allow_flagging', 'allow_feedback', 'show_feedback']:
             context_dict[attr] = (getattr(self, attr, False) or context.get(attr, False))
@@ -306,17 +420,30 @@ class RenderTreeCommentTreeNode(Node):
             #                                       site__pk=settings.SITE_ID,
             #                                       is_public=True)
 
-            ctree = TreeComment.tree_for_associated_object(obj,
-                                                           with_flagging=self.allow_flagging,
-                                                           with_feedback=self.allow_feedback,
-                                                           user=context['user']
-                                                           )
+            if self.limit is None:
+                ctree = TreeComment.tree_for_associated_object(obj,
+                                                               with_flagging=self.allow_flagging,
+                                                               with_feedback=self.allow_feedback,
+                                                               user=context['user']
+                                                               )
+                remaining = 0
+            else:
+                root = TreeComment.objects.get_or_create_root(obj)
+                ctree, remaining = TreeComment.tree_slice(
+                    root, self.limit, self.reply_limit or 0)
+                context_dict['comments_root'] = root
 
             context_dict['comments'] = ctree
+            context_dict['comments_remaining'] = remaining
+            if settings.COMMENTS_TREE_INSTRUMENTATION:
+                instrumentation.record_size(instrumentation.tree_size(ctree))
         if self.cvars:
             for vname, vobj in self.cvars:
                 context_dict[vname] = vobj.resolve(context)
         if not self.obj:
+            # Replies left out are linked from their parent, not here.
+            context_dict['comments_remaining'] = 0
+
             # Then presume 'comments' exists in the context.
             try:
                 ctype = context['comments'][0]['comment'].content_type
@@ -369,12 +496,17 @@ def render_treecomment_tree(parser, token):
 
         {% render_treecomment_tree [for <object>] [with vname1=<obj1>
            vname2=<obj2>] [allow_feedback] [show_feedback] [allow_flagging]
-           [using <template>] %}
+           [limit <N> [replies <K>]] [using <template>] %}
         {% render_treecomment_tree with <varname>=<context-var> %}
 
+    With ``limit``, only the first N top level comments are rendered, each
+    with its first K replies, and so on. The comments with replies left out
+    link to the replies endpoint of the web API to load more.
+
     Example usage::
 
         {% render_treecomment_tree for object allow_feedback %}
+        {% render_treecomment_tree for object limit 20 replies 3 %}
         {% render_treecomment_tree with comments=comment.children %}
     """
     obj = None
@@ -383,6 +515,8 @@ def render_treecomment_tree(parser, token):
     show_feedback = False
     allow_flagging = False
     template_path = None
+    limit = None
+    reply_limit = None
     tokens = token.contents.split()
     tag = tokens.pop(0)
 
@@ -402,7 +536,7 @@ def render_treecomment_tree(parser, token):
                                           % tag)
         if token == "with":
             tail_tokens = ["allow_feedback", "show_feedback", "allow_flagging",
-                           "using"]
+                           "limit", "replies", "using"]
             try:
                 if tokens[0] not in tail_tokens:
                     while len(tokens) and tokens[0] not in tail_tokens:
@@ -421,6 +555,16 @@ def render_treecomment_tree(parser, token):
             show_feedback = True
         if token == "allow_flagging":
             allow_flagging = True
+        if token in ("limit", "replies"):
+            try:
+                value = int(tokens.pop(0))
+            except (IndexError, ValueError):
+                raise TemplateSyntaxError("%r in %r must be followed by a "
+                                          "number." % (token, tag))
+            if token == "limit":
+                limit = value
+            else:
+                reply_limit = value
         if token == "using":
             try:
                 template_path = tokens[0]
@@ -432,7 +576,8 @@ def render_treecomment_tree(parser, token):
                                      allow_feedback=allow_feedback,
                                      show_feedback=show_feedback,
                                      allow_flagging=allow_flagging,
-                                     template_path=template_path)
+                                     template_path=template_path,
+                                     limit=limit, reply_limit=reply_limit)
 
 
 @register.tag
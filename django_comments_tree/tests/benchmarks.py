@@ -0,0 +1,379 @@
+"""
+Benchmarks of building, serializing and rendering comment threads, and of
+posting, confirming and muting comments.
+
+Every benchmark runs against threads of a few shapes, created in an
+in-memory SQLite test database, and records its best wall time over a few
+runs, the number of queries and the peak of memory allocated by Python.
+The results are compared with the baseline stored in
+``tests/data/benchmarks.json``::
+
+    $ python -m django_comments_tree.tests.benchmarks
+    $ python -m django_comments_tree.tests.benchmarks --shape wide-flat
+    $ python -m django_comments_tree.tests.benchmarks --save
+
+The exit status is 1 when a benchmark is slower than the baseline by more
+than the tolerance, uses more queries or more memory. Wall times depend on
+the machine: save the baseline on the machine that runs the comparison.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from os.path import dirname, join
+
+BASELINE = join(dirname(__file__), 'data', 'benchmarks.json')
+
+# Number of replies to each comment, level by level, below the root.
+SHAPES = OrderedDict([
+    ('wide-flat', (5000,)),
+    ('deep-narrow', (10,) + (1,) * 39),
+    ('mixed-50k', (100, 4, 5, 5, 4)),
+])
+
+# Comments posted, confirmed or muted per run of the write benchmarks.
+WRITES = 20
+PAGE_SIZE = 100
+
+
+@dataclass
+class Measurement:
+    time: float
+    queries: int
+    peak_kb: int
+
+
+def scale_shape(fanouts, scale):
+    """ Scale the number of top level comments of a shape """
+    return (max(1, int(fanouts[0] * scale)),) + tuple(fanouts[1:])
+
+
+def build_thread(article, fanouts):
+    """
+    Create the comments of a thread with the given shape, level by level
+    with bulk_create, and return its root.
+    """
+    from django.utils import timezone
+    from django_comments_tree.models import TreeComment
+
+    root = TreeComment.objects.get_or_create_root(article)
+    # One second apart, in the past: new comments are sorted after them.
+    total, count = 0, 1
+    for fanout in fanouts:
+        count *= fanout
+        total += count
+    submit_date = timezone.now() - timedelta(seconds=total + 1)
+    parents = [root]
+    for level, fanout in enumerate(fanouts):
+        numchild = fanouts[level + 1] if level + 1 < len(fanouts) else 0
+        children = []
+        for parent in parents:
+            for step in range(1, fanout + 1):
+                submit_date += timedelta(seconds=1)
+                name = "user%d" % (len(children) % 100)
+                children.append(TreeComment(
+                    path=TreeComment._get_path(parent.path, parent.depth + 1,
+                                               step),
+                    depth=parent.depth + 1,
+                    numchild=numchild,
+                    assoc_id=root.assoc_id,
+                    user_name=name,
+                    user_email="%s@example.com" % name,
+                    comment="Comment %d at level %d" % (step, level + 1),
+                    submit_date=submit_date,
+                    is_public=True))
+        TreeComment.objects.bulk_create(children)
+        parents = children
+    TreeComment.objects.filter(pk=root.pk).update(numchild=fanouts[0])
+    root.refresh_from_db()
+    root.assoc.recount()
+    return root
+
+
+class Thread:
+    """ Thread of comments to an article, and the objects to benchmark it """
+
+    def __init__(self, shape, fanouts):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+        from django_comments_tree.tests.models import Article
+
+        self.article = Article.objects.create(
+            title="Benchmark", slug=shape, body="Thread of shape %s" % shape)
+        self.root = build_thread(self.article, fanouts)
+        self.factory = RequestFactory()
+        self.user = AnonymousUser()
+        self.writes = 0
+
+    def request(self, path='/'):
+        request = self.factory.get(path)
+        request.user = self.user
+        return request
+
+    def reply_to(self):
+        """ Return the comments to reply to, spread over the thread """
+        from django_comments_tree.models import (
+            max_thread_level_for_content_type)
+
+        max_depth = max_thread_level_for_content_type(self.root.content_type)
+        comments = self.root.get_descendants().filter(depth__lt=max_depth)
+        comments = comments.order_by('path')
+        step = max(1, comments.count() // WRITES)
+        return list(comments[::step][:WRITES])
+
+    def next_name(self):
+        self.writes += 1
+        return "writer%d" % self.writes
+
+
+def bench_structured_tree_data(thread):
+    from django_comments_tree.models import TreeComment
+
+    return lambda: TreeComment.structured_tree_data(thread.root)
+
+
+def bench_tree_from_comment(thread):
+    from django_comments_tree.models import TreeComment
+
+    return lambda: TreeComment.tree_from_comment(thread.root)
+
+
+def bench_serialize_page(thread):
+    from django_comments_tree.api.serializers import ReadCommentSerializer
+    from django_comments_tree.models import TreeComment
+
+    def run():
+        # As the list method of the web API does, for one page of comments.
+        comments = list(thread.root.get_descendants().order_by('path')
+                        .select_related('user', 'assoc__content_type')
+                        [:PAGE_SIZE])
+        context = {'request': thread.request(),
+                   'parent_ids': TreeComment.parent_ids(comments),
+                   'flags': TreeComment.objects.flags_for_comments(comments)}
+        return ReadCommentSerializer(comments, many=True,
+                                     context=context).data
+    return run
+
+
+def bench_render_tree(thread):
+    from django.template import Context, Template
+
+    template = Template("{% load comments_tree %}"
+                        "{% render_treecomment_tree for object %}")
+    return lambda: template.render(Context({'object': thread.article,
+                                            'user': thread.user}))
+
+
+def bench_post_replies(thread):
+    parents = thread.reply_to()
+
+    def run():
+        for parent in parents:
+            name = thread.next_name()
+            parent.add_child(comment="Reply by %s" % name, user_name=name,
+                             user_email="%s@example.com" % name)
+    return run
+
+
+def bench_confirm(thread):
+    from django_comments_tree import get_form, signed
+    from django_comments_tree.conf import settings
+    from django_comments_tree.views import comments as views
+
+    def run():
+        for i in range(WRITES):
+            name = thread.next_name()
+            form = get_form()(thread.article)
+            data = {'name': name, 'email': "%s@example.com" % name,
+                    'followup': True, 'reply_to': 0, 'level': 1,
+                    'order': 1, 'comment': "Confirmed by %s" % name}
+            data.update(form.initial)
+            form = get_form()(thread.article, data=data)
+            assert form.is_valid(), form.errors
+            key = signed.dumps(form.get_comment_object(), compress=True,
+                               extra_key=settings.COMMENTS_TREE_SALT)
+            key = key.decode('utf-8')
+            views.confirm(thread.request(), key)
+    return run
+
+
+def bench_mute(thread):
+    from django_comments_tree import signed
+    from django_comments_tree.conf import settings
+    from django_comments_tree.views import comments as views
+
+    parents = thread.reply_to()
+
+    def run():
+        for parent in parents:
+            name = thread.next_name()
+            follower = parent.add_child(
+                comment="Followed by %s" % name, user_name=name,
+                user_email="%s@example.com" % name, followup=True)
+            key = signed.dumps(follower, compress=True,
+                               extra_key=settings.COMMENTS_TREE_SALT)
+            views.mute(thread.request(), key.decode('utf-8'))
+    return run
+
+
+# The write benchmarks come last, they add comments to the thread.
+BENCHMARKS = OrderedDict([
+    ('structured_tree_data', bench_structured_tree_data),
+    ('tree_from_comment', bench_tree_from_comment),
+    ('serialize_page', bench_serialize_page),
+    ('render_tree', bench_render_tree),
+    ('post_replies', bench_post_replies),
+    ('confirm', bench_confirm),
+    ('mute', bench_mute),
+])
+
+
+def measure(func, repeat, budget=10.0):
+    """
+    Return the Measurement of calling func: queries and peak memory of a
+    first run, best time of up to `repeat` more runs, fewer when they take
+    longer than `budget` seconds altogether.
+    """
+    from django.db import connection
+
+    queries = []
+
+    def count_queries(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    tracemalloc.start()
+    try:
+        with connection.execute_wrapper(count_queries):
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    while len(times) < repeat and sum(times) < budget:
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return Measurement(time=round(min(times), 4), queries=len(queries),
+                       peak_kb=peak // 1024)
+
+
+def run_benchmarks(shapes=None, benchmarks=None, repeat=3, scale=1.0,
+                   report=None):
+    """
+    Run the benchmarks on threads of the given shapes, all by default, in
+    the current database. Return {shape: {benchmark: Measurement}}.
+    """
+    results = OrderedDict()
+    for shape in shapes or SHAPES:
+        thread = Thread(shape, scale_shape(SHAPES[shape], scale))
+        results[shape] = OrderedDict()
+        for name in benchmarks or BENCHMARKS:
+            result = measure(BENCHMARKS[name](thread), repeat)
+            results[shape][name] = result
+            if report:
+                report(shape, name, result)
+    return results
+
+
+def compare(results, baseline, tolerance=1.25):
+    """
+    Return the regressions of the results with respect to the baseline, as
+    (shape, benchmark, field, baseline value, value) tuples.
+    """
+    regressions = []
+    for shape, measurements in results.items():
+        for name, result in measurements.items():
+            base = baseline.get(shape, {}).get(name)
+            if base is None:
+                continue
+            if result.time > base['time'] * tolerance:
+                regressions.append((shape, name, 'time', base['time'],
+                                    result.time))
+            if result.queries > base['queries']:
+                regressions.append((shape, name, 'queries', base['queries'],
+                                    result.queries))
+            if result.peak_kb > base['peak_kb'] * tolerance:
+                regressions.append((shape, name, 'peak_kb', base['peak_kb'],
+                                    result.peak_kb))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--shape', action='append', choices=list(SHAPES),
+                        help="Run only on threads of this shape.")
+    parser.add_argument('--benchmark', action='append',
+                        choices=list(BENCHMARKS),
+                        help="Run only this benchmark.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Timed runs of each benchmark.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Scale the number of top level comments.")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="Allowed ratio of time and memory to baseline.")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help="Store the results as the new baseline.")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'django_comments_tree.tests.settings')
+    import django
+    from django.db import connection
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment)
+
+    django.setup()
+    if connection.vendor != 'sqlite':
+        parser.error("the benchmarks run on SQLite, not %s"
+                     % connection.vendor)
+
+    def report(shape, name, result):
+        print("%-12s %-22s %9.4fs %7d queries %9d KiB"
+              % (shape, name, result.time, result.queries, result.peak_kb))
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run_benchmarks(args.shape, args.benchmark, args.repeat,
+                                 args.scale, report)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    baseline = {'scale': args.scale, 'shapes': {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+
+    if args.save:
+        if baseline['scale'] != args.scale:
+            baseline = {'scale': args.scale, 'shapes': {}}
+        for shape, measurements in results.items():
+            baseline['shapes'].setdefault(shape, {}).update(
+                (name, asdict(result)) for name, result in measurements.items())
+        with open(args.baseline, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        return 0
+
+    if baseline['scale'] != args.scale:
+        print("The baseline was recorded at scale %s, not compared."
+              % baseline['scale'])
+        return 0
+    regressions = compare(results, baseline['shapes'], args.tolerance)
+    for shape, name, field, base, value in regressions:
+        print("Regression: %s %s %s %s -> %s"
+              % (shape, name, field, base, value))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
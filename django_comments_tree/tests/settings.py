@@ -3,8 +3,8 @@ from __future__ import unicode_literals
 import os
 import imp
 import django
-import markdown
-from django_comments_tree.render import render_draftjs, render_plain
+from django_comments_tree.render import (render_draftjs, render_markdown,
+                                         render_plain)
 
 
 PRJ_PATH = os.path.abspath(os.path.curdir)
@@ -127,6 +127,6 @@ TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 # Default types we can use for comments
 MARKUP_FIELD_TYPES = (
     ('plain', render_plain),
-    ('markdown', markdown.markdown),
+    ('markdown', render_markdown),
     ('draftjs', render_draftjs),
 )
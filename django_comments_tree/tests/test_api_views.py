@@ -1,5 +1,8 @@
 from __future__ import unicode_literals
 
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
 try:
     from unittest.mock import patch
 except ImportError:
@@ -7,13 +10,18 @@ except ImportError:
 
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework.test import APIRequestFactory, force_authenticate
 
 import django_comments_tree
 from django_comments_tree.api.views import CommentCreate
+from django_comments_tree.conf import settings
+from django_comments_tree.models import (TreeComment, TreeCommentFlag,
+                                         LIKEDIT_FLAG)
 from django_comments_tree.tests.models import Article, Diary
 
 
@@ -59,3 +67,251 @@ class CommentCreateTestCase(TestCase):
         self.assertTrue('name' in response.data)
         self.assertTrue('email' in response.data)
         self.assertEqual(self.mock_mailer.call_count, 0)
+
+
+class CommentListTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        root = TreeComment.objects.get_or_create_root(self.article)
+        base = datetime(2019, 10, 1, 12, 0)
+        self.comments = []
+        for i in range(5):
+            # Two comments for every submit_date.
+            date = base + timedelta(minutes=i // 2)
+            self.comments.append(root.add_child(comment="comment %d" % i,
+                                                submit_date=date))
+        self.reply = self.comments[0].add_child(comment="reply",
+                                                submit_date=base)
+        self.url = reverse('comments-tree-api-list',
+                           kwargs={'content_type': 'tests-article',
+                                   'object_pk': self.article.pk})
+
+    def get_all_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(c['id'] for c in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_list_without_pagination(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 6)
+        reply = [c for c in response.data if c['id'] == self.reply.pk][0]
+        self.assertEqual(reply['parent_id'], self.comments[0].pk)
+        self.assertEqual(reply['level'], 2)
+
+    def test_pages_in_thread_order(self):
+        ids = self.get_all_pages(self.url + "?page_size=2")
+        expected = [c.pk for c in TreeComment.objects.filter(
+            assoc__object_id=self.article.pk, depth__gt=1).order_by('path')]
+        self.assertEqual(ids, expected)
+
+    def test_pages_by_date(self):
+        ids = self.get_all_pages(self.url + "?page_size=2&ordering=date")
+        expected = [c.pk for c in TreeComment.objects.filter(
+            assoc__object_id=self.article.pk,
+            depth__gt=1).order_by('submit_date', 'id')]
+        self.assertEqual(ids, expected)
+
+    def test_page_size_from_app_model_options(self):
+        options = {'tests.article': {'page_size': 4, 'max_page_size': 5}}
+        with patch.object(settings, 'COMMENTS_TREE_APP_MODEL_OPTIONS', options):
+            response = self.client.get(self.url)
+            self.assertEqual(len(response.data['results']), 4)
+            response = self.client.get(self.url + "?page_size=50")
+            self.assertEqual(len(response.data['results']), 5)
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get(self.url + "?page_size=2")
+        cursor = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        response = self.client.get(self.url + "?cursor=x" + cursor)
+        self.assertEqual(response.status_code, 404)
+
+    def test_flags_are_prefetched(self):
+        alice = User.objects.create_user("alice", "alice@example.com", "pwd")
+        bob = User.objects.create_user("bob", "bob@example.com", "pwd")
+        options = {'tests.article': {'allow_flagging': True,
+                                     'allow_feedback': True,
+                                     'show_feedback': True}}
+
+        def like_all(users):
+            for comment in TreeComment.objects.filter(depth__gt=1):
+                for user in users:
+                    TreeCommentFlag.objects.get_or_create(
+                        user=user, comment=comment, flag=LIKEDIT_FLAG)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+            return len(queries), response
+
+        self.client.force_login(alice)
+        with patch.object(settings, 'COMMENTS_TREE_APP_MODEL_OPTIONS', options):
+            like_all([alice, bob])
+            num_queries, response = count_queries()
+            comment = response.data[0]
+            self.assertTrue(comment['flags']['like']['active'])
+            self.assertEqual(comment['flags']['like']['users'],
+                             ["%d:alice" % alice.pk, "%d:bob" % bob.pk])
+
+            # Twice the comments, same number of queries.
+            root = TreeComment.objects.get_or_create_root(self.article)
+            for i in range(6):
+                root.add_child(comment="one more comment")
+            like_all([alice, bob])
+            self.assertEqual(count_queries()[0], num_queries)
+
+
+class CommentChangesTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        self.root = TreeComment.objects.get_or_create_root(self.article)
+        self.old = self.root.add_child(comment="old comment",
+                                       updated_on=datetime(2019, 10, 1))
+        self.removed = self.root.add_child(comment="to be removed",
+                                           updated_on=datetime(2019, 10, 1))
+        self.url = reverse('comments-tree-api-changes',
+                           kwargs={'content_type': 'tests-article',
+                                   'object_pk': self.article.pk})
+
+    def get_changes(self, since, since_id=''):
+        return self.client.get(self.url, {'since': since,
+                                          'since_id': since_id})
+
+    def test_since_is_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.get_changes("yesterday").status_code, 400)
+
+    def test_changes_since_watermark(self):
+        since = datetime(2019, 10, 2).isoformat()
+        response = self.get_changes(since)
+        self.assertEqual(response.data['comments'], [])
+        self.assertEqual(response.data['removed'], [])
+        self.assertEqual(response.data['watermark'], since)
+
+        reply = self.old.add_child(comment="a reply")
+        self.removed.is_removed = True
+        self.removed.save()
+
+        response = self.get_changes(since)
+        self.assertEqual([c['id'] for c in response.data['comments']],
+                         [reply.pk])
+        self.assertEqual(response.data['comments'][0]['parent_id'],
+                         self.old.pk)
+        self.assertEqual(response.data['removed'], [self.removed.pk])
+
+        # The changes of the overlap before the watermark are sent again.
+        watermark = response.data['watermark']
+        watermark_id = response.data['watermark_id']
+        self.assertEqual(watermark_id, self.removed.pk)
+        response = self.get_changes(watermark, watermark_id)
+        self.assertEqual([c['id'] for c in response.data['comments']],
+                         [reply.pk])
+        self.assertEqual((response.data['watermark'],
+                          response.data['watermark_id']),
+                         (watermark, watermark_id))
+
+    @patch.object(settings, 'COMMENTS_TREE_CHANGES_OVERLAP', 0)
+    def test_changes_committed_late(self):
+        since = datetime(2019, 10, 2)
+        first = self.old.add_child(comment="first", updated_on=since)
+        TreeComment.objects.filter(pk=first.pk).update(updated_on=since)
+        response = self.get_changes(since.isoformat(), first.pk)
+        self.assertEqual(response.data['comments'], [])
+
+        # Saved at the same time as the watermark, committed after the call.
+        late = self.old.add_child(comment="late")
+        TreeComment.objects.filter(pk=late.pk).update(updated_on=since)
+        response = self.get_changes(since.isoformat(), first.pk)
+        self.assertEqual([c['id'] for c in response.data['comments']],
+                         [late.pk])
+        self.assertEqual(response.data['watermark_id'], late.pk)
+        self.assertEqual(self.get_changes(since.isoformat(), 'x').status_code,
+                         400)
+
+
+class CommentCountsTestCase(TestCase):
+    def setUp(self):
+        self.article_1 = Article.objects.create(
+            title="September", slug="september", body="During September...")
+        self.article_2 = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        root = TreeComment.objects.get_or_create_root(self.article_1)
+        root.add_child(comment="comment 1")
+        root.refresh_from_db()
+        root.add_child(comment="comment 2")
+        self.url = reverse('comments-tree-api-counts',
+                           kwargs={'content_type': 'tests-article'})
+
+    def test_counts_of_many_objects(self):
+        ids = '%d,%d,999' % (self.article_1.pk, self.article_2.pk)
+        response = self.client.get(self.url, {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['counts'], {
+            str(self.article_1.pk): 2, str(self.article_2.pk): 0, '999': 0})
+
+    def test_invalid_ids(self):
+        for ids in ['', '1,two', ','.join(map(str, range(101)))]:
+            response = self.client.get(self.url, {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+        url = reverse('comments-tree-api-counts',
+                      kwargs={'content_type': 'tests-nothing'})
+        self.assertEqual(self.client.get(url, {'ids': '1'}).status_code, 404)
+
+
+class CommentRepliesTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        self.root = TreeComment.objects.get_or_create_root(self.article)
+        self.comments = []
+        for i in range(3):
+            self.root.refresh_from_db()
+            self.comments.append(self.root.add_child(comment="comment %d" % i))
+        self.replies = [self.comments[0].add_child(comment="reply %d" % i)
+                        for i in range(2)]
+
+    def test_tree_of_object(self):
+        url = reverse('comments-tree-api-tree',
+                      kwargs={'content_type': 'tests-article',
+                              'object_pk': self.article.pk})
+        response = self.client.get(url, {'limit': 2, 'replies': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['remaining'], 1)
+        first, second = response.data['comments']
+        self.assertEqual((first['id'], first['remaining']),
+                         (self.comments[0].pk, 1))
+        [reply] = first['children']
+        self.assertEqual((reply['id'], reply['parent_id'], reply['remaining']),
+                         (self.replies[0].pk, self.comments[0].pk, 0))
+        self.assertEqual((second['id'], second['children']),
+                         (self.comments[1].pk, []))
+
+    def test_load_more_replies(self):
+        url = reverse('comments-tree-api-replies',
+                      kwargs={'pk': self.comments[0].pk})
+        response = self.client.get(url, {'after': self.replies[0].pk})
+        self.assertEqual([c['id'] for c in response.data['comments']],
+                         [self.replies[1].pk])
+        self.assertEqual(response.data['remaining'], 0)
+
+        response = self.client.get(url, {'after': self.comments[1].pk})
+        self.assertEqual(response.status_code, 400)
+        url = reverse('comments-tree-api-replies', kwargs={'pk': 9999})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_replies_to_hidden_comments_are_hidden(self):
+        nested = self.replies[0].add_child(comment="reply 0.0")
+        url = reverse('comments-tree-api-replies', kwargs={'pk': nested.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        TreeComment.objects.filter(pk=self.comments[0].pk).update(
+            is_public=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        TreeComment.objects.filter(pk=self.comments[0].pk).update(
+            is_public=True)
+        TreeComment.objects.filter(pk=nested.pk).update(is_removed=True)
+        self.assertEqual(self.client.get(url).status_code, 404)
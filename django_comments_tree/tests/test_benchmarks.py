@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from django_comments_tree.models import TreeComment
+from django_comments_tree.tests import benchmarks
+
+
+class BenchmarksTestCase(TestCase):
+    def test_build_thread(self):
+        thread = benchmarks.Thread('mixed', (3, 2, 2))
+        self.assertEqual(thread.root.get_descendant_count(), 3 + 6 + 12)
+        self.assertEqual(thread.root.get_children_count(), 3)
+        thread.root.assoc.refresh_from_db()
+        self.assertEqual(thread.root.assoc.public_count, 21)
+        # Replies are sorted after the comments of the thread.
+        parent = thread.root.get_children().last()
+        child = parent.add_child(comment="new")
+        self.assertEqual(parent.get_children().last(), child)
+
+    def test_run_benchmarks(self):
+        results = benchmarks.run_benchmarks(['wide-flat'], repeat=1,
+                                            scale=0.001)
+        measurements = results['wide-flat']
+        self.assertEqual(list(measurements), list(benchmarks.BENCHMARKS))
+        self.assertEqual(measurements['tree_from_comment'].queries, 1)
+        self.assertTrue(TreeComment.objects.filter(
+            user_name__startswith="writer").exists())
+
+    def test_compare(self):
+        result = benchmarks.Measurement(time=2.0, queries=5, peak_kb=100)
+        baseline = {'flat': {'tree': {'time': 1.0, 'queries': 4,
+                                      'peak_kb': 100}}}
+        self.assertEqual(
+            benchmarks.compare({'flat': {'tree': result}}, baseline),
+            [('flat', 'tree', 'time', 1.0, 2.0),
+             ('flat', 'tree', 'queries', 4, 5)])
+        self.assertEqual(benchmarks.compare({'other': {'tree': result}},
+                                            baseline), [])
@@ -0,0 +1,130 @@
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.template import Context, Template
+from django.test import TestCase as DjangoTestCase
+
+from django_comments_tree import cache
+from django_comments_tree.conf import settings
+from django_comments_tree.models import TreeComment, TreeCommentFlag
+from django_comments_tree.signals import (comment_was_flagged,
+                                          comment_feedback_toggled)
+from django_comments_tree.tests.models import Article
+from django_comments_tree.tests.test_models import thread_test_step_1
+
+
+TREE_TEMPLATE = ("{% load comments_tree %}"
+                 "{% render_treecomment_tree for object %}")
+
+
+@patch.object(settings, 'COMMENTS_TREE_CACHE_BACKEND', 'default')
+class ThreadCacheTestCase(DjangoTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        cache.clear_local_roots()
+        self.article = Article.objects.create(
+            title="September", slug="september", body="During September...")
+        thread_test_step_1(self.article)
+        self.root = TreeComment.objects.get_or_create_root(self.article)
+
+    def render(self):
+        return Template(TREE_TEMPLATE).render(
+            Context({'object': self.article, 'user': AnonymousUser()}))
+
+    def test_warm_cache_does_no_queries(self):
+        output = self.render()
+        self.assertEqual(output.count('<a name='), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), output)
+
+    def test_new_comment_invalidates_rendered_tree(self):
+        self.render()
+        self.root.add_child(comment="comment 3 to article")
+        self.assertEqual(self.render().count('<a name='), 3)
+
+    def test_removal_flag_invalidates_rendered_tree(self):
+        comment = self.root.get_children().first()
+        self.render()
+        user = User.objects.create_user("bob", "", "pwd")
+        flag = TreeCommentFlag.objects.create(
+            user=user, comment=comment, flag=TreeCommentFlag.SUGGEST_REMOVAL)
+        # Updated without saving, as done for nested comments on removal.
+        TreeComment.objects.filter(pk=comment.pk).update(is_public=False)
+        self.assertEqual(self.render().count('<a name='), 2)
+        comment_was_flagged.send(sender=TreeComment, comment=comment,
+                                 flag=flag, created=True, request=None)
+        self.assertEqual(self.render().count('<a name='), 1)
+
+    def test_structured_tree_data_is_cached(self):
+        data = TreeComment.structured_tree_data(self.root)
+        self.assertEqual(len(data['comments']), 2)
+        with self.assertNumQueries(0):
+            TreeComment.structured_tree_data(self.root)
+
+        comment = self.root.get_children().first()
+        TreeComment.objects.filter(pk=comment.pk).update(is_public=False)
+        comment_feedback_toggled.send(sender=TreeComment, comment=comment,
+                                      flag=None, created=True, request=None)
+        data = TreeComment.structured_tree_data(self.root)
+        self.assertEqual(len(data['comments']), 1)
+
+    def test_cache_is_disabled_by_default(self):
+        with patch.object(settings, 'COMMENTS_TREE_CACHE_BACKEND', None):
+            self.render()
+            self.root.get_children().update(is_public=False)
+            self.assertEqual(self.render().count('<a name='), 0)
+
+
+class RootIdsTestCase(DjangoTestCase):
+    def setUp(self):
+        cache.clear_local_roots()
+        self.article = Article.objects.create(
+            title="September", slug="september", body="During September...")
+
+    def test_root_ids_are_memoized(self):
+        self.assertIsNone(TreeComment.objects.get_root_ids(self.article))
+        root = TreeComment.objects.get_or_create_root(self.article)
+        with self.assertNumQueries(0):
+            self.assertEqual(TreeComment.objects.get_root_ids(self.article),
+                             (root.pk, root.assoc_id))
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                TreeComment.objects.get_or_create_root(self.article), root)
+
+    def test_shared_cache_is_used_by_other_processes(self):
+        with patch.object(settings, 'COMMENTS_TREE_CACHE_BACKEND', 'default'):
+            caches['default'].clear()
+            root = TreeComment.objects.get_or_create_root(self.article)
+            cache.clear_local_roots()
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    TreeComment.objects.get_root_ids(self.article),
+                    (root.pk, root.assoc_id))
+
+    def test_deleted_root_is_forgotten(self):
+        root = TreeComment.objects.get_or_create_root(self.article)
+        root.delete()
+        self.assertIsNone(TreeComment.objects.get_root(self.article))
+        new_root = TreeComment.objects.get_or_create_root(self.article)
+        self.assertNotEqual(new_root.pk, root.pk)
+
+    def test_stale_root_ids_are_detected(self):
+        root = TreeComment.objects.get_or_create_root(self.article)
+        # Deleted by another process, this one is not notified.
+        with patch.object(cache, 'forget_root'):
+            root.delete()
+        self.assertIsNotNone(TreeComment.objects.get_root_ids(self.article))
+        self.assertIsNone(TreeComment.objects.get_root(self.article))
+        self.assertIsNone(TreeComment.objects.get_root_ids(self.article))
+
+    def test_site_id_is_honored(self):
+        root = TreeComment.objects.get_or_create_root(self.article)
+        self.assertEqual(root.assoc.site_id, settings.SITE_ID)
+        self.assertEqual(
+            TreeComment.objects.get_or_create_root(self.article,
+                                                   site=settings.SITE_ID),
+            root)
@@ -0,0 +1,175 @@
+import asyncio
+import json
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+import django_comments_tree
+from django_comments_tree import events
+from django_comments_tree.asgi import CommentEventStream
+from django_comments_tree.conf import settings
+from django_comments_tree.models import TreeComment
+from django_comments_tree.tests.models import Article
+from django_comments_tree.tests.test_api_views import post_comment
+from django_comments_tree.views.moderation import (perform_bulk_delete,
+                                                   perform_delete, perform_flag)
+
+
+BROKER = "django_comments_tree.events.InMemoryBroker"
+
+
+class InMemoryBrokerTestCase(TestCase):
+    def setUp(self):
+        self.broker = events.InMemoryBroker(history=2)
+
+    def test_wait_returns_events_after_id(self):
+        first = self.broker.publish(1, {'type': events.POSTED})
+        self.broker.publish(2, {'type': events.POSTED})
+        last = self.broker.publish(1, {'type': events.FLAGGED})
+        self.assertEqual(self.broker.last_id(1), last['id'])
+        self.assertEqual(self.broker.wait(1, first['id'], 0), [last])
+        self.assertEqual(self.broker.wait(1, last['id'], 0), [])
+
+    def test_history_is_bounded(self):
+        for i in range(3):
+            self.broker.publish(1, {'type': events.POSTED})
+        self.assertEqual([e['id'] for e in self.broker.wait(1, 0, 0)], [2, 3])
+
+    def test_listen_resumes_and_follows_channel(self):
+        self.broker.publish(1, {'type': events.POSTED})
+
+        async def listen():
+            listener = self.broker.listen(1, after=0)
+            received = [await listener.__anext__()]
+            self.broker.publish(2, {'type': events.POSTED})
+            self.broker.publish(1, {'type': events.REMOVED})
+            received.append(await listener.__anext__())
+            await listener.aclose()
+            return received
+
+        received = asyncio.run(listen())
+        self.assertEqual([(e['id'], e['type']) for e in received],
+                         [(1, events.POSTED), (3, events.REMOVED)])
+        self.assertEqual(self.broker._listeners[1], set())
+
+
+@patch.object(settings, 'COMMENTS_TREE_EVENTS_BROKER', BROKER)
+@patch.dict(events._brokers, clear=True)
+class CommentEventsTestCase(TestCase):
+    def setUp(self):
+        patcher = patch('django_comments_tree.views.comments.send_mail')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.article = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        self.user = User.objects.create_user("bob", "bob@example.com", "pwd")
+        self.url = reverse('comments-tree-api-events',
+                           kwargs={'content_type': 'tests-article',
+                                   'object_pk': self.article.pk})
+
+    def post_comment(self):
+        data = {"name": "Bob", "email": "bob@example.com",
+                "followup": True, "reply_to": 0, "level": 1, "order": 1,
+                "comment": "Hello", "honeypot": ""}
+        data.update(django_comments_tree.get_form()(self.article).initial)
+        self.assertEqual(post_comment(data, auth_user=self.user).status_code,
+                         201)
+        return TreeComment.objects.get(comment="Hello")
+
+    def request(self):
+        return type('Request', (), {'user': self.user})
+
+    def channel_events(self, comment):
+        return events.get_broker().wait(comment.assoc_id, 0, 0)
+
+    def test_posting_and_removing_publish_events(self):
+        comment = self.post_comment()
+        perform_delete(self.request(), comment)
+        self.assertEqual(
+            [(e['type'], e['comment']) for e in self.channel_events(comment)],
+            [(events.POSTED, comment.pk), (events.REMOVED, comment.pk)])
+
+    def test_removal_suggestion_publishes_flagged_event(self):
+        comment = self.post_comment()
+        perform_flag(self.request(), comment)
+        self.assertEqual(self.channel_events(comment)[-1]['type'],
+                         events.FLAGGED)
+
+    def test_bulk_removal_publishes_removed_events(self):
+        comment = self.post_comment()
+        perform_bulk_delete(self.request(),
+                            TreeComment.objects.filter(pk=comment.pk))
+        self.assertEqual(self.channel_events(comment)[-1]['type'],
+                         events.REMOVED)
+
+    def test_long_poll(self):
+        comment = self.post_comment()
+        response = self.client.get(self.url, {'after': 0, 'timeout': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['events'],
+                         self.channel_events(comment))
+        last_id = response.data['last_id']
+
+        response = self.client.get(self.url, {'after': last_id, 'timeout': 0})
+        self.assertEqual(response.data, {'events': [], 'last_id': last_id})
+
+    def test_long_poll_without_broker_or_comments(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.post_comment()
+        with patch.object(settings, 'COMMENTS_TREE_EVENTS_BROKER', None):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class CommentEventStreamTestCase(TestCase):
+    def setUp(self):
+        self.broker = events.InMemoryBroker()
+        self.app = CommentEventStream(broker=self.broker)
+        self.scope = {'type': 'http', 'path': '/events/tests-article/1/',
+                      'query_string': b'',
+                      'headers': [(b'last-event-id', b'1')]}
+
+    def run_app(self):
+        sent = []
+        messages = asyncio.Queue()
+
+        async def receive():
+            return await messages.get()
+
+        async def send(message):
+            sent.append(message)
+            if message.get('more_body'):
+                # Disconnect once the first event has been streamed.
+                await messages.put({'type': 'http.disconnect'})
+
+        async def run():
+            await asyncio.wait_for(self.app(self.scope, receive, send), 5)
+
+        asyncio.run(run())
+        return sent
+
+    def test_stream_resumes_after_last_event_id(self):
+        self.broker.publish(7, {'type': events.POSTED, 'comment': 1})
+        self.broker.publish(7, {'type': events.REMOVED, 'comment': 1})
+        with patch.object(CommentEventStream, 'get_channel', return_value=7):
+            sent = self.run_app()
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      sent[0]['headers'])
+        frame = sent[1]['body'].decode('utf-8')
+        self.assertTrue(frame.startswith("id: 2\nevent: removed\ndata: "))
+        self.assertEqual(json.loads(frame.split("data: ")[1]),
+                         {'type': 'removed', 'comment': 1, 'id': 2})
+        self.assertEqual(sent[-1], {'type': 'http.response.body', 'body': b''})
+        self.assertEqual(self.broker._listeners[7], set())
+
+    def test_unknown_object_is_not_found(self):
+        with patch.object(CommentEventStream, 'get_channel',
+                          return_value=None):
+            sent = self.run_app()
+        self.assertEqual(sent[0]['status'], 404)
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+
+from django_comments_tree.export import (export_queryset, export_records,
+                                         parse_filters)
+from django_comments_tree.models import TreeComment, TreeCommentFlag
+from django_comments_tree.tests.models import Article, Diary
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="September", slug="september", body="During September...")
+        self.diary = Diary.objects.create(body="What I did on October...")
+        root = TreeComment.objects.get_or_create_root(self.article)
+        self.comment_1 = root.add_child(comment="comment 1")
+        self.reply = self.comment_1.add_child(comment="reply to comment 1")
+        self.comment_2 = root.add_child(comment="comment 2")
+        diary_root = TreeComment.objects.get_or_create_root(self.diary)
+        self.diary_comment = diary_root.add_child(comment="diary comment")
+        self.user = User.objects.create_user("bob", "bob@example.com", "pwd")
+        TreeCommentFlag.objects.create(user=self.user, comment=self.reply,
+                                       flag=TreeCommentFlag.SUGGEST_REMOVAL)
+
+    def test_records_are_in_tree_order(self):
+        records = list(export_records(export_queryset(), chunk_size=2))
+        self.assertEqual([r['comment'] for r in records], [
+            "comment 1", "reply to comment 1", "comment 2", "diary comment"])
+        reply = records[1]
+        self.assertEqual(reply['path'], self.reply.path)
+        self.assertEqual(reply['depth'], 3)
+        self.assertEqual((reply['app_label'], reply['model'],
+                          reply['object_id'], reply['site']),
+                         ('tests', 'article', self.article.pk, 'example.com'))
+        self.assertEqual(reply['flags'], {TreeCommentFlag.SUGGEST_REMOVAL: 1})
+        self.assertEqual(records[0]['flags'], {})
+
+    def test_filters(self):
+        filters = parse_filters(content_type='tests-article',
+                                object_id=str(self.article.pk))
+        self.assertEqual(export_queryset(**filters).count(), 3)
+        filters = parse_filters(content_type='tests.diary')
+        self.assertEqual(export_queryset(**filters).get(),
+                         self.diary_comment)
+        since = (datetime.now() + timedelta(hours=1)).isoformat()
+        self.assertFalse(export_queryset(**parse_filters(since=since)))
+        with self.assertRaises(ValueError):
+            parse_filters(object_id='1')
+        with self.assertRaises(ValueError):
+            parse_filters(until='yesterday')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_comments', content_type='tests.article',
+                     stdout=out, stderr=StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         [self.comment_1.pk, self.reply.pk, self.comment_2.pk])
+        with self.assertRaises(CommandError):
+            call_command('export_comments', content_type='tests.nothing')
+
+    def test_api_is_staff_only(self):
+        url = reverse('comments-tree-api-export')
+        self.client.login(username="bob", password="pwd")
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, {'content_type': 'tests-diary'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['comment'] for line in lines],
+                         ["diary comment"])
+        response = self.client.get(url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
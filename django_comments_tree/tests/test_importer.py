@@ -0,0 +1,136 @@
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from django_comments_tree.importer import import_comments
+from django_comments_tree.models import (CommentAssociation,
+                                         ThreadSubscription, TreeComment)
+from django_comments_tree.tests.models import Article
+
+
+LEGACY_TABLES = [
+    """CREATE TABLE django_comments (
+        id integer PRIMARY KEY, content_type_id integer, object_pk text,
+        site_id integer, user_id integer, user_name varchar(50),
+        user_email varchar(254), user_url varchar(200), comment text,
+        submit_date datetime, ip_address char(39), is_public bool,
+        is_removed bool)""",
+    """CREATE TABLE django_comments_xtd_xtdcomment (
+        comment_ptr_id integer PRIMARY KEY, thread_id integer,
+        parent_id integer, level smallint, "order" integer, followup bool,
+        nested_count integer)""",
+]
+
+
+class LegacyImportTestCase(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            for sql in LEGACY_TABLES:
+                cursor.execute(sql)
+        self.article_1 = Article.objects.create(
+            title="September", slug="september", body="During September...")
+        self.article_2 = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        ct = ContentType.objects.get_for_model(Article).pk
+        # (id, object_pk, parent_id, day, followup)
+        for pk, object_pk, parent_id, day, followup in [
+                (1, self.article_1.pk, 1, 2, False),
+                (2, self.article_1.pk, 1, 3, False),
+                (3, self.article_1.pk, 3, 1, False),
+                (4, self.article_1.pk, 2, 4, True),
+                (5, self.article_2.pk, 5, 1, False),
+                (6, 'not-a-number', 6, 1, False)]:
+            self.add_legacy_comment(ct, pk, object_pk, parent_id, day,
+                                    followup)
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE django_comments_xtd_xtdcomment")
+            cursor.execute("DROP TABLE django_comments")
+
+    def add_legacy_comment(self, ct, pk, object_pk, parent_id, day, followup,
+                           xtd=True):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO django_comments VALUES "
+                "(%s, %s, %s, 1, NULL, %s, %s, '', %s, %s, NULL, 1, 0)",
+                [pk, ct, str(object_pk), "user%d" % pk,
+                 "user%d@example.com" % pk, "comment %d" % pk,
+                 datetime(2019, 10, day)])
+            if xtd:
+                cursor.execute(
+                    "INSERT INTO django_comments_xtd_xtdcomment VALUES "
+                    "(%s, 0, %s, 0, 1, %s, 0)", [pk, parent_id, followup])
+
+    def thread(self, article):
+        root = TreeComment.objects.get_root(article)
+        return [(c.comment.raw, c.depth, c.numchild)
+                for c in root.get_descendants().order_by('path')]
+
+    def test_import_rebuilds_threads(self):
+        stats = import_comments()
+        self.assertEqual((stats.rows, stats.comments, stats.threads,
+                          stats.skipped), (6, 5, 2, 1))
+        self.assertEqual(self.thread(self.article_1), [
+            ("comment 3", 2, 0),
+            ("comment 1", 2, 1),
+            ("comment 2", 3, 1),
+            ("comment 4", 4, 0),
+        ])
+        self.assertEqual(self.thread(self.article_2), [("comment 5", 2, 0)])
+        assoc = CommentAssociation.objects.get(object_id=self.article_1.pk)
+        self.assertEqual((assoc.total_count, assoc.public_count), (4, 4))
+        self.assertEqual(assoc.root.numchild, 2)
+        self.assertEqual(list(ThreadSubscription.objects.values_list(
+            'assoc_id', 'user_email')), [(assoc.pk, "user4@example.com")])
+
+    def test_comments_without_xtd_row_or_in_cycles(self):
+        ct = ContentType.objects.get_for_model(Article).pk
+        # Posted before django-comments-xtd was installed.
+        self.add_legacy_comment(ct, 7, self.article_2.pk, None, 2, False,
+                                xtd=False)
+        # Parents of each other.
+        self.add_legacy_comment(ct, 8, self.article_2.pk, 9, 4, False)
+        self.add_legacy_comment(ct, 9, self.article_2.pk, 8, 3, False)
+        stats = import_comments()
+        self.assertEqual((stats.rows, stats.comments), (9, 8))
+        self.assertEqual(self.thread(self.article_2), [
+            ("comment 5", 2, 0),
+            ("comment 7", 2, 0),
+            ("comment 9", 2, 1),
+            ("comment 8", 3, 0),
+        ])
+
+    def test_imported_threads_accept_replies(self):
+        import_comments(xtd=False)
+        root = TreeComment.objects.get_root(self.article_1)
+        self.assertEqual(root.get_children_count(), 4)
+        root.add_child(comment="comment 7")
+        self.assertEqual(self.thread(self.article_1)[-1],
+                         ("comment 7", 2, 0))
+
+    def test_import_resumes_from_checkpoint(self):
+        fd, checkpoint = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(checkpoint)
+        self.addCleanup(os.remove, checkpoint)
+        stats = import_comments(chunk_size=1, checkpoint=checkpoint)
+        self.assertEqual(stats.comments, 5)
+
+        CommentAssociation.objects.get(object_id=self.article_2.pk).delete()
+        stats = import_comments(chunk_size=1, checkpoint=checkpoint)
+        self.assertEqual((stats.rows, stats.comments), (1, 0))
+
+    def test_command_skips_imported_objects(self):
+        call_command('populate_tree_comments', stdout=StringIO())
+        out = StringIO()
+        call_command('populate_tree_comments', chunk_size=2, stdout=out)
+        self.assertIn("Added 0 TreeComment object(s) in 0 thread(s), "
+                      "skipped 3 object(s).", out.getvalue())
+        self.assertEqual(TreeComment.objects.filter(depth__gt=1).count(), 5)
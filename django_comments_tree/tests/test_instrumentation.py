@@ -0,0 +1,136 @@
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from django_comments_tree import cache, instrumentation
+from django_comments_tree.conf import settings
+from django_comments_tree.models import TreeComment
+from django_comments_tree.signals import comments_measured
+from django_comments_tree.tests.models import Article
+from django_comments_tree.tests.test_models import thread_test_step_1
+from django_comments_tree.views.moderation import perform_bulk_flag
+
+
+SINK = "django_comments_tree.instrumentation.MemorySink"
+
+TREE_TEMPLATE = ("{% load comments_tree %}"
+                 "{% render_treecomment_tree for object %}")
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        for name, value in [('COMMENTS_TREE_INSTRUMENTATION', True),
+                            ('COMMENTS_TREE_INSTRUMENTATION_SINK', SINK)]:
+            patcher = patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sink = instrumentation.get_sink()
+        self.sink.clear()
+        self.article = Article.objects.create(
+            title="September", slug="september", body="During September...")
+        thread_test_step_1(self.article)
+        self.root = TreeComment.objects.get_or_create_root(self.article)
+
+    def render(self):
+        return Template(TREE_TEMPLATE).render(
+            Context({'object': self.article, 'user': AnonymousUser()}))
+
+    def test_render_tree_is_measured(self):
+        self.render()
+        [measurement] = self.sink.measurements
+        self.assertEqual(measurement.name, 'render_tree')
+        self.assertEqual(measurement.size, 2)
+        self.assertGreater(measurement.queries, 0)
+        self.assertGreater(measurement.time, 0)
+
+    @patch.object(settings, 'COMMENTS_TREE_CACHE_BACKEND', 'default')
+    def test_cache_hits_and_misses(self):
+        caches['default'].clear()
+        cache.clear_local_roots()
+        self.render()
+        self.render()
+        first, second = self.sink.measurements
+        self.assertEqual(first.cache_misses, 2)
+        self.assertEqual((second.queries, second.cache_misses), (0, 0))
+        self.assertEqual(second.cache_hits, 2)
+
+    def test_nested_measurements(self):
+        with instrumentation.measure('outer') as outer:
+            TreeComment.structured_tree_data(self.root)
+        inner = self.sink.measurements[0]
+        self.assertEqual(inner.name, 'structured_tree_data')
+        self.assertEqual(inner.size, 2)
+        self.assertEqual(outer.queries, inner.queries)
+
+    def test_api_list_is_measured(self):
+        self.client.get(reverse('comments-tree-api-list',
+                                kwargs={'content_type': 'tests-article',
+                                        'object_pk': self.article.pk}))
+        [measurement] = self.sink.measurements
+        self.assertEqual((measurement.name, measurement.size), ('api_list', 2))
+
+    def test_bulk_moderation_is_measured(self):
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_user("bob", "", "pwd")
+        perform_bulk_flag(request, self.root.get_descendants())
+        [measurement] = self.sink.measurements
+        self.assertEqual((measurement.name, measurement.size),
+                         ('moderation_bulk_flag', 2))
+
+    def test_signal_is_sent(self):
+        received = []
+
+        def receiver(sender, measurement, **kwargs):
+            received.append(measurement.name)
+
+        comments_measured.connect(receiver)
+        try:
+            TreeComment.structured_tree_data(self.root)
+        finally:
+            comments_measured.disconnect(receiver)
+        self.assertEqual(received, ['structured_tree_data'])
+
+    @patch.object(settings, 'COMMENTS_TREE_INSTRUMENTATION', False)
+    def test_disabled_measures_nothing(self):
+        with instrumentation.measure('block') as measurement:
+            self.render()
+        self.assertIsNone(measurement)
+        self.assertEqual(self.sink.measurements, [])
+
+
+@patch.object(settings, 'COMMENTS_TREE_INSTRUMENTATION', True)
+@patch.object(settings, 'COMMENTS_TREE_INSTRUMENTATION_SINK', None)
+class InstrumentationMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="September", slug="september", body="During September...")
+        thread_test_step_1(self.article)
+        root = TreeComment.objects.get_or_create_root(self.article)
+
+        def get_response(request):
+            TreeComment.structured_tree_data(root)
+            return HttpResponse()
+
+        self.middleware = instrumentation.CommentsInstrumentationMiddleware(
+            get_response)
+        self.request = RequestFactory().get('/')
+
+    @patch.object(settings, 'DEBUG', True)
+    def test_header_summarizes_measurements(self):
+        response = self.middleware(self.request)
+        header = response[instrumentation.HEADER]
+        self.assertTrue(header.startswith('structured_tree_data;queries=1;'))
+        self.assertIn(';size=2;', header)
+
+    @patch.object(settings, 'DEBUG', False)
+    def test_no_header_without_debug(self):
+        response = self.middleware(self.request)
+        self.assertFalse(response.has_header(instrumentation.HEADER))
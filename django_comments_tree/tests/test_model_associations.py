@@ -1,4 +1,5 @@
 from datetime import datetime
+from io import StringIO
 from textwrap import dedent
 from os.path import join, dirname
 
@@ -6,7 +7,9 @@ from django.db import connection, reset_queries
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.conf import settings
+from django.core.management import call_command
 from django.test import TestCase as DjangoTestCase, override_settings
+from django.urls import reverse
 
 from django_comments_tree.models import (TreeComment, CommentAssociation,
                                          MaxThreadLevelExceededException)
@@ -56,8 +59,9 @@ class CommentAssociationTestCase(ArticleBaseTestCase):
 
         self.assertEqual(comment.assoc, root.commentassociation)
 
-        # Only the insert of comment and update of root depth
-        self.assertEqual(len(connection.queries), 2)
+        # Only the insert of comment, update of root depth and
+        # update of the association counters
+        self.assertEqual(len(connection.queries), 3)
 
     @override_settings(DEBUG=True)
     def test_association_is_added_at_depth(self):
@@ -70,8 +74,9 @@ class CommentAssociationTestCase(ArticleBaseTestCase):
         self.assertEqual(comment2.assoc, root.commentassociation)
         self.assertEqual(comment3.assoc, root.commentassociation)
 
-        # Only the insert of comment and update of root depth
-        self.assertEqual(len(connection.queries), 6)
+        # Only the insert of comment, update of parent depth and
+        # update of the association counters
+        self.assertEqual(len(connection.queries), 9)
 
     def test_association_is_updated_on_change(self):
         root = self.root
@@ -83,3 +88,59 @@ class CommentAssociationTestCase(ArticleBaseTestCase):
         self.assertEqual(comment3.assoc, root.commentassociation)
 
 
+
+class CommentCountersTestCase(ArticleBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = TreeComment.objects.get_or_create_root(self.article_1)
+        self.assoc = self.root.commentassociation
+
+    def assertCounters(self, total, public, removed, moderation):
+        self.assoc.refresh_from_db()
+        self.assertEqual((self.assoc.total_count, self.assoc.public_count,
+                          self.assoc.removed_count, self.assoc.moderation_count),
+                         (total, public, removed, moderation))
+
+    def test_counters_follow_comment_changes(self):
+        comment = self.add_comment(self.root)
+        self.add_comment(comment)
+        self.assertCounters(2, 2, 0, 0)
+
+        comment.is_public = False
+        comment.save()
+        self.assertCounters(2, 1, 0, 1)
+
+        comment = TreeComment.objects.get(pk=comment.pk)
+        comment.is_public = True
+        comment.is_removed = True
+        comment.save()
+        self.assertCounters(2, 1, 1, 0)
+
+        # Saving without changes does not touch the counters.
+        comment.save()
+        self.assertCounters(2, 1, 1, 0)
+
+        # Deleting a comment deletes its replies too.
+        TreeComment.objects.get(pk=comment.pk).delete()
+        self.assertCounters(0, 0, 0, 0)
+
+    def test_rebuild_counters(self):
+        comment = self.add_comment(self.root)
+        self.add_comment(self.root)
+        TreeComment.objects.filter(pk=comment.pk).update(is_public=False)
+        CommentAssociation.objects.update(total_count=0, public_count=0)
+
+        out = StringIO()
+        call_command('rebuild_comment_counters', stdout=out)
+        self.assertIn("1 association(s)", out.getvalue())
+        self.assertCounters(2, 1, 0, 1)
+
+    def test_counts_are_read_from_the_association(self):
+        self.add_comment(self.root)
+        self.add_comment(self.root).delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(TreeComment.objects.count_for_model(self.article_1), 1)
+        url = reverse('comments-tree-api-count',
+                      kwargs={'content_type': 'tests-article',
+                              'object_pk': self.article_1.pk})
+        self.assertEqual(self.client.get(url).data, {'count': 1})
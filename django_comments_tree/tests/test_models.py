@@ -1,14 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from io import StringIO
 from textwrap import dedent
 from os.path import join, dirname
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.conf import settings
-from django.test import TestCase as DjangoTestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase as DjangoTestCase
 
 from django_comments_tree.models import (TreeComment, CommentAssociation,
+                                         TreeCommentFlag,
                                          MaxThreadLevelExceededException)
+from django_comments_tree import render
+from django_comments_tree.views.comments import perform_dislike, perform_like
+from django_comments_tree.views.moderation import (perform_approve,
+                                                   perform_delete,
+                                                   perform_flag)
 from django_comments_tree.tests.models import Article, Diary
 
 
@@ -502,5 +511,248 @@ class TestCommentsManager(ArticleBaseTestCase):
         self.assertEqual(2, count2)
         self.assertEqual(2, count3)
 
+    def test_count_for_objects(self):
+        article_3 = Article.objects.create(
+            title="November", slug="november", body="Rain.")
+        ct = ContentType.objects.get_for_model(Article)
+        ids = [self.article_1.pk, self.article_2.pk, article_3.pk]
+        with self.assertNumQueries(1):
+            counts = TreeComment.objects.count_for_objects(ids, ct, site=1)
+        self.assertEqual(counts, {self.article_1.pk: 2, self.article_2.pk: 2,
+                                  article_3.pk: 0})
+        self.assertEqual(TreeComment.objects.count_for_objects(ids, ct, site=2),
+                         dict.fromkeys(ids, 0))
 
+    def test_annotate_counts(self):
+        article_3 = Article.objects.create(
+            title="November", slug="november", body="Rain.")
+        TreeComment.objects.first().add_child(comment="comment 3")
+        qs = TreeComment.objects.annotate_counts(
+            Article.objects.order_by('pk'), site=1, name='num_comments')
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [(a.pk, a.num_comments) for a in qs],
+                [(self.article_1.pk, 3), (self.article_2.pk, 2),
+                 (article_3.pk, 0)])
 
+
+
+
+
+class FeedbackCountersTestCase(ArticleBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        root = TreeComment.objects.get_or_create_root(self.article_1)
+        self.comment = root.add_child(comment="a comment to like")
+        self.user = User.objects.create_user("bob", "bob@example.com", "pwd")
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def assertCounters(self, likes, dislikes, reports):
+        comment = TreeComment.objects.get(pk=self.comment.pk)
+        self.assertEqual((comment.likes, comment.dislikes, comment.reports),
+                         (likes, dislikes, reports))
+
+    def test_feedback_updates_counters(self):
+        perform_like(self.request, self.comment)
+        self.assertCounters(1, 0, 0)
+        perform_dislike(self.request, self.comment)
+        self.assertCounters(0, 1, 0)
+        perform_dislike(self.request, self.comment)
+        self.assertCounters(0, 0, 0)
+        perform_flag(self.request, self.comment)
+        self.assertCounters(0, 0, 1)
+        TreeCommentFlag.objects.filter(comment=self.comment).delete()
+        self.assertCounters(0, 0, 0)
+
+    def test_moderating_stale_comment_keeps_counters(self):
+        perform_like(self.request, self.comment)
+        # self.comment still has likes == 0 in memory.
+        perform_delete(self.request, self.comment)
+        perform_approve(self.request, self.comment)
+        self.assertCounters(1, 0, 0)
+
+    def test_save_of_deleted_row_inserts_it(self):
+        TreeComment.objects.filter(pk=self.comment.pk).delete()
+        self.comment.save()
+        self.assertTrue(TreeComment.objects.filter(pk=self.comment.pk).exists())
+
+    def test_structured_data_includes_counters(self):
+        perform_like(self.request, self.comment)
+        root = TreeComment.objects.get_or_create_root(self.article_1)
+        data = TreeComment.structured_tree_data(root)
+        self.assertEqual(data['comments'][0].likes, 1)
+        self.assertEqual(data['comments'][0].dislikes, 0)
+
+
+class MarkupRenderTestCase(DjangoTestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="September", slug="september", body="During September...")
+
+    def test_renderers_are_reused(self):
+        self.assertIs(render.get_markdown_renderer(),
+                      render.get_markdown_renderer())
+        self.assertEqual(render.render_markdown("*a*"), "<p><em>a</em></p>")
+        # Reset between calls, nothing leaks from the previous body.
+        self.assertEqual(render.render_markdown("[x]: /x\n\nb"), "<p>b</p>")
+        self.assertEqual(render.render_markdown("[x]"), "<p>[x]</p>")
+        hits = render.render_markdown.cache_info().hits
+        render.render_markdown("*a*")
+        self.assertEqual(render.render_markdown.cache_info().hits, hits + 1)
+
+    def test_rerender_comments_command(self):
+        c1 = TreeComment.objects.create_for_object(
+            self.article, comment="*one*", comment_markup_type='markdown')
+        c2 = TreeComment.objects.create_for_object(
+            self.article, comment="two", comment_markup_type='plain')
+        TreeComment.objects.filter(pk__in=[c1.pk, c2.pk]).update(
+            _comment_rendered="stale")
+        out = StringIO()
+        call_command('rerender_comments', markup_type='markdown',
+                     batch_size=1, stdout=out)
+        c1.refresh_from_db()
+        c2.refresh_from_db()
+        self.assertEqual(c1.comment.rendered, "<p><em>one</em></p>")
+        self.assertEqual(c2.comment.rendered, "stale")
+        self.assertIn("1 changed", out.getvalue())
+
+
+class DuplicateCommentTestCase(ArticleBaseTestCase):
+    def create_comment(self, article, **kwargs):
+        kwargs.setdefault('user_name', "Bob")
+        kwargs.setdefault('user_email', "bob@example.com")
+        return TreeComment.objects.create_for_object(
+            article, comment="Same  old\ncomment", **kwargs)
+
+    def test_content_hash_is_stored(self):
+        comment = self.create_comment(self.article_1)
+        self.assertEqual(len(comment.content_hash), 64)
+        self.assertEqual(comment.content_hash, comment.fingerprint())
+        root = TreeComment.objects.get_or_create_root(self.article_1)
+        self.assertEqual(root.content_hash, '')
+
+    def test_find_duplicate(self):
+        comment = self.create_comment(self.article_1)
+        new = TreeComment(comment="Same old comment", assoc=comment.assoc,
+                          user_name="Bob", user_email="BOB@example.com",
+                          submit_date=comment.submit_date)
+        self.assertEqual(TreeComment.objects.find_duplicate(new), comment)
+
+        new.user_email = "alice@example.com"
+        self.assertIsNone(TreeComment.objects.find_duplicate(new))
+        other = self.create_comment(self.article_2)
+        self.assertNotEqual(other.content_hash, comment.content_hash)
+
+    def test_content_hash_follows_edits(self):
+        comment = self.create_comment(self.article_1)
+        comment = TreeComment.objects.get(pk=comment.pk)
+        comment.comment = "Edited comment"
+        comment.save()
+        comment.refresh_from_db()
+        self.assertEqual(comment.content_hash, comment.fingerprint())
+        edited = TreeComment(comment="Edited  comment", assoc=comment.assoc,
+                             user_name="Bob", user_email="bob@example.com",
+                             submit_date=comment.submit_date)
+        self.assertEqual(TreeComment.objects.find_duplicate(edited), comment)
+
+        comment.user_name = "Robert"
+        comment.save(update_fields=['user_name'])
+        self.assertEqual(TreeComment.objects.get(pk=comment.pk).content_hash,
+                         comment.fingerprint())
+
+    def test_duplicate_window(self):
+        comment = self.create_comment(self.article_1)
+        later = TreeComment(comment=comment.comment.raw, assoc=comment.assoc,
+                            user_name="Bob", user_email="bob@example.com",
+                            submit_date=comment.submit_date + timedelta(hours=2))
+        manager = TreeComment.objects
+        self.assertEqual(manager.find_duplicate(later), comment)
+        self.assertIsNone(manager.find_duplicate(later, window=3600))
+
+
+class TreeSliceTestCase(ArticleBaseTestCase):
+    """
+    root -
+      comment 0
+        reply 0
+          reply 0.0
+          reply 0.1
+        reply 1
+        reply 2
+      comment 1
+      comment 2
+      comment 3
+    """
+    def setUp(self):
+        super().setUp()
+        self.root = TreeComment.objects.get_or_create_root(self.article_1)
+        self.comments = [self.add(self.root, "comment %d" % i)
+                         for i in range(4)]
+        self.replies = [self.add(self.comments[0], "reply %d" % i)
+                        for i in range(3)]
+        for i in range(2):
+            self.add(self.replies[0], "reply 0.%d" % i)
+        self.root.refresh_from_db()
+
+    def add(self, parent, comment):
+        parent.refresh_from_db()
+        return parent.add_child(comment=comment)
+
+    def outline(self, tree):
+        return [(e['comment'].comment.raw, e['remaining'],
+                 self.outline(e['children'])) for e in tree]
+
+    def test_first_page(self):
+        with self.assertNumQueries(4):
+            tree, remaining = TreeComment.tree_slice(self.root, 2, 1)
+        self.assertEqual(remaining, 2)
+        self.assertEqual(self.outline(tree), [
+            ("comment 0", 2, [("reply 0", 1, [("reply 0.0", 0, [])])]),
+            ("comment 1", 0, []),
+        ])
+
+    def test_replies_after_a_deleted_one(self):
+        self.replies[0].delete()
+        self.comments[0].refresh_from_db()
+        self.assertEqual(self.comments[0].numchild, 2)
+        tree, remaining = TreeComment.tree_slice(self.root, 1, 1)
+        self.assertEqual(self.outline(tree), [
+            ("comment 0", 1, [("reply 1", 0, [])])])
+        tree, remaining = TreeComment.tree_slice(self.root, 1, 5)
+        self.assertEqual(self.outline(tree), [
+            ("comment 0", 0, [("reply 1", 0, []), ("reply 2", 0, [])])])
+
+    def test_next_slice(self):
+        tree, remaining = TreeComment.tree_slice(
+            self.comments[0], 1, after=self.replies[0].path)
+        self.assertEqual(self.outline(tree), [("reply 1", 0, [])])
+        self.assertEqual(remaining, 1)
+
+    def test_hidden_replies_are_left_out(self):
+        TreeComment.objects.filter(pk=self.comments[1].pk).update(
+            is_public=False)
+        tree, remaining = TreeComment.tree_slice(self.root, 10)
+        self.assertEqual([e['comment'] for e in tree],
+                         [self.comments[0], self.comments[2],
+                          self.comments[3]])
+        tree, remaining = TreeComment.tree_slice(self.root, 1,
+                                                 after=self.comments[0].path)
+        self.assertEqual((tree[0]['comment'], remaining),
+                         (self.comments[2], 1))
+
+    def test_hidden_replies_are_not_remaining(self):
+        TreeComment.objects.filter(
+            pk__in=[self.comments[3].pk, self.replies[2].pk]).update(
+                is_public=False)
+        TreeComment.objects.filter(path__startswith=self.replies[0].path,
+                                   depth=self.replies[0].depth + 1).update(
+            is_public=False)
+        tree, remaining = TreeComment.tree_slice(self.root, 2, 1)
+        self.assertEqual(remaining, 1)
+        self.assertEqual(self.outline(tree), [
+            ("comment 0", 1, [("reply 0", 0, [])]),
+            ("comment 1", 0, []),
+        ])
+        tree, remaining = TreeComment.tree_slice(self.root, 3)
+        self.assertEqual(remaining, 0)
@@ -1,6 +1,10 @@
 from __future__ import unicode_literals
 
+import os
 import re
+import shutil
+import tempfile
+from io import StringIO
 
 try:
     from unittest.mock import patch
@@ -10,15 +14,25 @@ from datetime import datetime, timedelta
 
 import django
 from django.contrib.auth.models import AnonymousUser, User
-from django.test import TestCase, RequestFactory
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, RequestFactory, TransactionTestCase
 from django.urls import reverse
 
-from django_comments_tree.models import TreeCommentFlag
+from django_comments_tree import blocklist, signals
+from django_comments_tree.conf import settings
+from django_comments_tree.models import (BlackListedDomain, TmpTreeComment,
+                                         TreeComment, TreeCommentFlag)
+from django_comments_tree.moderation import SpamModerator
 
 import django_comments_tree
 from django_comments_tree.views import comments as views
+from django_comments_tree.views.moderation import (perform_bulk_approve,
+                                                   perform_bulk_delete,
+                                                   perform_bulk_flag)
 from django_comments_tree.models import LIKEDIT_FLAG, DISLIKEDIT_FLAG
-from django_comments_tree.tests.models import Diary
+from django_comments_tree.tests.models import Article, Diary
 from django_comments_tree.tests.test_views import (confirm_comment_url,
                                                    post_diary_comment)
 
@@ -374,3 +388,164 @@ class FlaggingLikedItAndDislikedIt(TestCase):
                                            user=self.user,
                                            flag=DISLIKEDIT_FLAG)
         self.assertEqual(flags.count(), 1, f"Expected value to be 1")
+
+
+@patch.object(settings, 'COMMENTS_TREE_CACHE_BACKEND', 'default')
+class BlocklistTestCase(TransactionTestCase):
+    # The blocklist is invalidated when the changes are committed.
+    def setUp(self):
+        caches['default'].clear()
+        blocklist.invalidate()
+        BlackListedDomain.objects.create(domain="Spam.example")
+
+    def test_matches_domain_and_subdomains(self):
+        domains = blocklist.DomainBlocklist(["spam.example", " .Bad.org. "])
+        self.assertTrue(domains.matches("spam.example"))
+        self.assertTrue(domains.matches("mail.SPAM.example."))
+        self.assertTrue(domains.matches("a.b.bad.org"))
+        self.assertFalse(domains.matches("notspam.example"))
+        self.assertFalse(domains.matches("example"))
+
+    def test_spam_moderator_runs_no_queries(self):
+        moderator = SpamModerator(Article)
+        comment = TmpTreeComment(user_email="bob@mail.spam.example")
+        self.assertFalse(moderator.allow(comment, None, None))
+        with self.assertNumQueries(0):
+            self.assertFalse(moderator.allow(comment, None, None))
+            comment.user_email = "bob@example.com"
+            self.assertTrue(moderator.allow(comment, None, None))
+
+    def test_changes_are_noticed_by_other_processes(self):
+        self.assertFalse(blocklist.get_blocklist().matches("bad.org"))
+        # Another process adds a domain; this one only sees the new version.
+        with patch.object(blocklist, '_state', blocklist._state):
+            BlackListedDomain.objects.create(domain="bad.org")
+        self.assertIsNotNone(blocklist._state)
+        self.assertTrue(blocklist.get_blocklist().matches("bad.org"))
+
+    def test_invalidated_after_commit(self):
+        self.assertFalse(blocklist.get_blocklist().matches("bad.org"))
+        with transaction.atomic():
+            BlackListedDomain.objects.create(domain="bad.org")
+            self.assertIsNotNone(blocklist._state)
+        self.assertIsNone(blocklist._state)
+        self.assertTrue(blocklist.get_blocklist().matches("bad.org"))
+
+    def test_import_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'blocklist.txt')
+        with open(path, 'w') as blocklist_file:
+            blocklist_file.write("# spammers\nspam.example\nbad.org\n\n"
+                                 "Bad.org extra columns\nworse.net\n")
+        out = StringIO()
+        call_command('import_blocklist', path, batch_size=1, stdout=out)
+        self.assertEqual(
+            sorted(BlackListedDomain.objects.values_list('domain', flat=True)),
+            ["Spam.example", "bad.org", "worse.net"])
+        self.assertTrue(blocklist.get_blocklist().matches("a.worse.net"))
+
+        with open(path, 'w') as blocklist_file:
+            blocklist_file.write("other.net\n")
+        call_command('import_blocklist', path, replace=True, stdout=out)
+        self.assertEqual(
+            list(BlackListedDomain.objects.values_list('domain', flat=True)),
+            ["other.net"])
+        self.assertFalse(blocklist.get_blocklist().matches("bad.org"))
+
+
+class BulkModerationTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="September", slug="september", body="During September...")
+        self.moderator = User.objects.create_superuser(
+            "joe", "joe@example.com", "pwd")
+        create = TreeComment.objects.create_for_object
+        self.c1 = create(self.article, comment="spam")
+        self.c2 = create(self.article, comment="ham")
+        self.r1 = self.c1.add_child(comment="more spam")
+        self.r2 = self.r1.add_child(comment="reply to spam")
+        self.request = request_factory.post('/')
+        self.request.user = self.moderator
+        self.received = []
+        signals.comments_were_flagged.connect(self.receive)
+        self.addCleanup(signals.comments_were_flagged.disconnect, self.receive)
+
+    def receive(self, sender, comment_ids, flag, created_ids, **kwargs):
+        self.received.append((comment_ids, created_ids))
+
+    def queryset(self, *comments):
+        return TreeComment.objects.filter(pk__in=[c.pk for c in comments])
+
+    def test_bulk_delete_unpublishes_replies(self):
+        count = perform_bulk_delete(self.request,
+                                    self.queryset(self.c1, self.r1),
+                                    batch_size=1)
+        self.assertEqual(count, 2)
+        self.assertEqual(len(self.received), 2)
+        for comment in (self.c1, self.r1, self.r2, self.c2):
+            comment.refresh_from_db()
+        self.assertTrue(self.c1.is_removed and self.r1.is_removed)
+        self.assertFalse(self.r2.is_public or self.r2.is_removed)
+        self.assertTrue(self.c2.is_public and not self.c2.is_removed)
+        self.assertEqual(TreeCommentFlag.objects.filter(
+            flag=TreeCommentFlag.MODERATOR_DELETION).count(), 2)
+
+        assoc = self.c1.assoc
+        assoc.refresh_from_db()
+        counts = (assoc.total_count, assoc.public_count,
+                  assoc.removed_count, assoc.moderation_count)
+        assoc.recount()
+        self.assertEqual(counts, (assoc.total_count, assoc.public_count,
+                                  assoc.removed_count, assoc.moderation_count))
+        self.assertEqual(counts, (4, 1, 2, 1))
+
+    def test_bulk_flag_is_idempotent(self):
+        queryset = self.queryset(self.c1, self.c2)
+        self.assertEqual(perform_bulk_flag(self.request, queryset), 2)
+        perform_bulk_flag(self.request, queryset)
+        self.assertEqual(self.received[1][1], [])
+        self.c1.refresh_from_db()
+        self.assertEqual(self.c1.reports, 1)
+        self.assertEqual(TreeCommentFlag.objects.filter(
+            flag=TreeCommentFlag.SUGGEST_REMOVAL).count(), 2)
+
+    def test_bulk_flag_counts_concurrent_flags_once(self):
+        bulk_create = TreeCommentFlag.objects.bulk_create
+
+        def concurrent_bulk_create(flags, **kwargs):
+            # Another request of the moderator flags c1 first.
+            TreeCommentFlag.objects.create(
+                comment=self.c1, user=self.moderator,
+                flag=TreeCommentFlag.SUGGEST_REMOVAL,
+                flag_date=datetime(2019, 10, 1))
+            return bulk_create(flags, **kwargs)
+
+        with patch.object(TreeCommentFlag.objects, 'bulk_create',
+                          side_effect=concurrent_bulk_create):
+            perform_bulk_flag(self.request, self.queryset(self.c1, self.c2))
+        self.assertEqual(self.received, [([self.c1.pk, self.c2.pk],
+                                          [self.c2.pk])])
+        self.c1.refresh_from_db()
+        self.assertEqual(self.c1.reports, 1)
+
+    def test_bulk_approve(self):
+        TreeComment.objects.filter(pk=self.c2.pk).update(is_public=False)
+        perform_bulk_approve(self.request, self.queryset(self.c2))
+        self.c2.refresh_from_db()
+        self.assertTrue(self.c2.is_public)
+        self.assertEqual(self.received, [([self.c2.pk], [self.c2.pk])])
+
+    def test_api_requires_moderator(self):
+        url = reverse('comments-tree-api-moderate')
+        data = {'action': 'remove', 'comments': [self.c2.pk]}
+        User.objects.create_user("bob", "bob@example.com", "pwd")
+        self.client.login(username="bob", password="pwd")
+        response = self.client.post(url, data, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.login(username="joe", password="pwd")
+        response = self.client.post(url, data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'action': 'remove', 'count': 1})
+        self.assertTrue(TreeComment.objects.get(pk=self.c2.pk).is_removed)
@@ -0,0 +1,161 @@
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from importlib import import_module
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+
+from django_comments_tree.conf import settings
+from django_comments_tree.models import (FollowupNotification,
+                                         ThreadSubscription, TreeComment)
+from django_comments_tree.notifications import (get_followers,
+                                                send_followup_notifications)
+from django_comments_tree.tests.models import Article
+from django_comments_tree.views.comments import notify_comment_followers
+from django_comments_tree.views.moderation import perform_bulk_approve
+
+
+@patch.object(settings, 'COMMENTS_TREE_FOLLOWUP_OUTBOX', True)
+class FollowupOutboxTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        self.root = TreeComment.objects.get_or_create_root(self.article)
+        for name in ["bob", "alice", "bob", "carol"]:
+            self.root.add_child(comment="by %s" % name, user_name=name,
+                                user_email="%s@example.com" % name,
+                                followup=name != "carol")
+
+    def post(self, name="dave"):
+        comment = self.root.add_child(comment="new", user_name=name,
+                                      user_email="%s@example.com" % name,
+                                      followup=True)
+        notify_comment_followers(comment)
+        return comment
+
+    def test_posting_only_queues_the_notification(self):
+        comment = self.post()
+        self.assertEqual(len(mail.outbox), 0)
+        notification = FollowupNotification.objects.get()
+        self.assertEqual(notification.comment, comment)
+        self.assertIsNone(notification.sent_on)
+
+    def test_worker_sends_one_email_per_follower(self):
+        self.post()
+        self.post("alice")
+        self.assertEqual(send_followup_notifications(), (2, 4))
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox),
+            ["alice@example.com", "bob@example.com", "bob@example.com",
+             "dave@example.com"])
+        self.assertIn("There is a new comment following up yours.",
+                      mail.outbox[0].body)
+        self.assertEqual(
+            FollowupNotification.objects.filter(sent_on__isnull=True).count(),
+            0)
+        self.assertEqual(send_followup_notifications(), (0, 0))
+
+    def test_worker_skips_removed_comments(self):
+        comment = self.post()
+        comment.is_removed = True
+        comment.save()
+        self.assertEqual(send_followup_notifications(), (1, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_command_drains_outbox_in_batches(self):
+        for i in range(3):
+            self.post()
+        call_command('send_followup_notifications', batch_size=2)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertFalse(FollowupNotification.objects.filter(
+            sent_on__isnull=True).exists())
+
+
+class ThreadSubscriptionTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        self.root = TreeComment.objects.get_or_create_root(self.article)
+        self.bob = self.add("bob")
+        self.add("bob")
+        self.add("carol", followup=False)
+        self.add("dave", is_public=False)
+
+    def add(self, name, followup=True, **kwargs):
+        return self.root.add_child(comment="by %s" % name, user_name=name,
+                                   user_email="%s@example.com" % name,
+                                   followup=followup, **kwargs)
+
+    def subscribers(self):
+        return sorted(ThreadSubscription.objects.values_list('user_email',
+                                                            flat=True))
+
+    def test_followers_subscribe_once(self):
+        self.assertEqual(self.subscribers(), ["bob@example.com"])
+        subscription = ThreadSubscription.objects.get()
+        self.assertEqual(subscription.comment, self.bob)
+        self.assertEqual(subscription.assoc_id, self.bob.assoc_id)
+
+        comment = self.add("alice")
+        for i in range(5):
+            self.root.add_child(comment="more", user_name="eve",
+                                user_email="eve@example.com")
+        with self.assertNumQueries(1):
+            followers = list(get_followers(comment))
+        self.assertEqual([f.comment for f in followers], [self.bob])
+
+    def test_hidden_comment_keeps_subscription(self):
+        self.bob.is_public = False
+        self.bob.save()
+        comment = self.add("alice")
+        self.assertEqual([f.user_email for f in get_followers(comment)],
+                         ["bob@example.com"])
+
+    def test_deleted_comment_moves_subscription(self):
+        self.bob.delete()
+        subscription = ThreadSubscription.objects.get()
+        self.assertEqual(subscription.comment.user_email, "bob@example.com")
+        subscription.comment.delete()
+        self.assertEqual(self.subscribers(), [])
+
+    def test_deleted_comment_skips_comments_without_followup(self):
+        self.add("carol", followup=False)
+        carol = self.add("carol")
+        self.add("carol", followup=False)
+        carol.delete()
+        self.assertEqual(self.subscribers(), ["bob@example.com"])
+
+    def test_saving_again_does_not_subscribe(self):
+        comment = TreeComment.objects.get(pk=self.bob.pk)
+        with self.assertNumQueries(1):
+            comment.save()
+
+    def test_mute_unsubscribes(self):
+        ThreadSubscription.unsubscribe(self.bob.assoc_id, "bob@example.com")
+        self.assertEqual(self.subscribers(), [])
+        self.assertFalse(TreeComment.objects.filter(
+            user_email="bob@example.com", followup=True).exists())
+
+    def test_approval_subscribes(self):
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_user("joe", "joe@example.com")
+        perform_bulk_approve(request,
+                             TreeComment.objects.filter(user_name="dave"))
+        self.assertEqual(self.subscribers(),
+                         ["bob@example.com", "dave@example.com"])
+
+    def test_migration_backfills_subscriptions(self):
+        ThreadSubscription.objects.all().delete()
+        migration = import_module(
+            'django_comments_tree.migrations.0013_thread_subscriptions')
+        migration.subscribe_followers(apps, None)
+        subscription = ThreadSubscription.objects.get()
+        self.assertEqual(subscription.user_email, "bob@example.com")
+        # Followers are subscribed through their first comment.
+        self.assertEqual(subscription.comment, self.bob)
@@ -1,13 +1,14 @@
 import math
 from typing import List
-from unittest import skip
+from unittest import skip, skipUnless
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
+from django.db import connection
 from django.test import TestCase as DjangoTestCase, override_settings
 from django.utils import timezone
 
-from django_comments_tree.models import (TreeComment)
+from django_comments_tree.models import TreeComment, TreeCommentFlag
 from django_comments_tree.tests.models import Article
 
 utime = lambda d: timezone.now() - timezone.timedelta(days=d)
@@ -176,6 +177,33 @@ class TestTreeCommentQueries(ArticleBaseTestCase):
         self.assertEqual(len(tree[0]['children'][1]['children']), 1,
                          "Expected 1 reply to second comment reply")
 
+    def test_tree_is_loaded_with_one_query(self):
+        self.root_1.refresh_from_db()
+        with self.assertNumQueries(1):
+            tree = TreeComment.tree_from_comment(self.root_1)
+        self.assertEqual([e['comment'].comment.raw for e in tree],
+                         ['Comment 1', 'Comment 2'])
+        self.assertEqual(
+            [e['comment'].comment.raw for e in tree[1]['children']],
+            ['Comment 2, Reply 1', 'Comment 2, Reply 2'])
+
+    def test_max_depth(self):
+        self.root_1.refresh_from_db()
+        tree = TreeComment.tree_from_comment(self.root_1, max_depth=1)
+        self.assertEqual(len(tree), 2)
+        self.assertTrue(all(e['children'] == [] for e in tree))
+
+        tree = TreeComment.tree_from_comment(self.root_1, max_depth=2)
+        self.assertEqual(len(tree[0]['children']), 2)
+        self.assertEqual(len(tree[0]['children'][1]['children']), 0)
+
+    def test_filtered_parent_hides_replies(self):
+        # Both top level comments were updated more than 1.55 days ago.
+        # Some replies are newer, but they go away with their parents.
+        self.root_1.refresh_from_db()
+        tree = TreeComment.tree_from_comment(self.root_1, start=utime(1.55))
+        self.assertEqual(tree, [])
+
     @skip('Not ready yet')
     def test_filter_old_messages(self):
         # there is no comment posted yet to article_1 nor article_2
@@ -253,3 +281,42 @@ class TestTreeCommentPerformance(ArticleBaseTestCase):
                           if n.depth == 1]
         self.assertEqual(n_children, len(child_comments),
                          "Expected tree to have matching children")
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans of SQLite")
+class TestQueryPlans(ArticleBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.comment = TreeComment.objects.create_for_object(
+            self.article_1, comment="A comment")
+        self.assoc_id = self.comment.assoc_id
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.plan(queryset)
+        self.assertIn(index, plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_public_comments_by_date(self):
+        qs = TreeComment.objects.filter(assoc_id=self.assoc_id, is_public=True)
+        self.assertUsesIndex(qs.order_by('submit_date'),
+                             'treecomment_assoc_public_idx')
+
+    def test_comments_in_thread_order(self):
+        qs = TreeComment.objects.filter(assoc_id=self.assoc_id)
+        self.assertUsesIndex(qs.order_by('path'), 'treecomment_assoc_path_idx')
+
+    def test_moderation_queue(self):
+        self.assertUsesIndex(
+            TreeComment.objects.in_moderation().order_by('submit_date'),
+            'treecomment_moderation_idx')
+
+    def test_flags_of_comment(self):
+        qs = TreeCommentFlag.objects.filter(
+            comment=self.comment, flag=TreeCommentFlag.SUGGEST_REMOVAL)
+        self.assertUsesIndex(qs, 'treecommentflag_comment_idx')
@@ -0,0 +1,89 @@
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from django_comments_tree import signed
+from django_comments_tree.conf import settings
+from django_comments_tree.models import TmpTreeComment, TreeComment
+from django_comments_tree.tests.models import Article
+
+
+class SignedTokenTestCase(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="October", slug="october", body="What I did on October...")
+        self.user = User.objects.create_user("bob", "bob@example.com", "pwd")
+        self.tmp_comment = TmpTreeComment(
+            content_type=ContentType.objects.get_for_model(self.article),
+            object_id=str(self.article.pk), content_object=self.article,
+            site_id=1, user_name="Bob", user_email="bob@example.com",
+            user_url="", comment="Es war einmal...", user=self.user,
+            submit_date=timezone.now(), is_public=True, is_removed=False,
+            followup=True, ip_address="127.0.0.1")
+
+    def test_tmp_comment_round_trip_without_queries(self):
+        key = signed.dumps(self.tmp_comment, compress=True, extra_key=b"salt")
+        self.assertTrue(key.startswith(signed.VERSION_PREFIX))
+        with self.assertNumQueries(0):
+            comment = signed.loads(key.decode('utf-8'), extra_key=b"salt")
+        self.assertIsInstance(comment, TmpTreeComment)
+        for name in ['object_id', 'site_id', 'user_name', 'comment',
+                     'submit_date', 'followup', 'ip_address']:
+            self.assertEqual(comment[name], self.tmp_comment[name])
+        with self.assertNumQueries(2):
+            self.assertEqual(comment.content_object, self.article)
+            self.assertEqual(comment.user, self.user)
+
+    def test_token_is_shorter_than_version_1(self):
+        key = signed.dumps(self.tmp_comment, compress=True)
+        self.assertLess(len(key),
+                        len(signed.dumps_v1(self.tmp_comment, compress=True)))
+
+    def test_version_1_tokens_still_decode(self):
+        key = signed.dumps_v1(self.tmp_comment, compress=True)
+        comment = signed.loads(key)
+        self.assertEqual(comment['user_email'], "bob@example.com")
+        self.assertEqual(comment['content_object'], self.article)
+
+    def test_tree_comment_is_loaded_lazily(self):
+        root = TreeComment.objects.get_or_create_root(self.article)
+        tree_comment = root.add_child(comment="hi", followup=True)
+        key = signed.dumps(tree_comment)
+        with self.assertNumQueries(0):
+            comment = signed.loads(key)
+        self.assertEqual(comment.pk, tree_comment.pk)
+
+    def test_tampered_tokens_are_rejected(self):
+        key = signed.dumps({"a": 1})
+        self.assertEqual(signed.loads(key), {"a": 1})
+        with self.assertRaises(signed.BadSignature):
+            signed.loads(key[:-1] + (b'A' if key[-1:] != b'A' else b'B'))
+        with self.assertRaises(signed.BadSignature):
+            signed.loads(key, extra_key=b"other")
+
+    def test_max_age(self):
+        key = signed.dumps("hello")
+        self.assertEqual(signed.loads(key, max_age=60), "hello")
+        with patch('django_comments_tree.signed.time.time',
+                   return_value=signed.time.time() + 120):
+            with self.assertRaises(signed.SignatureExpired):
+                signed.loads(key, max_age=60)
+
+    def test_stale_content_type_is_rejected(self):
+        key = signed.dumps(self.tmp_comment,
+                           extra_key=settings.COMMENTS_TREE_SALT)
+        ContentType.objects.filter(model='article').update(model='story')
+        ContentType.objects.clear_cache()
+        self.addCleanup(ContentType.objects.clear_cache)
+        with self.assertRaises(signed.BadSignature):
+            signed.loads(key, extra_key=settings.COMMENTS_TREE_SALT)
+        response = self.client.get(reverse('comments-tree-confirm',
+                                           args=[key.decode('utf-8')]))
+        self.assertEqual(response.status_code, 404)
@@ -5,8 +5,10 @@ except ImportError:
 import unittest
 
 from django.contrib.auth.models import AnonymousUser
+from django.db import connection
 from django.template import Context, Template, TemplateSyntaxError
 from django.test import TestCase as DjangoTestCase
+from django.test.utils import CaptureQueriesContext
 
 from django_comments_tree.tests.models import Article, Diary
 from django_comments_tree.tests.test_models import (
@@ -55,6 +57,24 @@ class GetCommentCountTestCase(DjangoTestCase):
         thread_test_step_3(self.article_1)
         self.assertEqual(Template(t).render(Context({'article': self.article_1})), '5')
 
+    def test_get_comment_counts(self):
+        thread_test_step_1(self.article_1)
+        thread_test_step_2(self.article_1)
+        add_comment_to_diary_entry(self.day_in_diary)
+        t = Template("{% load comments_tree %}"
+                     "{% get_comment_counts for object_list as counts %}"
+                     "{% for obj in object_list %}"
+                     "{{ counts|comment_count_for:obj }},{% endfor %}")
+        object_list = [self.article_1, self.article_2, self.day_in_diary]
+        # One query per model.
+        with self.assertNumQueries(2):
+            self.assertEqual(t.render(Context({'object_list': object_list})),
+                             '4,0,1,')
+        self.assertEqual(t.render(Context({'object_list': []})), '')
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{% load comments_tree %}"
+                     "{% get_comment_counts object_list as counts %}")
+
 class LastCommentsTestCase(DjangoTestCase):
     def setUp(self):
         self.article = Article.objects.create(
@@ -127,3 +147,38 @@ class CommentsTestCase(DjangoTestCase):
             p2 = pos_list[x+1]
             self.assertTrue(p1 < p2)
 
+    def test_render_comment_tree_queries_do_not_grow(self):
+        t = Template("{% load comments_tree %}"
+                     "{% render_treecomment_tree for object %}")
+        context = {'object': self.article, 'user': AnonymousUser()}
+        with CaptureQueriesContext(connection) as queries:
+            t.render(Context(context))
+        comment = TreeComment.objects.get(pk=9)
+        for i in range(5):
+            comment.refresh_from_db()
+            comment.add_child(comment="reply %d to comment 9" % i)
+        with self.assertNumQueries(len(queries)):
+            output = t.render(Context(context))
+        self.assertEqual(output.count('<a name='), 14)
+
+    def test_render_comment_tree_with_limit(self):
+        t = ("{% load comments_tree %}"
+             "{% render_treecomment_tree for object limit 1 replies 1 %}")
+        output = Template(t).render(Context({'object': self.article,
+                                             'user': AnonymousUser()}))
+        # Comment 2, its first reply 4, and no replies to 4.
+        self.assertEqual(output.count('<a name='), 2)
+        self.assertIn('<a name="c4"></a>', output)
+        self.assertIn('/comments/api/comment/2/replies/?after=4', output)
+        self.assertIn('1 more reply', output)
+        root = TreeComment.objects.get_root(self.article)
+        self.assertIn('/comments/api/comment/%d/replies/?after=2' % root.pk,
+                      output)
+        self.assertIn('1 more comment', output)
+
+    def test_limit_requires_a_number(self):
+        t = ("{% load comments_tree %}"
+             "{% render_treecomment_tree for object limit many %}")
+        with self.assertRaises(TemplateSyntaxError):
+            Template(t)
+
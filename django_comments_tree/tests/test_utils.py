@@ -0,0 +1,97 @@
+import threading
+import time
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.core import mail
+from django.test import TestCase
+
+from django_comments_tree.utils import MailPool
+
+
+def send(pool, to="bob@example.com"):
+    return pool.submit("subject", "body", "from@example.com", [to])
+
+
+class MailPoolTestCase(TestCase):
+    def setUp(self):
+        self.busy = threading.Event()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def blocking_pool(self, policy):
+        """ Return a pool whose only worker waits on self.release """
+        pool = MailPool(workers=1, queue_size=1, full_policy=policy)
+        self.addCleanup(pool.shutdown, 5)
+        original = pool._send
+
+        def slow_send(args, queued_at):
+            self.busy.set()
+            self.release.wait(5)
+            original(args, queued_at)
+
+        pool._send = slow_send
+        return pool, original
+
+    def test_emails_are_sent_by_workers(self):
+        pool = MailPool(workers=2, queue_size=10)
+        for i in range(5):
+            self.assertTrue(send(pool, "user%d@example.com" % i))
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(len(mail.outbox), 5)
+        stats = pool.stats()
+        self.assertEqual((stats['queued'], stats['sent'], stats['pending']),
+                         (5, 5, 0))
+        self.assertGreaterEqual(stats['latency_max'], stats['latency_avg'])
+        pool.shutdown(5)
+        self.assertEqual(pool._threads, [])
+
+    def test_full_queue_drops_emails(self):
+        pool, _ = self.blocking_pool('drop')
+        send(pool)
+        self.busy.wait(5)  # Taken by the worker.
+        self.assertTrue(send(pool))  # Waits in the queue.
+        self.assertFalse(send(pool))
+        self.assertEqual(pool.stats()['dropped'], 1)
+        self.release.set()
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_full_queue_sends_synchronously(self):
+        pool, original = self.blocking_pool('sync')
+        send(pool)
+        self.busy.wait(5)
+        send(pool)
+        with patch.object(pool, '_send', original):
+            send(pool)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(pool.stats()['sent_sync'], 1)
+        self.assertFalse(pool.flush(0.01))
+
+    def test_failures_are_counted(self):
+        pool = MailPool(workers=1)
+        with patch('django_comments_tree.utils._send_mail',
+                   side_effect=OSError):
+            send(pool)
+            self.assertTrue(pool.flush(5))
+        self.assertEqual(pool.stats()['failed'], 1)
+        pool.shutdown(5)
+
+    def test_shutdown_with_full_queue_keeps_its_timeout(self):
+        pool, _ = self.blocking_pool('block')
+        send(pool)
+        self.busy.wait(5)  # Taken by the worker.
+        send(pool)  # Fills the queue.
+        started = time.monotonic()
+        self.assertFalse(pool.shutdown(0.2))
+        self.assertLess(time.monotonic() - started, 2)
+        self.release.set()
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            MailPool(full_policy='retry')
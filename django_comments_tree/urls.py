@@ -27,16 +27,30 @@ urlpatterns = [
     # API handlers.
     url(r'^api/comment/$', api.CommentCreate.as_view(),
         name='comments-tree-api-create'),
+    url(r'^api/(?P<content_type>\w+[-]{1}\w+)/counts/$',
+        api.CommentCounts.as_view(), name='comments-tree-api-counts'),
     url(r'^api/(?P<content_type>\w+[-]{1}\w+)/(?P<object_pk>[-\w]+)/$',
         api.CommentList.as_view(), name='comments-tree-api-list'),
     url(r'^api/(?P<content_type>\w+[-]{1}\w+)/(?P<object_pk>[-\w]+)/count/$',
         api.CommentCount.as_view(), name='comments-tree-api-count'),
+    url(r'^api/(?P<content_type>\w+[-]{1}\w+)/(?P<object_pk>[-\w]+)/tree/$',
+        api.CommentTree.as_view(), name='comments-tree-api-tree'),
+    url(r'^api/(?P<content_type>\w+[-]{1}\w+)/(?P<object_pk>[-\w]+)/changes/$',
+        api.CommentChanges.as_view(), name='comments-tree-api-changes'),
+    url(r'^api/(?P<content_type>\w+[-]{1}\w+)/(?P<object_pk>[-\w]+)/events/$',
+        api.CommentEvents.as_view(), name='comments-tree-api-events'),
+    url(r'^api/comment/(?P<pk>\d+)/replies/$', api.CommentReplies.as_view(),
+        name='comments-tree-api-replies'),
     url(r'^api/feedback/$', api.ToggleFeedbackFlag.as_view(),
         name='comments-tree-api-feedback'),
     url(r'^api/flag/$', api.CreateReportFlag.as_view(),
         name='comments-tree-api-flag'),
     url(r'^api/flag/(?P<pk>\d+)/$', api.RemoveReportFlag.as_view(),
         name='comments-tree-api-remove-flag'),
+    url(r'^api/moderate/$', api.BulkModeration.as_view(),
+        name='comments-tree-api-moderate'),
+    url(r'^api/export/$', api.CommentExport.as_view(),
+        name='comments-tree-api-export'),
 ]
 
 # Migrated from original django-contrib-comments
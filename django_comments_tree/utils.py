@@ -1,33 +1,16 @@
-# Idea borrowed from Selwin Ong post:
-# http://ui.co.id/blog/asynchronous-send_mail-in-django
-
-import queue as queue  # python3
-
+import atexit
+import hashlib
+import logging
+import queue
 import threading
+import time
 
 from django.core.mail import EmailMultiAlternatives
 
 from django_comments_tree.conf import settings
 
 
-mail_sent_queue = queue.Queue()
-
-
-class EmailThread(threading.Thread):
-    def __init__(self, subject, body, from_email, recipient_list,
-                 fail_silently, html):
-        self.subject = subject
-        self.body = body
-        self.recipient_list = recipient_list
-        self.from_email = from_email
-        self.fail_silently = fail_silently
-        self.html = html
-        threading.Thread.__init__(self)
-
-    def run(self):
-        _send_mail(self.subject, self.body, self.from_email,
-                   self.recipient_list, self.fail_silently, self.html)
-        mail_sent_queue.put(True)
+logger = logging.getLogger(__name__)
 
 
 def _send_mail(subject, body, from_email, recipient_list,
@@ -38,27 +21,197 @@ def _send_mail(subject, body, from_email, recipient_list,
     msg.send(fail_silently)
 
 
+class MailPool:
+    """
+    Fixed number of threads sending the emails put in a bounded queue.
+
+    When the queue is full, the `full_policy` decides what happens to new
+    emails: 'block' waits for room in the queue, 'drop' discards them and
+    'sync' sends them in the calling thread.
+    """
+    POLICIES = ('block', 'drop', 'sync')
+
+    def __init__(self, workers=2, queue_size=1000, full_policy='block'):
+        if full_policy not in self.POLICIES:
+            raise ValueError("Unknown mail queue policy %r." % full_policy)
+        self.workers = workers
+        self.full_policy = full_policy
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {'queued': 0, 'sent': 0, 'failed': 0, 'dropped': 0,
+                       'sent_sync': 0, 'latency_total': 0.0,
+                       'latency_max': 0.0}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, daemon=True,
+                    name="comments-tree-mail-%d" % i)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                queued_at, args = item
+                self._send(args, queued_at)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, args, queued_at):
+        try:
+            _send_mail(*args)
+        except Exception:
+            self._count('failed')
+            logger.exception("Error sending comments email to %s.", args[3])
+            return
+        latency = time.monotonic() - queued_at
+        with self._lock:
+            self._stats['sent'] += 1
+            self._stats['latency_total'] += latency
+            self._stats['latency_max'] = max(self._stats['latency_max'],
+                                             latency)
+
+    def submit(self, subject, body, from_email, recipient_list,
+               fail_silently=False, html=None):
+        """ Queue an email, return False if it was dropped """
+        args = (subject, body, from_email, recipient_list, fail_silently, html)
+        self._start()
+        item = (time.monotonic(), args)
+        try:
+            self._queue.put(item, block=self.full_policy == 'block')
+        except queue.Full:
+            if self.full_policy == 'drop':
+                self._count('dropped')
+                logger.warning("Comments mail queue full, email to %s "
+                               "dropped.", recipient_list)
+                return False
+            self._count('sent_sync')
+            self._send(args, item[0])
+            return True
+        self._count('queued')
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until the queued emails are sent, or timeout seconds pass.
+        Return True if the queue was emptied.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=None):
+        """
+        Send the queued emails and stop the worker threads, waiting up to
+        timeout seconds in all. Return True if the queue was emptied.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            try:
+                # With a full queue the workers are left to exit with the
+                # process, as they are daemon threads.
+                self._queue.put(None, timeout=remaining)
+            except queue.Full:
+                break
+        remaining = None
+        if deadline is not None:
+            remaining = max(0, deadline - time.monotonic())
+        return self.flush(remaining)
+
+    def stats(self):
+        """
+        Return the number of emails queued, sent (by the workers or, with
+        the 'sync' policy, by callers), failed and dropped, the number
+        waiting in the queue, and the average and maximum latency between
+        queueing and sending, in seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        latency_total = stats.pop('latency_total')
+        stats['pending'] = self._queue.qsize()
+        stats['latency_avg'] = (latency_total / stats['sent']
+                                if stats['sent'] else 0.0)
+        return stats
+
+
+_mail_pool = None
+_mail_pool_lock = threading.Lock()
+
+
+def get_mail_pool():
+    """ Return the pool used by send_mail, created on first use """
+    global _mail_pool
+    with _mail_pool_lock:
+        if _mail_pool is None:
+            _mail_pool = MailPool(settings.COMMENTS_TREE_MAIL_WORKERS,
+                                  settings.COMMENTS_TREE_MAIL_QUEUE_SIZE,
+                                  settings.COMMENTS_TREE_MAIL_QUEUE_FULL)
+            atexit.register(_mail_pool.shutdown,
+                            settings.COMMENTS_TREE_MAIL_SHUTDOWN_TIMEOUT)
+        return _mail_pool
+
+
 def send_mail(subject, body, from_email, recipient_list,
               fail_silently=False, html=None):
     if settings.COMMENTS_TREE_THREADED_EMAILS:
-        EmailThread(subject, body, from_email, recipient_list,
-                    fail_silently, html).start()
+        get_mail_pool().submit(subject, body, from_email, recipient_list,
+                               fail_silently, html)
     else:
         _send_mail(subject, body, from_email, recipient_list,
                    fail_silently, html)
 
 
+def content_fingerprint(content_type_id, object_id, site_id, user_name,
+                        user_email, body):
+    """
+    Return the hex SHA-256 of the commented object, the author and the body
+    of a comment, ignoring differences in whitespace and email case.
+    """
+    parts = [str(content_type_id), str(object_id), str(site_id),
+             user_name or '', (user_email or '').lower(),
+             ' '.join((body or '').split())]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
 def has_app_model_option(comment):
+    # content_type = ContentType.objects.get_for_model(comment.content_object)
+    return get_app_model_options(comment.content_type)
+
+
+def get_app_model_options(content_type):
+    """
+    Return the COMMENTS_TREE_APP_MODEL_OPTIONS entry for the given content
+    type, or the default entry. Missing flags are False.
+    """
     _default = {
         'allow_flagging': False,
         'allow_feedback': False,
         'show_feedback': False
     }
-    # content_type = ContentType.objects.get_for_model(comment.content_object)
-    content_type = comment.content_type
     key = "%s.%s" % (content_type.app_label, content_type.model)
-    try:
-        return settings.COMMENTS_TREE_APP_MODEL_OPTIONS[key]
-    except KeyError:
-        return settings.COMMENTS_TREE_APP_MODEL_OPTIONS.setdefault(
-            'default', _default)
+    options = settings.COMMENTS_TREE_APP_MODEL_OPTIONS
+    return dict(_default, **options.get(key, options.get('default', {})))
@@ -1,6 +1,5 @@
 from __future__ import unicode_literals
 
-import six
 from django import http
 from django.apps import apps
 from django.contrib.auth.decorators import login_required
@@ -20,13 +19,15 @@ from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_POST
 from django.views.generic import ListView, View
 
-from django_comments_tree import (comment_was_posted, get_form,
+from django_comments_tree import (comment_was_posted, events, get_form,
                                   get_model as get_comment_model,
-                                  signals, signed)
+                                  instrumentation, notifications, signals,
+                                  signed)
 from django_comments_tree.conf import settings
 from django_comments_tree.models import (DISLIKEDIT_FLAG, LIKEDIT_FLAG,
                                          MaxThreadLevelExceededException,
-                                         TmpTreeComment, TreeCommentFlag)
+                                         ThreadSubscription, TmpTreeComment,
+                                         TreeCommentFlag)
 from django_comments_tree.utils import has_app_model_option, send_mail
 from django_comments_tree.views.moderation import perform_flag
 from django_comments_tree.views.utils import confirmation_view, next_redirect
@@ -71,14 +72,10 @@ def send_email_confirmation_request(
 
 def _comment_exists(comment):
     """
-    True if exists a TreeComment with same user_name, user_email and submit_date.
+    True if the comment is already stored, or a duplicate of it was posted
+    within COMMENTS_TREE_DUPLICATE_WINDOW.
     """
-    return (TreeComment.objects.filter(
-        user_name=comment.user_name,
-        user_email=comment.user_email,
-        followup=comment.followup,
-        submit_date=comment.submit_date
-    ).count() > 0)
+    return TreeComment.objects.find_duplicate(comment) is not None
 
 
 def _create_comment(tmp_comment):
@@ -191,54 +188,23 @@ def confirm(request, key,
         return render(request, get_moderated_tmpl(comment),
                       {'comment': comment})
     else:
+        events.publish_comment_event(events.POSTED, comment)
         notify_comment_followers(comment)
         return redirect(comment)
 
 
+@instrumentation.instrumented('notify_followers')
 def notify_comment_followers(comment):
     """
-    Updated to use MP_Nodes
-    :param comment:
-    :return:
+    Email the followers of the thread of the comment, or queue the
+    notification when COMMENTS_TREE_FOLLOWUP_OUTBOX is enabled.
     """
-    root = comment.get_root()
-
-    followers = {}
-    kwargs = {'is_public': True,
-              'followup': True}
-    previous_comments = root.get_descendants()
-
-    previous_comments = previous_comments.filter(**kwargs)
-    previous_comments = previous_comments.exclude(user_email=comment.user_email)
-
-    for instance in previous_comments:
-        followers[instance.user_email] = (
-            instance.user_name,
-            signed.dumps(instance, compress=True,
-                         extra_key=settings.COMMENTS_TREE_SALT))
-
-    # model = apps.get_model(comment.content_type.app_label,
-    #                        comment.content_type.model)
-    # target = model._default_manager.get(pk=comment.object_id)
-    subject = _("new comment posted")
-    text_message_template = loader.get_template(
-        "django_comments_tree/email_followup_comment.txt")
-    if settings.COMMENTS_TREE_SEND_HTML_EMAIL:
-        html_message_template = loader.get_template(
-            "django_comments_tree/email_followup_comment.html")
-
-    for email, (name, key) in six.iteritems(followers):
-        mute_url = reverse('comments-tree-mute', args=[key.decode('utf-8')])
-        message_context = {'user_name': name,
-                           'comment': comment,
-                           # 'content_object': target,
-                           'mute_url': mute_url,
-                           'site': comment.site}
-        text_message = text_message_template.render(message_context)
-        if settings.COMMENTS_TREE_SEND_HTML_EMAIL:
-            html_message = html_message_template.render(message_context)
-        else:
-            html_message = None
+    if settings.COMMENTS_TREE_FOLLOWUP_OUTBOX:
+        notifications.queue_followup_notification(comment)
+        return
+
+    for email, subject, text_message, html_message in \
+            notifications.followup_messages(comment):
         send_mail(subject, text_message, settings.COMMENTS_TREE_FROM_EMAIL,
                   [email, ], html=html_message)
 
@@ -274,8 +240,11 @@ def mute(request, key):
                                extra_key=settings.COMMENTS_TREE_SALT)
     except (ValueError, signed.BadSignature):
         raise Http404
-    # the comment does exist if the URL was already confirmed, then: Http404
-    if not comment.followup or not _comment_exists(comment):
+    # The comment is loaded here, when the token is a version 2 one.
+    try:
+        if not comment.followup or not _comment_exists(comment):
+            raise Http404
+    except ObjectDoesNotExist:
         raise Http404
 
     # Send signal that the comment thread has been muted
@@ -283,11 +252,7 @@ def mute(request, key):
                                       comment=comment,
                                       request=request)
 
-    unmuted = comment.get_root().get_descendants().filter(
-        is_public=True,
-        followup=True,
-        user_email=comment.user_email)
-    unmuted.update(followup=False)
+    ThreadSubscription.unsubscribe(comment.assoc_id, comment.user_email)
 
     model = apps.get_model(comment.content_type.app_label,
                            comment.content_type.model)
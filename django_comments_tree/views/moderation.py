@@ -2,13 +2,17 @@ from __future__ import absolute_import
 
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
+from django.db.models import F, Q
 from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_protect
 
-from django_comments_tree import signals
+from django_comments_tree import instrumentation, signals
 from django_comments_tree import get_model
 from django_comments_tree.views.utils import next_redirect, confirmation_view
-from django_comments_tree.models import TreeCommentFlag
+from django_comments_tree.models import (CommentAssociation, TreeCommentFlag,
+                                         feedback_counter_for)
 
 
 @csrf_protect
@@ -96,6 +100,7 @@ def approve(request, comment_id, next=None):
 # actions. They've been broken out into separate functions to that they
 # may be called from admin actions.
 
+@instrumentation.instrumented('moderation_flag')
 def perform_flag(request, comment):
     """
     Actually perform the flagging of a comment from a request.
@@ -114,6 +119,7 @@ def perform_flag(request, comment):
     )
 
 
+@instrumentation.instrumented('moderation_delete')
 def perform_delete(request, comment):
     flag, created = TreeCommentFlag.objects.get_or_create(
         comment=comment,
@@ -121,7 +127,9 @@ def perform_delete(request, comment):
         flag=TreeCommentFlag.MODERATOR_DELETION
     )
     comment.is_removed = True
-    comment.save()
+    # Only the moderation field, the feedback counters of the instance may
+    # be stale.
+    comment.save(update_fields=['is_removed'])
     signals.comment_was_flagged.send(
         sender=comment.__class__,
         comment=comment,
@@ -131,6 +139,7 @@ def perform_delete(request, comment):
     )
 
 
+@instrumentation.instrumented('moderation_approve')
 def perform_approve(request, comment):
     flag, created = TreeCommentFlag.objects.get_or_create(
         comment=comment,
@@ -140,7 +149,7 @@ def perform_approve(request, comment):
 
     comment.is_removed = False
     comment.is_public = True
-    comment.save()
+    comment.save(update_fields=['is_removed', 'is_public'])
 
     signals.comment_was_flagged.send(
         sender=comment.__class__,
@@ -150,6 +159,104 @@ def perform_approve(request, comment):
         request=request,
     )
 
+
+# Bulk versions of the actions above, for the admin actions and the web API.
+# They flag each batch of comments with one INSERT, change them with one
+# UPDATE and send comments_were_flagged once per batch, instead of saving
+# and signalling each comment.
+
+BULK_BATCH_SIZE = 500
+
+
+def _unpublish_replies(model, comment_ids, now):
+    """ Unpublish the replies to the given comments with one UPDATE """
+    paths = sorted(model.objects.filter(pk__in=comment_ids)
+                   .values_list('path', flat=True))
+    subtrees = Q()
+    last = None
+    for path in paths:
+        # Replies to replies are already covered by their ancestor.
+        if last is not None and path.startswith(last):
+            continue
+        last = path
+        subtrees |= Q(path__startswith=path,
+                      depth__gt=len(path) // model.steplen)
+    if last is not None:
+        model.objects.filter(subtrees).update(is_public=False, updated_on=now)
+
+
+def _bulk_moderate(request, queryset, flag, batch_size, unpublish_replies=False,
+                   **changes):
+    """
+    Add the `flag` of the user to the comments of the queryset and apply the
+    field `changes` to them, batch_size comments at a time. Return the
+    number of comments.
+    """
+    model = queryset.model
+    user = request.user
+    counter = feedback_counter_for(flag)
+    comment_ids = list(queryset.order_by().values_list('pk', flat=True))
+    for start in range(0, len(comment_ids), batch_size):
+        batch = comment_ids[start:start + batch_size]
+        now = timezone.now()
+        with transaction.atomic():
+            flagged = set(TreeCommentFlag.objects.filter(
+                comment_id__in=batch, user=user, flag=flag,
+            ).values_list('comment_id', flat=True))
+            missing = [pk for pk in batch if pk not in flagged]
+            TreeCommentFlag.objects.bulk_create(
+                [TreeCommentFlag(comment_id=pk, user=user, flag=flag,
+                                 flag_date=now) for pk in missing],
+                ignore_conflicts=True)
+            # A concurrent request may have added some of the missing flags
+            # in the meantime, only the rows stamped here were inserted.
+            created_ids = list(TreeCommentFlag.objects.filter(
+                comment_id__in=missing, user=user, flag=flag, flag_date=now,
+            ).values_list('comment_id', flat=True)) if missing else []
+            if counter and created_ids:
+                model.objects.filter(pk__in=created_ids).update(
+                    **{counter: F(counter) + 1})
+            if changes:
+                model.objects.filter(pk__in=batch).update(updated_on=now,
+                                                          **changes)
+                if unpublish_replies:
+                    _unpublish_replies(model, batch, now)
+                CommentAssociation.rebuild_counters(
+                    CommentAssociation.objects.filter(
+                        pk__in=model.objects.filter(pk__in=batch)
+                        .values('assoc_id')))
+        signals.comments_were_flagged.send(
+            sender=model,
+            comment_ids=batch,
+            flag=flag,
+            created_ids=created_ids,
+            request=request,
+        )
+    return len(comment_ids)
+
+
+@instrumentation.instrumented('moderation_bulk_flag', size=int)
+def perform_bulk_flag(request, queryset, batch_size=BULK_BATCH_SIZE):
+    """ Suggest the removal of the comments of the queryset """
+    return _bulk_moderate(request, queryset, TreeCommentFlag.SUGGEST_REMOVAL,
+                          batch_size)
+
+
+@instrumentation.instrumented('moderation_bulk_delete', size=int)
+def perform_bulk_delete(request, queryset, batch_size=BULK_BATCH_SIZE):
+    """ Remove the comments of the queryset, and unpublish their replies """
+    return _bulk_moderate(request, queryset,
+                          TreeCommentFlag.MODERATOR_DELETION, batch_size,
+                          unpublish_replies=True, is_removed=True)
+
+
+@instrumentation.instrumented('moderation_bulk_approve', size=int)
+def perform_bulk_approve(request, queryset, batch_size=BULK_BATCH_SIZE):
+    """ Make the comments of the queryset public and non-removed """
+    return _bulk_moderate(request, queryset,
+                          TreeCommentFlag.MODERATOR_APPROVAL, batch_size,
+                          is_removed=False, is_public=True)
+
 # Confirmation views.
 
 